@@ -1,16 +1,16 @@
 from datetime import datetime
 from decimal import Decimal
+from enum import Enum
 from typing import Optional
-from pydantic import BaseModel, condecimal
+from pydantic import BaseModel, condecimal, validator
 from sqlalchemy.orm import Session
+import logging
 
 from app.models import Account, Transaction
 from app.kyc import verify_identity
+from app.velocity import DEPOSIT_LIMITS, VELOCITY_LIMITS, VelocityLimitExceeded, check_velocity, window_totals
 
-DEPOSIT_LIMITS = {
-    "ATM": Decimal("10000.00"),  # $10,000 limit for ATM deposits
-    "BRANCH": Decimal("50000.00")  # $50,000 limit for branch deposits
-}
+logger = logging.getLogger(__name__)
 
 class DepositLocationType(str, Enum):
     ATM = "ATM"
@@ -44,12 +44,6 @@ class CashDepositRequest(BaseModel):
             raise ValueError(f"Amount exceeds {location_type.value} deposit limit of ${DEPOSIT_LIMITS[location_type]:,.2f}")
         return v
 
-from enum import Enum
-import logging
-from datetime import datetime, timedelta
-
-logger = logging.getLogger(__name__)
-
 async def process_cash_deposit(
     db: Session,
     user_id: int,
@@ -70,29 +64,31 @@ async def process_cash_deposit(
         ValueError: For validation errors
         Exception: For processing errors
     """
-    # Check for suspicious rapid deposits
-    recent_deposits = db.query(Transaction).filter(
-        Transaction.account_id == user_id,
-        Transaction.transfer_type == "CASH_DEPOSIT",
-        Transaction.timestamp >= datetime.utcnow() - timedelta(hours=24)
-    ).all()
-    
-    total_24h = sum(Decimal(str(tx.amount)) for tx in recent_deposits)
-    if total_24h + deposit_request.amount > Decimal("10000.00"):
-        logger.warning(f"High volume deposits detected for user {user_id}")
-        raise ValueError("Daily deposit limit exceeded. Please visit a branch for assistance.")
-
     # 1. Verify user identity with enhanced logging
-    try:
-        kyc_result = verify_identity(str(user_id), deposit_request.id_verification_type)
-        if kyc_result["status"] != "verified":
-            logger.error(f"KYC verification failed for user {user_id}")
-            raise ValueError("Identity verification failed")
+    kyc_result = verify_identity(str(user_id), deposit_request.id_verification_type)
+    if kyc_result["status"] != "verified":
+        logger.error(f"KYC verification failed for user {user_id}")
+        raise ValueError("Identity verification failed")
 
-    # 2. Get user's account
-    account = db.query(Account).filter(Account.user_id == user_id).first()
+    # 2. Get user's account, locked so concurrent deposits are checked one at a time
+    account = db.query(Account).filter(Account.user_id == user_id).with_for_update().first()
     if not account:
-        raise ValueError("Account not found")    # 3. Create cash deposit transaction with enhanced tracking
+        raise ValueError("Account not found")
+
+    # 3. Velocity limits: 1h/24h/7d totals for this location type in one query
+    totals = window_totals(db, account.id, "CASH_DEPOSIT")
+    try:
+        check_velocity(
+            totals,
+            VELOCITY_LIMITS[deposit_request.location_type],
+            deposit_request.location_type,
+            deposit_request.amount,
+        )
+    except VelocityLimitExceeded as e:
+        logger.warning(f"High volume deposits detected for user {user_id}: {e}")
+        raise ValueError(f"{e}. Please visit a branch for assistance.")
+
+    # 4. Create cash deposit transaction with enhanced tracking
     verification_ref = f"{deposit_request.id_verification_type}:{deposit_request.id_document_number}"
     
     transaction = Transaction(
@@ -109,10 +105,10 @@ async def process_cash_deposit(
         verification_ref=verification_ref
     )
     
-    # 4. Update account balance
+    # 5. Update account balance
     account.balance += Decimal(str(deposit_request.amount))
     
-    # 5. Save changes
+    # 6. Save changes
     db.add(transaction)
     db.commit()
     db.refresh(account)
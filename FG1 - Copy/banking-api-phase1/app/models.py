@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, DateTime, Numeric, ForeignKey, func, Text
+from sqlalchemy import Column, Integer, String, DateTime, Numeric, ForeignKey, func, Text, Index
 from sqlalchemy.ext.declarative import declarative_base
 
 Base = declarative_base()
@@ -35,9 +35,19 @@ class Transaction(Base):
     status = Column(String(20), nullable=False, default="pending")
     teller_id = Column(String(50))  # For cash deposits
     location_id = Column(String(50))  # Branch/ATM location
+    location_type = Column(String(10))  # ATM, BRANCH (cash deposits)
     source_of_funds = Column(String(100))  # For AML compliance
     notes = Column(Text)
     verification_method = Column(String(50))  # ID verification method used
     verification_ref = Column(String(100))  # Reference number of verification
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
+
+    __table_args__ = (
+        # Account timelines: WHERE account_id = ? ORDER BY timestamp DESC
+        Index("ix_transactions_account_timestamp", "account_id", "timestamp"),
+        # Cash deposit velocity (app.velocity.window_totals): SUM(amount) per
+        # location_type WHERE account_id = ? AND transfer_type = ? AND
+        # timestamp >= ?, answered from the index alone
+        Index("ix_transactions_account_type_timestamp", "account_id", "transfer_type", "timestamp", "location_type", "amount"),
+    )
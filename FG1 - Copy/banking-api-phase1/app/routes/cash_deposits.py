@@ -4,7 +4,7 @@ from sqlalchemy.orm import Session
 from datetime import datetime
 
 from app.cash_deposit import CashDepositRequest, process_cash_deposit
-from app.kyc_aml import check_kyc, run_aml_screening
+from app.kyc_aml import check_kyc, run_aml_screening_async
 from app.database import get_db
 from app.auth import get_current_user
 from app.models import Account, Transaction
@@ -21,8 +21,8 @@ async def create_cash_deposit(
     Process a physical cash deposit with required KYC/AML checks
     """
     try:
-        # Run AML screening
-        aml_result = run_aml_screening(current_user["full_name"])
+        # Run AML screening (off the event loop)
+        aml_result = await run_aml_screening_async(current_user["full_name"])
         if aml_result["aml_flag"]:
             raise HTTPException(
                 status_code=status.HTTP_403_FORBIDDEN,
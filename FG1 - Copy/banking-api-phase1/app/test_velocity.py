@@ -0,0 +1,126 @@
+from datetime import datetime, timedelta
+from decimal import Decimal
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import Session
+
+from app.models import Account, Base, Transaction, User
+from app.velocity import (
+    DEPOSIT_LIMITS, VELOCITY_LIMITS, VELOCITY_WINDOWS, VelocityLimitExceeded, check_velocity, window_totals,
+)
+
+NOW = datetime(2025, 6, 1, 12, 0, 0)
+
+def _db():
+    engine = create_engine("sqlite://")
+    Base.metadata.create_all(bind=engine)
+    db = Session(engine)
+    db.add(User(id=1, username="depositor"))
+    db.add(Account(id=1, user_id=1, balance=0))
+    db.add(Account(id=2, user_id=1, balance=0))
+    db.flush()
+    return db
+
+def _deposit(db, amount, ago, location_type="ATM", account_id=1, transfer_type="CASH_DEPOSIT"):
+    db.add(Transaction(account_id=account_id, amount=Decimal(amount), transfer_type=transfer_type,
+                       location_type=location_type, timestamp=NOW - ago))
+
+def _raises(totals, limits, location_type, amount):
+    try:
+        check_velocity(totals, limits, location_type, Decimal(amount))
+    except VelocityLimitExceeded as e:
+        return e.window
+    return None
+
+def run_window_totals_tests():
+    db = _db()
+    _deposit(db, "100.00", timedelta(minutes=10))
+    _deposit(db, "200.00", timedelta(hours=5))
+    _deposit(db, "400.00", timedelta(days=3))
+    _deposit(db, "800.00", timedelta(days=8))  # outside every window
+    _deposit(db, "1000.00", timedelta(minutes=5), location_type="BRANCH")
+    _deposit(db, "50.00", timedelta(minutes=1), location_type=None)
+    _deposit(db, "9999.00", timedelta(minutes=1), account_id=2)  # other account
+    _deposit(db, "9999.00", timedelta(minutes=1), transfer_type="ACH")  # other type
+    db.commit()
+
+    totals = window_totals(db, 1, "CASH_DEPOSIT", now=NOW)
+    assert totals == {
+        "ATM": {"1h": Decimal("100.00"), "24h": Decimal("300.00"), "7d": Decimal("700.00")},
+        "BRANCH": {"1h": Decimal("1000.00"), "24h": Decimal("1000.00"), "7d": Decimal("1000.00")},
+        None: {"1h": Decimal("50.00"), "24h": Decimal("50.00"), "7d": Decimal("50.00")},
+    }
+    # A window starts exactly `length` ago, inclusive
+    assert window_totals(db, 1, "CASH_DEPOSIT", {"5h": timedelta(hours=5)}, now=NOW)["ATM"] == \
+        {"5h": Decimal("300.00")}
+    assert window_totals(db, 2, "WIRE", now=NOW) == {}
+    print("window_totals:", totals)
+
+def run_check_velocity_tests():
+    limits = {"1h": Decimal("500.00"), "24h": Decimal("1000.00")}
+    totals = {
+        "ATM": {"1h": Decimal("300.00"), "24h": Decimal("600.00")},
+        "BRANCH": {"1h": Decimal("450.00"), "24h": Decimal("450.00")},
+        None: {"1h": Decimal("100.00"), "24h": Decimal("100.00")},
+    }
+    # Untyped rows count against every type; reaching a limit exactly is allowed
+    assert _raises(totals, limits, "ATM", "100.00") is None
+    assert _raises(totals, limits, "ATM", "100.01") == "1h"
+    assert _raises(totals, limits, "BRANCH", "0.01") == "1h"
+    assert _raises({"ATM": {"1h": Decimal("0"), "24h": Decimal("950.00")}}, limits, "ATM", "50.01") == "24h"
+    assert _raises({}, limits, "ATM", "500.00") is None
+
+    try:
+        check_velocity(totals, limits, "ATM", Decimal("200.00"))
+    except VelocityLimitExceeded as e:
+        assert (e.window, e.limit, e.total) == ("1h", Decimal("500.00"), Decimal("400.00"))
+        assert str(e) == "1h deposit limit of $500.00 exceeded"
+    else:
+        raise AssertionError("expected VelocityLimitExceeded")
+    print("check_velocity: limit boundaries per window and location type")
+
+def run_velocity_limits_tests():
+    for location_type, limits in VELOCITY_LIMITS.items():
+        assert set(limits) == set(VELOCITY_WINDOWS), location_type
+        assert limits["24h"] == DEPOSIT_LIMITS[location_type]
+        assert limits["1h"] <= limits["24h"] <= limits["7d"], location_type
+
+    # Two $2,500 ATM deposits inside an hour: a third breaks the $5,000 1h limit
+    db = _db()
+    for i in range(2):
+        _deposit(db, "2500.00", timedelta(minutes=10 * i))
+    db.commit()
+    totals = window_totals(db, 1, "CASH_DEPOSIT", now=NOW)
+    assert _raises(totals, VELOCITY_LIMITS["ATM"], "ATM", "2500.00") == "1h"
+    assert _raises(totals, VELOCITY_LIMITS["BRANCH"], "BRANCH", "2500.00") is None
+    print("VELOCITY_LIMITS:", VELOCITY_LIMITS)
+
+def run_query_plan_tests():
+    engine = create_engine("sqlite://")
+    Base.metadata.create_all(bind=engine)
+    db = Session(engine)
+    statements = []
+
+    def capture(conn, cursor, statement, parameters, context, executemany):
+        statements.append((statement, parameters))
+
+    event.listen(engine, "before_cursor_execute", capture)
+    window_totals(db, 1, "CASH_DEPOSIT", now=NOW)
+    event.remove(engine, "before_cursor_execute", capture)
+
+    statement, parameters = statements[-1]
+    with engine.connect() as conn:
+        plan = [row[3] for row in conn.exec_driver_sql("EXPLAIN QUERY PLAN " + statement, parameters)]
+    # One range scan of the covering index: no table reads, no other index
+    assert len([step for step in plan if "transactions" in step]) == 1, plan
+    assert any(step.startswith("SEARCH transactions USING COVERING INDEX ix_transactions_account_type_timestamp")
+               for step in plan), plan
+    print("Query plan:", plan)
+
+def run_tests():
+    run_window_totals_tests()
+    run_check_velocity_tests()
+    run_query_plan_tests()
+    run_velocity_limits_tests()
+
+if __name__ == "__main__":
+    run_tests()
@@ -0,0 +1,100 @@
+from datetime import datetime, timedelta
+from decimal import Decimal
+from typing import Mapping, Optional
+from sqlalchemy import case, func
+from sqlalchemy.orm import Session
+
+from app.models import Transaction
+
+# Rolling windows checked on every deposit, shortest first
+VELOCITY_WINDOWS = {
+    "1h": timedelta(hours=1),
+    "24h": timedelta(hours=24),
+    "7d": timedelta(days=7),
+}
+
+# Single-deposit limit per location type
+DEPOSIT_LIMITS = {
+    "ATM": Decimal("10000.00"),  # $10,000 limit for ATM deposits
+    "BRANCH": Decimal("50000.00")  # $50,000 limit for branch deposits
+}
+
+# Rolling deposit totals per location type and VELOCITY_WINDOWS window.
+# The 24h limit is the per-type DEPOSIT_LIMITS amount.
+VELOCITY_LIMITS = {
+    "ATM": {"1h": Decimal("5000.00"), "24h": DEPOSIT_LIMITS["ATM"], "7d": Decimal("25000.00")},
+    "BRANCH": {"1h": DEPOSIT_LIMITS["BRANCH"], "24h": DEPOSIT_LIMITS["BRANCH"], "7d": Decimal("100000.00")},
+}
+
+class VelocityLimitExceeded(ValueError):
+    def __init__(self, window: str, limit: Decimal, total: Decimal):
+        self.window = window
+        self.limit = limit
+        self.total = total
+        super().__init__(f"{window} deposit limit of ${limit:,.2f} exceeded")
+
+def window_totals(
+    db: Session,
+    account_id: int,
+    transfer_type: str,
+    windows: Mapping[str, timedelta] = VELOCITY_WINDOWS,
+    now: Optional[datetime] = None,
+) -> dict:
+    """
+    Rolling totals for one account, per location type and window, from a
+    single aggregate query:
+
+        SELECT location_type,
+               SUM(CASE WHEN timestamp >= :since_1h THEN amount END), ...
+        FROM transactions
+        WHERE account_id = ? AND transfer_type = ? AND timestamp >= :since_7d
+        GROUP BY location_type
+
+    ix_transactions_account_type_timestamp covers every column used, so
+    this is one index range scan over the longest window and never reads
+    the table or older history.
+
+    Returns:
+        dict: {location_type: {window: Decimal}}; rows recorded without a
+        location type are under None
+    """
+    now = now or datetime.utcnow()
+    since = {name: now - length for name, length in windows.items()}
+    oldest = min(since.values())
+    sums = [
+        func.sum(case((Transaction.timestamp >= since[name], Transaction.amount), else_=0)).label(name)
+        for name in windows
+    ]
+    rows = (
+        db.query(Transaction.location_type, *sums)
+        .filter(
+            Transaction.account_id == account_id,
+            Transaction.transfer_type == transfer_type,
+            Transaction.timestamp >= oldest,
+        )
+        .group_by(Transaction.location_type)
+        .all()
+    )
+    return {
+        row[0]: {name: Decimal(str(row[i + 1] or 0)) for i, name in enumerate(windows)}
+        for row in rows
+    }
+
+def check_velocity(
+    totals: dict,
+    limits: Mapping[str, Decimal],
+    location_type: Optional[str],
+    amount: Decimal,
+):
+    """
+    Raise VelocityLimitExceeded if adding `amount` to the `location_type`
+    totals would exceed any window in `limits` ({window: limit}). Rows with
+    no recorded location type count against every type.
+    """
+    for window, limit in limits.items():
+        total = sum(
+            (totals.get(key, {}).get(window, Decimal("0")) for key in {location_type, None}),
+            Decimal("0"),
+        )
+        if total + amount > limit:
+            raise VelocityLimitExceeded(window, limit, total)
@@ -1,11 +1,16 @@
-from cryptography.fernet import Fernet
-import os
+from app.crypto_service import get_service
 
-key = Fernet.generate_key()  # Replace with env var in prod
-cipher = Fernet(key)
+# Keys come from ENCRYPTION_KEYS or the ENCRYPTION_KEYRING file (see app.crypto_service),
+# so tokens stay readable across restarts and key rotations
 
 def encrypt_data(data: str) -> str:
-    return cipher.encrypt(data.encode()).decode()
+    return get_service().encrypt(data)
 
 def decrypt_data(token: str) -> str:
-    return cipher.decrypt(token.encode()).decode()
+    return get_service().decrypt(token)
+
+def encrypt_many(values: list, workers: int = None) -> list:
+    return get_service().encrypt_many(values, workers=workers)
+
+def decrypt_many(tokens: list, workers: int = None) -> list:
+    return get_service().decrypt_many(tokens, workers=workers)
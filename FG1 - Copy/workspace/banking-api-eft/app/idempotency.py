@@ -0,0 +1,171 @@
+# The same file ships as app/idempotency.py in banking-api-eft and
+# banking-api-phase2, which deploy separately and share no package. Change
+# both copies together, and keep run_idempotency_tests in each app's tests
+# identical.
+import functools
+import hashlib
+import inspect
+import json
+import os
+import secrets
+import sqlite3
+import threading
+import time
+
+IDEMPOTENCY_DB = os.getenv("IDEMPOTENCY_DB", "idempotency.db")
+IDEMPOTENCY_TTL = float(os.getenv("IDEMPOTENCY_TTL", str(24 * 60 * 60)))  # seconds a result is replayed
+IDEMPOTENCY_LOCK_TIMEOUT = float(os.getenv("IDEMPOTENCY_LOCK_TIMEOUT", "30"))  # before a claim can be taken over
+IDEMPOTENCY_WAIT = float(os.getenv("IDEMPOTENCY_WAIT", "5"))  # a duplicate waits this long for the original
+MAX_KEY_LENGTH = 255
+
+class IdempotencyKeyReused(ValueError):
+    """The key was already used with different arguments."""
+
+class RequestInProgress(RuntimeError):
+    """The original request is still running; retry later."""
+
+def request_hash(payload) -> str:
+    return hashlib.sha256(
+        json.dumps(payload, sort_keys=True, separators=(",", ":"), default=str).encode()
+    ).hexdigest()
+
+class IdempotencyStore:
+    """
+    Idempotency keys in one SQLite file shared by every worker on the host.
+
+    The first call with a key claims it with a single UPSERT ... RETURNING
+    (an existing row is only taken over if it has expired, or is a claim
+    older than `lock_timeout` whose caller died). The result is stored as
+    JSON on the row; later calls with the key get it back without running
+    the function again. A duplicate arriving while the original runs
+    polls for up to `wait` seconds, then raises RequestInProgress.
+    Expired rows are purged every `purge_every` claims via the
+    expires_at index.
+
+    The wrapped functions have no database transaction of their own, so
+    the stored result is written after the side effect, not atomically
+    with it.
+    """
+
+    def __init__(self, path: str = IDEMPOTENCY_DB, ttl: float = IDEMPOTENCY_TTL,
+                 lock_timeout: float = IDEMPOTENCY_LOCK_TIMEOUT, wait: float = IDEMPOTENCY_WAIT,
+                 purge_every: int = 1000):
+        self.path = path
+        self.ttl = ttl
+        self.lock_timeout = lock_timeout
+        self.wait = wait
+        self.purge_every = purge_every
+        self._local = threading.local()
+        self._claims = 0
+        conn = self._conn()
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS idempotency_keys ("
+            " scope TEXT NOT NULL, key TEXT NOT NULL, request_hash TEXT NOT NULL, owner TEXT,"
+            " response TEXT, locked_until REAL NOT NULL, expires_at REAL NOT NULL,"
+            " PRIMARY KEY (scope, key)"
+            ") WITHOUT ROWID"
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS ix_idempotency_keys_expires_at ON idempotency_keys (expires_at)")
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = conn
+        return conn
+
+    def run(self, scope: str, key: str, payload, fn):
+        """Return fn()'s result, calling it at most once per (scope, key)."""
+        if not key or len(key) > MAX_KEY_LENGTH:
+            raise ValueError(f"Idempotency key must be 1-{MAX_KEY_LENGTH} characters")
+        digest = request_hash(payload)
+        owner = secrets.token_hex(16)
+        deadline = time.monotonic() + self.wait
+        delay = 0.01
+
+        while not self._claim(scope, key, digest, owner):
+            row = self._conn().execute(
+                "SELECT request_hash, response FROM idempotency_keys WHERE scope = ? AND key = ?", (scope, key)
+            ).fetchone()
+            if row is None:
+                continue  # purged in between; claim again
+            if row[0] != digest:
+                raise IdempotencyKeyReused(f"Idempotency key {key!r} was already used for a different request")
+            if row[1] is not None:
+                return json.loads(row[1])
+            if time.monotonic() >= deadline:
+                raise RequestInProgress(f"A request with idempotency key {key!r} is still being processed")
+            time.sleep(delay)
+            delay = min(delay * 2, 0.2)
+
+        try:
+            result = fn()
+        except BaseException:
+            # Nothing to replay; let the caller retry with the same key
+            self._conn().execute(
+                "DELETE FROM idempotency_keys WHERE scope = ? AND key = ? AND owner = ?", (scope, key, owner)
+            )
+            raise
+        self._conn().execute(
+            "UPDATE idempotency_keys SET owner = NULL, response = ?, expires_at = ? "
+            "WHERE scope = ? AND key = ? AND owner = ?",
+            (json.dumps(result, default=str), time.time() + self.ttl, scope, key, owner),
+        )
+        return result
+
+    def _claim(self, scope: str, key: str, digest: str, owner: str) -> bool:
+        now = time.time()
+        self._claims += 1
+        if self._claims % self.purge_every == 0:
+            self.purge(now)
+        row = self._conn().execute(
+            "INSERT INTO idempotency_keys (scope, key, request_hash, owner, response, locked_until, expires_at) "
+            "VALUES (:scope, :key, :hash, :owner, NULL, :now + :lock, :now + :ttl) "
+            "ON CONFLICT (scope, key) DO UPDATE SET "
+            " request_hash = excluded.request_hash, owner = excluded.owner, response = NULL,"
+            " locked_until = excluded.locked_until, expires_at = excluded.expires_at "
+            "WHERE idempotency_keys.expires_at < :now"
+            " OR (idempotency_keys.response IS NULL AND idempotency_keys.locked_until < :now) "
+            "RETURNING owner",
+            {"scope": scope, "key": key, "hash": digest, "owner": owner, "now": now,
+             "lock": self.lock_timeout, "ttl": self.ttl},
+        ).fetchone()
+        return row is not None and row[0] == owner
+
+    def purge(self, now: float = None) -> int:
+        now = time.time() if now is None else now
+        return self._conn().execute("DELETE FROM idempotency_keys WHERE expires_at < ?", (now,)).rowcount
+
+_store = None
+_store_lock = threading.Lock()
+
+def get_store() -> IdempotencyStore:
+    # One store per process, opened on first use
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = IdempotencyStore()
+    return _store
+
+def idempotent(scope: str, exclude=("db",)):
+    """
+    Give a money-moving function an optional `idempotency_key` keyword.
+    Without it the function runs as before; with it, repeated calls with
+    the same key and arguments return the first call's result. Arguments
+    named in `exclude` (sessions and the like) are not part of the
+    request fingerprint. The result must be JSON-serializable.
+    """
+    def decorator(fn):
+        signature = inspect.signature(fn)
+
+        @functools.wraps(fn)
+        def wrapper(*args, idempotency_key: str = None, **kwargs):
+            if idempotency_key is None:
+                return fn(*args, **kwargs)
+            bound = signature.bind(*args, **kwargs)
+            bound.apply_defaults()
+            payload = {name: value for name, value in bound.arguments.items() if name not in exclude}
+            return get_store().run(scope, idempotency_key, payload, lambda: fn(*args, **kwargs))
+        return wrapper
+    return decorator
@@ -1,10 +1,32 @@
+import os
+import threading
+from app.aml_screening import WatchlistIndex, load_watchlist
+
+# Used when AML_WATCHLIST_PATH is not set
+DEFAULT_WATCHLIST = ["John Doe", "Jane Smith"]
+
+_index = None
+_index_lock = threading.Lock()
+
 def check_kyc(user_id: str):
     # Simulated check
     return {"user_id": user_id, "kyc_status": "verified"}
 
+def get_watchlist() -> WatchlistIndex:
+    # Built once per process, on first use
+    global _index
+    if _index is None:
+        with _index_lock:
+            if _index is None:
+                path = os.getenv("AML_WATCHLIST_PATH")
+                _index = load_watchlist(path) if path else WatchlistIndex().extend(DEFAULT_WATCHLIST)
+    return _index
+
 def run_aml_screening(name: str):
-    # Simulated AML screening
-    flagged_names = ["John Doe", "Jane Smith"]
-    if name in flagged_names:
-        return {"name": name, "aml_flag": True}
-    return {"name": name, "aml_flag": False}
+    return get_watchlist().screen(name)
+
+async def run_aml_screening_async(name: str):
+    return await get_watchlist().screen_async(name)
+
+def run_aml_screening_batch(names, workers: int = None):
+    return get_watchlist().screen_batch(names, workers=workers)
@@ -1,14 +1,78 @@
+import hashlib
+import hmac
 import pyotp
 import os
+import sqlite3
+import threading
+import time
+from functools import lru_cache
+
+# Time steps of clock drift accepted either side of now
+OTP_VALID_WINDOW = int(os.getenv("OTP_VALID_WINDOW", "1"))
+OTP_STEPS_DB = os.getenv("OTP_STEPS_DB", "otp_steps.db")
+
+class OtpStepStore:
+    """
+    The last accepted time step per secret (keyed by its SHA-256), in one
+    SQLite file shared by every worker on the host. claim() is a single
+    guarded UPSERT, so a code is accepted at most once, and never after a
+    later one, across threads, processes and restarts. One row per secret.
+    """
+
+    def __init__(self, path: str = OTP_STEPS_DB):
+        self.path = path
+        self._local = threading.local()
+        self._conn().execute(
+            "CREATE TABLE IF NOT EXISTS otp_steps (secret_hash BLOB PRIMARY KEY, step INTEGER NOT NULL) WITHOUT ROWID"
+        )
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = conn
+        return conn
+
+    def claim(self, secret: str, step: int) -> bool:
+        """Record `step` for `secret` if it is later than the one stored; False if it is not."""
+        row = self._conn().execute(
+            "INSERT INTO otp_steps (secret_hash, step) VALUES (?, ?) "
+            "ON CONFLICT (secret_hash) DO UPDATE SET step = excluded.step WHERE otp_steps.step < excluded.step "
+            "RETURNING step",
+            (hashlib.sha256(secret.encode()).digest(), step),
+        ).fetchone()
+        return row is not None
+
+_store = None
+_store_lock = threading.Lock()
+
+def get_step_store() -> OtpStepStore:
+    # One store per process, opened on first use
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = OtpStepStore()
+    return _store
 
 # Normally store and retrieve per-user secrets securely
 def generate_otp_secret():
     return pyotp.random_base32()
 
+@lru_cache(maxsize=10000)
+def _totp(secret: str) -> pyotp.TOTP:
+    return pyotp.TOTP(secret)
+
 def get_current_otp(secret: str):
-    totp = pyotp.TOTP(secret)
-    return totp.now()
+    return _totp(secret).now()
 
-def verify_otp(secret: str, otp: str) -> bool:
-    totp = pyotp.TOTP(secret)
-    return totp.verify(otp)
+def verify_otp(secret: str, otp: str, valid_window: int = OTP_VALID_WINDOW) -> bool:
+    totp = _totp(secret)
+    otp = str(otp or "").strip()
+    if len(otp) != totp.digits or not otp.isdigit():
+        return False
+    step = int(time.time() // totp.interval)
+    for delta in sorted(range(-valid_window, valid_window + 1), key=abs):
+        if hmac.compare_digest(totp.generate_otp(step + delta), otp):
+            return get_step_store().claim(secret, step + delta)
+    return False
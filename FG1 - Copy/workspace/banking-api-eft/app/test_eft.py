@@ -1,18 +1,217 @@
+import os
+import tempfile
+import time
+from sqlalchemy import create_engine, text
+
+import reencrypt
+from app.crypto_service import KEYS_ENV, CryptoService, KeyRing, count_versions
 from app.transfer import initiate_ach_transfer, initiate_wire_transfer
 from app.mfa import generate_otp_secret, get_current_otp, verify_otp
 from app.kyc_aml import check_kyc, run_aml_screening
 
+def _encrypted_table(url, ring, table, n):
+    engine = create_engine(url)
+    service = CryptoService(ring)
+    with engine.begin() as conn:
+        conn.execute(text(f"CREATE TABLE {table} (id INTEGER PRIMARY KEY, secret TEXT)"))
+        conn.execute(text(f"INSERT INTO {table} (id, secret) VALUES (:id, :secret)"),
+                     [{"id": i, "secret": service.encrypt(f"acct-{i}")} for i in range(n)])
+    return engine
+
+def _decrypt_all(engine, ring, table):
+    service = CryptoService(ring)
+    with engine.connect() as conn:
+        return [service.decrypt(value) for value in conn.execute(text(f"SELECT secret FROM {table} ORDER BY id")).scalars()]
+
+def run_key_rotation_tests():
+    saved_env = os.environ.pop(KEYS_ENV, None)
+    tmp = tempfile.mkdtemp()
+    url = f"sqlite:///{tmp}/rotation.db"
+    try:
+        # File-backed ring: the new key is on disk before rows move to it
+        keyring = os.path.join(tmp, "keyring.json")
+        ring = KeyRing.load(keyring)
+        engine = _encrypted_table(url, ring, "transfers", 50)
+        _encrypted_table(url, ring, "wires", 5)
+        expected = [f"acct-{i}" for i in range(50)]
+
+        assert reencrypt.main(["--database-url", url, "--table", "transfers", "--column", "secret",
+                               "--keyring", keyring]) == 0
+        reloaded = KeyRing.load(keyring)  # as a restarted process would
+        assert reloaded.primary == 2 and _decrypt_all(engine, reloaded, "transfers") == expected
+        print("Rotation round trip:", count_versions(engine, "transfers", "secret", [1, 2]))
+
+        # v1 is still used by wires.secret, so nothing is retired
+        assert reencrypt.main(["--database-url", url, "--table", "transfers", "--column", "secret",
+                               "--keyring", keyring, "--no-rotate", "--retire", "1",
+                               "--check", "wires.secret"]) == 1
+        assert 1 in KeyRing.load(keyring).keys
+        assert reencrypt.main(["--database-url", url, "--table", "wires", "--column", "secret",
+                               "--keyring", keyring, "--no-rotate", "--retire", "1",
+                               "--check", "transfers.secret"]) == 0
+        reloaded = KeyRing.load(keyring)
+        assert sorted(reloaded.keys) == [2] and _decrypt_all(engine, reloaded, "transfers") == expected
+        print("Retired v1 after both columns moved to v2")
+
+        # First use from several processes at once: one creates the ring, the rest read it
+        from concurrent.futures import ThreadPoolExecutor
+        fresh = os.path.join(tmp, "fresh.json")
+        with ThreadPoolExecutor(8) as pool:
+            rings = list(pool.map(lambda _: KeyRing.load(fresh), range(8)))
+        assert len({r.keys[1] for r in rings}) == 1 and rings[0].keys == KeyRing.load(fresh).keys
+        print("Concurrent first use created one key ring")
+
+        # Env-backed ring: rotating would create a key nobody can recover
+        current_key = reloaded.keys[2]
+        os.environ[KEYS_ENV] = f"1:{current_key}"
+        _encrypted_table(url, KeyRing.load(), "cards", 10)
+        try:
+            reencrypt.main(["--database-url", url, "--table", "cards", "--column", "secret"])
+            raise AssertionError("rotation of an ENCRYPTION_KEYS ring was not refused")
+        except SystemExit as exc:
+            assert exc.code == 2
+        assert count_versions(engine, "cards", "secret", [1])[1] == 10
+        from cryptography.fernet import Fernet
+        os.environ[KEYS_ENV] = f"1:{current_key},2:{Fernet.generate_key().decode()}"
+        assert reencrypt.main(["--database-url", url, "--table", "cards", "--column", "secret", "--no-rotate"]) == 0
+        assert _decrypt_all(engine, KeyRing.load(), "cards") == [f"acct-{i}" for i in range(10)]
+        print("Env-backed ring: rotate refused, re-encrypted to the operator's v2")
+    finally:
+        os.environ.pop(KEYS_ENV, None)
+        if saved_env is not None:
+            os.environ[KEYS_ENV] = saved_env
+
+def run_aml_tests():
+    import asyncio
+    import random
+    from app.aml_screening import WatchlistIndex, load_watchlist, normalize, trigrams
+
+    index = WatchlistIndex(0.7).extend([("John Doe", "OFAC"), ("Jane Smith", "PEP"), "Vladimir Ivanovich Petrov"])
+    exact = index.search("DOE, Jóhn")
+    assert exact[0] == {"name": "John Doe", "source": "OFAC", "score": 1.0}
+    fuzzy = index.search("Jon Doe")
+    assert [m["name"] for m in fuzzy] == ["John Doe"] and 0.7 <= fuzzy[0]["score"] < 1
+    assert index.search("Alice Wonderland") == [] and index.search("  ,. ") == []
+    assert index.screen("Jane Smyth")["aml_flag"] and not index.screen("Bob Jones")["aml_flag"]
+
+    names = ["John Doe", "Bob Jones", "Vladimir Petrov", "Jane Smith"] * 30
+    batch = index.screen_batch(names, workers=2, chunk_size=25)
+    assert batch == [index.screen(name) for name in names]
+    assert [r["aml_flag"] for r in batch[:4]] == [True, False, True, True]
+    assert asyncio.run(index.screen_async("Jane Smith"))["matches"][0]["source"] == "PEP"
+
+    tmp = tempfile.mkdtemp()
+    csv_path, txt_path = os.path.join(tmp, "sdn.csv"), os.path.join(tmp, "pep.txt")
+    with open(csv_path, "w", encoding="utf-8") as f:
+        f.write("name,source\nJohn Doe,OFAC\n,OFAC\nJosé Núñez,EU\n")
+    with open(txt_path, "w", encoding="utf-8") as f:
+        f.write("Jane Smith\n\nVladimir Petrov\n")
+    from_csv, from_txt = load_watchlist(csv_path), load_watchlist(txt_path)
+    assert len(from_csv) == 2 and from_csv.search("jose nunez")[0]["source"] == "EU"
+    assert len(from_txt) == 2 and from_txt.search("Petrov Vladimir")[0]["score"] == 1.0
+    assert [r["aml_flag"] for r in from_csv.screen_file(txt_path, workers=1)] == [False, False]
+
+    # Skipping the long posting lists (here the common first names) must
+    # not lose a match that a full scan finds
+    rng = random.Random(7)
+    big = WatchlistIndex(0.6, long_posting=50)
+    for _ in range(5000):
+        surname = "".join(rng.choice("aeiklmnorst") for _ in range(rng.randint(5, 8)))
+        big.add(f"{rng.choice(['John', 'Maria', 'Ahmed', 'Olga', 'Juan'])} {surname}")
+    assert max(len(ids) for ids in big.postings.values()) > 4 * 50
+    key_grams = [trigrams(key) for key in big.keys]
+    for name in rng.sample(big.names, 200):
+        query = name[:-1] + "z"
+        grams = trigrams(normalize(query))
+        brute = sorted(
+            big.names[entry_id] for entry_id, other in enumerate(key_grams)
+            if 2 * len(grams & other) / (len(grams) + len(other)) >= 0.6
+        )
+        assert sorted(m["name"] for m in big.search(query, limit=len(big))) == brute, query
+    print("AML screening: exact, fuzzy, no match, batch, async, file loading, pruned = brute-force")
+
+def run_otp_tests():
+    from app import mfa
+
+    path = os.path.join(tempfile.mkdtemp(), "otp_steps.db")
+    saved_store, mfa._store = mfa._store, mfa.OtpStepStore(path)
+    try:
+        otp_secret = generate_otp_secret()
+        current_otp = get_current_otp(otp_secret)
+        previous_otp = mfa._totp(otp_secret).at(time.time() - 30)
+        print(f"Generated OTP: {current_otp}")
+        assert verify_otp(otp_secret, current_otp)
+        assert not verify_otp(otp_secret, current_otp)  # replay
+        assert not verify_otp(otp_secret, previous_otp)  # older than the accepted code
+        mfa._store = mfa.OtpStepStore(path)  # as a restarted process would
+        assert not verify_otp(otp_secret, current_otp)
+        assert verify_otp(generate_otp_secret(), "12345") is False
+        print("OTP: accepted once, replay and older codes refused, also after a restart")
+    finally:
+        mfa._store = saved_store
+
+def run_idempotency_tests():
+    # Identical in banking-api-eft and banking-api-phase2, like app/idempotency.py itself
+    from app import idempotency
+    from app.idempotency import (IdempotencyKeyReused, IdempotencyStore, RequestInProgress, idempotent,
+                                 request_hash)
+
+    path = os.path.join(tempfile.mkdtemp(), "idempotency.db")
+    saved_store, idempotency._store = idempotency._store, IdempotencyStore(path)
+    calls = []
+
+    @idempotent("test")
+    def pay(to: str, amount: float, db=None):
+        calls.append((to, amount))
+        return {"to": to, "amount": amount, "call": len(calls)}
+
+    try:
+        assert pay("bob", 5.0, idempotency_key="k1") == {"to": "bob", "amount": 5.0, "call": 1}
+        assert pay("bob", 5.0, db=object(), idempotency_key="k1")["call"] == 1  # replayed; db is not fingerprinted
+        assert pay("bob", 5.0)["call"] == 2  # no key, no deduplication
+        for bad in (lambda: pay("bob", 6.0, idempotency_key="k1"), lambda: pay("bob", 5.0, idempotency_key="")):
+            try:
+                bad()
+            except (IdempotencyKeyReused, ValueError):
+                pass
+            else:
+                raise AssertionError("expected the key to be refused")
+        assert len(calls) == 2
+
+        store = IdempotencyStore(path, wait=0)
+        try:
+            store.run("test", "k2", {}, lambda: 1 / 0)
+        except ZeroDivisionError:
+            pass
+        assert store.run("test", "k2", {}, lambda: "retried") == "retried"  # a failure releases the key
+
+        assert store._claim("test", "k3", request_hash({}), "another-worker")
+        try:
+            store.run("test", "k3", {}, lambda: "duplicate")
+        except RequestInProgress:
+            pass
+        else:
+            raise AssertionError("expected RequestInProgress")
+
+        expiring = IdempotencyStore(path, ttl=-1)
+        assert expiring.run("test", "k4", {}, lambda: "first") == "first"
+        assert expiring.run("test", "k4", {}, lambda: "second") == "second"  # expired keys are reusable
+        print("Idempotency: replay, key reuse, failure release, in-progress and expiry")
+    finally:
+        idempotency._store = saved_store
+
 def run_all_tests():
     print(initiate_ach_transfer("user001", "1234567890", 150.00))
     print(initiate_wire_transfer("user002", "DEUTDEFF", "DE89370400440532013000", 500.00))
 
-    otp_secret = generate_otp_secret()
-    current_otp = get_current_otp(otp_secret)
-    print(f"Generated OTP: {current_otp}")
-    print("OTP valid:", verify_otp(otp_secret, current_otp))
+    run_otp_tests()
 
     print(check_kyc("user001"))
     print(run_aml_screening("Jane Smith"))
+    run_aml_tests()
+
+    run_key_rotation_tests()
+    run_idempotency_tests()
 
 if __name__ == "__main__":
     run_all_tests()
@@ -1,5 +1,7 @@
 from app.encryption import encrypt_data, decrypt_data
+from app.idempotency import idempotent
 
+@idempotent("ach")
 def initiate_ach_transfer(user_id: str, to_account: str, amount: float):
     secure_acc = encrypt_data(to_account)
     return {
@@ -10,6 +12,7 @@ def initiate_ach_transfer(user_id: str, to_account: str, amount: float):
         "status": "initiated"
     }
 
+@idempotent("wire")
 def initiate_wire_transfer(user_id: str, swift: str, iban: str, amount: float):
     secure_iban = encrypt_data(iban)
     return {
@@ -0,0 +1,92 @@
+# AML screening benchmark at several watchlist sizes
+#
+# Builds a synthetic watchlist of N names for each size, then times:
+#   - index build
+#   - single-name screening (exact hits, one-letter typos, clean names)
+#   - batch screening of --batch names, serial vs --workers processes
+# The old exact `name in list` check is timed for comparison.
+#
+#   python bench_aml_screening.py --sizes 10000 100000 1000000
+import argparse
+import os
+import random
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from app.aml_screening import WatchlistIndex
+
+CONSONANTS = "bcdfghjklmnprstvwyz"
+VOWELS = "aeiouy"
+
+def synthetic_name(rng):
+    # Consonant-vowel(-consonant) syllables give a few thousand distinct
+    # trigrams, roughly like real name lists
+    def syllable():
+        return rng.choice(CONSONANTS) + rng.choice(VOWELS) + (rng.choice(CONSONANTS) if rng.random() < 0.3 else "")
+
+    def word():
+        return "".join(syllable() for _ in range(rng.randint(2, 3))).capitalize()
+    return " ".join(word() for _ in range(rng.choice((2, 2, 3))))
+
+def typo(rng, name):
+    i = rng.randrange(len(name))
+    return name[:i] + rng.choice("abcdefghijklmnopqrstuvwxyz") + name[i + 1:]
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p))]
+
+def bench_size(size, queries, batch, workers, rng):
+    names = [synthetic_name(rng) for _ in range(size)]
+
+    start = time.perf_counter()
+    index = WatchlistIndex().extend(names)
+    build = time.perf_counter() - start
+    print(f"\n{size:,} names: index built in {build:.1f}s ({len(index.postings):,} trigrams)")
+
+    samples = {
+        "exact": [rng.choice(names) for _ in range(queries)],
+        "typo": [typo(rng, rng.choice(names)) for _ in range(queries)],
+        "clean": [synthetic_name(rng) + " Q" for _ in range(queries)],
+    }
+    for label, sample in samples.items():
+        timings, flagged = [], 0
+        for name in sample:
+            start = time.perf_counter()
+            flagged += index.screen(name)["aml_flag"]
+            timings.append((time.perf_counter() - start) * 1000)
+        print(f"  {label:<6} p50={statistics.median(timings):>7.3f} ms  p99={percentile(timings, 0.99):>7.3f} ms  "
+              f"flagged={flagged}/{len(sample)}")
+
+    start = time.perf_counter()
+    for name in samples["exact"][:100]:
+        name in names
+    print(f"  old list scan (exact only) {(time.perf_counter() - start) / 100 * 1000:>7.3f} ms/name")
+
+    counterparties = [rng.choice(samples["typo"] + samples["clean"]) for _ in range(batch)]
+    start = time.perf_counter()
+    index.screen_batch(counterparties, workers=1)
+    serial = time.perf_counter() - start
+    start = time.perf_counter()
+    index.screen_batch(counterparties, workers=workers)
+    parallel = time.perf_counter() - start
+    print(f"  batch of {batch:,}: serial {batch / serial:>8.0f} names/s, "
+          f"{workers} workers {batch / parallel:>8.0f} names/s")
+
+def main():
+    parser = argparse.ArgumentParser(description="AML screening throughput")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10000, 100000, 1000000])
+    parser.add_argument("--queries", type=int, default=500, help="single-name queries per kind")
+    parser.add_argument("--batch", type=int, default=20000)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    args = parser.parse_args()
+
+    rng = random.Random(42)
+    for size in args.sizes:
+        bench_size(size, args.queries, args.batch, args.workers, rng)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+# Rotate the encryption key and re-encrypt a column in the background
+#
+# Adds a new primary key to the key ring file (unless --no-rotate), then
+# walks the table in primary-key order and re-encrypts every value still
+# under an older key, one short transaction per chunk. Safe to stop and
+# re-run. The new key is saved to the ring before any row is rewritten; a
+# ring from ENCRYPTION_KEYS cannot be rotated here: add the new version to
+# the variable and run with --no-rotate.
+#
+# --retire drops the listed key versions, but only after checking that no
+# value in the migrated column, or in any --check TABLE.COLUMN, is still
+# encrypted under them (or is an unprefixed legacy token).
+#
+#   python reencrypt.py --database-url sqlite:///bank.db --table transfers --column encrypted_account
+#   python reencrypt.py ... --no-rotate --retire 1 --check wires.encrypted_iban
+import argparse
+import sys
+import time
+
+sys.path.append('.')
+
+from sqlalchemy import create_engine
+
+from app.crypto_service import KEYRING_PATH, CryptoService, KeyRing, count_versions, reencrypt_column
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Re-encrypt a column under the newest key")
+    parser.add_argument("--database-url", required=True)
+    parser.add_argument("--table", required=True)
+    parser.add_argument("--column", required=True)
+    parser.add_argument("--pk", default="id")
+    parser.add_argument("--keyring", default=KEYRING_PATH, help="key ring file (unused if ENCRYPTION_KEYS is set)")
+    parser.add_argument("--chunk-size", type=int, default=1000)
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--pause", type=float, default=0, help="seconds to sleep between chunks")
+    parser.add_argument("--no-rotate", action="store_true", help="re-encrypt under the current primary key")
+    parser.add_argument("--retire", type=int, nargs="+", default=[], metavar="VERSION",
+                        help="key versions to drop once nothing is encrypted under them")
+    parser.add_argument("--check", action="append", default=[], metavar="TABLE.COLUMN",
+                        help="another encrypted column that must be clear of the retired versions")
+    args = parser.parse_args(argv)
+
+    ring = KeyRing.load(args.keyring)
+    checks = [(args.table, args.column)]
+    for item in args.check:
+        table, sep, column = item.partition(".")
+        if not sep:
+            parser.error(f"--check expects TABLE.COLUMN, got {item!r}")
+        checks.append((table, column))
+    if args.retire and ring.path is None:
+        parser.error("the key ring comes from ENCRYPTION_KEYS; remove retired keys from the variable instead")
+    if ring.primary in args.retire:
+        parser.error(f"v{ring.primary} is the primary key and cannot be retired")
+    unknown = [f"v{v}" for v in args.retire if v not in ring.keys]
+    if unknown:
+        parser.error(f"no such key in the ring: {', '.join(unknown)}")
+    if not args.no_rotate:
+        try:
+            version = ring.rotate()
+        except ValueError as exc:
+            parser.error(str(exc))
+        print(f"New primary key: v{version}, saved to {ring.path}")
+    service = CryptoService(ring)
+
+    engine = create_engine(args.database_url)
+    start = time.perf_counter()
+    moved = reencrypt_column(engine, args.table, args.column, service, pk=args.pk,
+                             chunk_size=args.chunk_size, workers=args.workers, pause=args.pause)
+    print(f"Re-encrypted {moved} rows in {time.perf_counter() - start:.1f}s")
+
+    if args.retire:
+        still_used = []
+        for table, column in checks:
+            for version, n in count_versions(engine, table, column, args.retire).items():
+                if n:
+                    label = "unprefixed tokens" if version == "legacy" else f"v{version}"
+                    still_used.append(f"{table}.{column}: {n} rows under {label}")
+        if still_used:
+            print("Not retiring any key; still in use:\n  " + "\n  ".join(still_used))
+            return 1
+        for version in sorted(args.retire):
+            ring.retire(version)
+            print(f"Retired key v{version}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
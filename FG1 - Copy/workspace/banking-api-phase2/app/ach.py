@@ -1,8 +1,162 @@
-def initiate_ach_transfer(from_account: str, to_account: str, amount: float):
-    # Simulate ACH transfer
-    return {
+import datetime
+import os
+import uuid
+from collections import defaultdict
+from itertools import groupby
+from typing import Iterator
+from sqlalchemy import select, update
+from sqlalchemy.orm import Session
+
+from app.database import new_session
+from app.idempotency import idempotent
+from app.models import AchTransfer
+from app.nacha import AchBatch, AchBatcher, AchEntry, service_class_for, to_cents
+
+# File header and batch settings for outbound NACHA files (see write_ach_file)
+outbound = AchBatcher(
+    immediate_destination=os.getenv("ACH_IMMEDIATE_DESTINATION", "000000000"),
+    immediate_origin=os.getenv("ACH_IMMEDIATE_ORIGIN", "000000000"),
+    odfi=os.getenv("ACH_ODFI", "00000000"),
+    company_name=os.getenv("ACH_COMPANY_NAME", "BANKING API"),
+    company_id=os.getenv("ACH_COMPANY_ID", "0000000000"),
+    destination_name=os.getenv("ACH_DESTINATION_NAME", ""),
+    origin_name=os.getenv("ACH_ORIGIN_NAME", ""),
+)
+
+@idempotent("ach")
+def initiate_ach_transfer(from_account: str, to_account: str, amount: float, routing_number: str = None,
+                          sec_code: str = "PPD", effective_date=None, name: str = "", db: Session = None):
+    # Simulate ACH transfer; with the receiver's routing number it is also
+    # queued for settlement in ach_transfers
+    result = {
         "from": from_account,
         "to": to_account,
         "amount": amount,
         "status": "initiated"
     }
+    if routing_number:
+        entry = AchEntry(
+            routing_number=routing_number,
+            account_number=to_account,
+            amount_cents=to_cents(amount),
+            name=name,
+            individual_id=from_account,
+            sec_code=sec_code,
+            effective_date=effective_date,
+        )
+        sec_code, effective_date = outbound.batch_key(entry)
+        row = AchTransfer(
+            routing_number=entry.routing_number,
+            account_number=entry.account_number,
+            amount_cents=entry.amount_cents,
+            name=entry.name,
+            individual_id=entry.individual_id,
+            transaction_code=entry.transaction_code,
+            sec_code=sec_code,
+            effective_date=effective_date,
+            status="pending",
+        )
+        session = db if db is not None else new_session()
+        try:
+            session.add(row)
+            session.commit()
+            result["ach_id"] = row.id
+        finally:
+            if db is None:
+                session.close()
+        result["status"] = "queued"
+    return result
+
+def _claimed_batches(db: Session, file_id: str) -> Iterator[AchBatch]:
+    """
+    The transfers claimed for `file_id` as batches, streamed in (SEC code,
+    effective date, id) order so memory does not grow with the file. Each
+    batch's service class comes from a small DISTINCT query up front.
+    """
+    claimed = AchTransfer.file_id == file_id
+    codes = defaultdict(set)
+    for sec_code, effective_date, code in db.execute(
+        select(AchTransfer.sec_code, AchTransfer.effective_date, AchTransfer.transaction_code).where(claimed).distinct()
+    ):
+        codes[(sec_code, effective_date)].add(code)
+    rows = db.execute(
+        select(AchTransfer.routing_number, AchTransfer.account_number, AchTransfer.amount_cents, AchTransfer.name,
+               AchTransfer.individual_id, AchTransfer.transaction_code, AchTransfer.sec_code,
+               AchTransfer.effective_date)
+        .where(claimed)
+        .order_by(AchTransfer.sec_code, AchTransfer.effective_date, AchTransfer.id)
+        .execution_options(yield_per=1000)
+    )
+    for key, group in groupby(rows, key=lambda row: (row.sec_code, row.effective_date)):
+        yield AchBatch(*key, entries=(AchEntry(**row._asdict()) for row in group),
+                       service_class=service_class_for(codes[key]))
+
+def write_ach_file(path: str, db: Session = None) -> int:
+    """
+    Write every pending transfer to a NACHA file at `path` and return the
+    entry count (0, and no file, if nothing is pending).
+
+    The pending rows are claimed with one UPDATE (status 'sending', tagged
+    with a file id) and committed before the file is written, so two
+    writers never put the same entry in two files. The file is written
+    next to `path` and renamed into place; only then are the rows marked
+    'sent'. If writing fails the claim is released and the rows stay
+    pending. Rows a crashed writer left in 'sending' are not retried
+    automatically, since that file may already have gone out: check it,
+    then use requeue_ach_file.
+    """
+    session = db if db is not None else new_session()
+    file_id = uuid.uuid4().hex
+    try:
+        claimed = session.execute(
+            update(AchTransfer)
+            .where(AchTransfer.status == "pending")
+            .values(status="sending", file_id=file_id)
+            .execution_options(synchronize_session=False)
+        ).rowcount
+        session.commit()
+        if not claimed:
+            return 0
+
+        tmp = f"{path}.{file_id}.tmp"
+        try:
+            batches = _claimed_batches(session, file_id)
+            with open(tmp, "w", newline="\n") as f:
+                count = outbound.write(f, batches)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp, path)
+        except BaseException:
+            session.rollback()
+            requeue_ach_file(file_id, session)
+            if os.path.exists(tmp):
+                os.remove(tmp)
+            raise
+
+        session.execute(
+            update(AchTransfer)
+            .where(AchTransfer.file_id == file_id)
+            .values(status="sent", sent_at=datetime.datetime.utcnow())
+            .execution_options(synchronize_session=False)
+        )
+        session.commit()
+        return count
+    finally:
+        if db is None:
+            session.close()
+
+def requeue_ach_file(file_id: str, db: Session = None) -> int:
+    """Put the unsent transfers claimed for `file_id` back in the queue; returns how many."""
+    session = db if db is not None else new_session()
+    try:
+        count = session.execute(
+            update(AchTransfer)
+            .where(AchTransfer.file_id == file_id, AchTransfer.status == "sending")
+            .values(status="pending", file_id=None)
+            .execution_options(synchronize_session=False)
+        ).rowcount
+        session.commit()
+        return count
+    finally:
+        if db is None:
+            session.close()
@@ -0,0 +1,260 @@
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from cryptography.fernet import Fernet, InvalidToken, MultiFernet
+
+# "1:<fernet key>,2:<fernet key>" - the highest version is the primary (encrypting) key
+KEYS_ENV = "ENCRYPTION_KEYS"
+# Used when ENCRYPTION_KEYS is not set; created with a fresh key on first use
+KEYRING_PATH = os.getenv("ENCRYPTION_KEYRING", "keyring.json")
+
+class KeyRing:
+    """
+    Versioned Fernet keys. New data is encrypted with the primary (highest
+    version) key; any key in the ring can decrypt. rotate() adds a new
+    primary and keeps the old keys until re-encryption has moved
+    everything over.
+    """
+
+    def __init__(self, keys: dict, path: str = None):
+        if not keys:
+            raise ValueError("Key ring is empty")
+        self.keys = {int(version): key for version, key in keys.items()}
+        self.path = path
+
+    @property
+    def primary(self) -> int:
+        return max(self.keys)
+
+    @classmethod
+    def load(cls, path: str = KEYRING_PATH) -> "KeyRing":
+        env = os.getenv(KEYS_ENV)
+        if env:
+            pairs = (item.split(":", 1) for item in env.split(",") if item.strip())
+            return cls({version.strip(): key.strip() for version, key in pairs})
+        if os.path.exists(path):
+            return cls(_read_keys(path), path)
+        ring = cls({1: Fernet.generate_key().decode()}, path)
+        try:
+            # O_EXCL: of several processes starting on a fresh host, exactly
+            # one creates v1; the others read the ring it wrote
+            fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+        except FileExistsError:
+            return cls(_read_keys(path), path)
+        with os.fdopen(fd, "w") as f:
+            ring._dump(f)
+        return ring
+
+    def _dump(self, f):
+        json.dump({"primary": self.primary, "keys": {str(v): k for v, k in self.keys.items()}}, f, indent=2)
+        f.flush()
+        os.fsync(f.fileno())
+
+    def save(self):
+        if self.path is None:
+            raise ValueError(f"Key ring comes from {KEYS_ENV}; update the variable instead")
+        tmp = self.path + ".tmp"
+        fd = os.open(tmp, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(fd, "w") as f:
+            self._dump(f)
+        os.replace(tmp, self.path)
+
+    def rotate(self, key: str = None) -> int:
+        """
+        Add a new primary key and save the ring before returning, so nothing
+        is ever encrypted under a key that exists only in memory. A ring
+        from ENCRYPTION_KEYS cannot be saved: add the new version to the
+        variable instead and re-encrypt without rotating.
+        """
+        if self.path is None:
+            raise ValueError(f"Key ring comes from {KEYS_ENV}; add the new key there as "
+                             f"'{self.primary + 1}:<key>' and re-encrypt without rotating")
+        version = self.primary + 1
+        self.keys[version] = key or Fernet.generate_key().decode()
+        try:
+            self.save()
+        except Exception:
+            del self.keys[version]
+            raise
+        return version
+
+    def retire(self, version: int):
+        """Drop a key; check with count_versions() first that nothing still uses it."""
+        if self.path is None:
+            raise ValueError(f"Key ring comes from {KEYS_ENV}; remove the key from the variable instead")
+        if version == self.primary:
+            raise ValueError("Cannot retire the primary key")
+        if version not in self.keys:
+            raise KeyError(f"No key v{version} in the ring")
+        key = self.keys.pop(version)
+        try:
+            self.save()
+        except Exception:
+            self.keys[version] = key
+            raise
+
+def _read_keys(path: str, wait: float = 2.0) -> dict:
+    # A ring created with O_EXCL is visible before its writer has finished
+    # writing it; give that writer a moment rather than fail on partial JSON
+    deadline = time.monotonic() + wait
+    while True:
+        try:
+            with open(path) as f:
+                return json.load(f)["keys"]
+        except ValueError:
+            if time.monotonic() >= deadline:
+                raise
+            time.sleep(0.01)
+
+class CryptoService:
+    """
+    Encrypts strings as "v<version>:<fernet token>". The version prefix
+    selects the key directly instead of trying every key, and lets
+    re-encryption find stale values with a LIKE filter. Unprefixed tokens
+    (written before versioning) are tried against every key, MultiFernet
+    style. Fernet contexts are built once per key and reused.
+    """
+
+    def __init__(self, ring: KeyRing):
+        self.ring = ring
+        self.reload()
+
+    def reload(self):
+        """Rebuild the cipher contexts after the key ring changed."""
+        self.ciphers = {version: Fernet(key) for version, key in self.ring.keys.items()}
+        self.primary = self.ring.primary
+        self.prefix = f"v{self.primary}:"
+        self.legacy = MultiFernet([self.ciphers[v] for v in sorted(self.ciphers, reverse=True)])
+
+    def encrypt(self, value: str) -> str:
+        return self.prefix + self.ciphers[self.primary].encrypt(value.encode()).decode()
+
+    def decrypt(self, token: str) -> str:
+        version, sep, body = token.partition(":")
+        if sep and version.startswith("v") and version[1:].isdigit():
+            cipher = self.ciphers.get(int(version[1:]))
+            if cipher is None:
+                raise InvalidToken(f"Unknown key version {version}")
+            return cipher.decrypt(body.encode()).decode()
+        return self.legacy.decrypt(token.encode()).decode()
+
+    def needs_rotation(self, token: str) -> bool:
+        return not token.startswith(self.prefix)
+
+    def rotate(self, token: str) -> str:
+        """Re-encrypt `token` under the primary key (unchanged if it already is)."""
+        if not self.needs_rotation(token):
+            return token
+        return self.encrypt(self.decrypt(token))
+
+    def encrypt_many(self, values, workers: int = None, chunk_size: int = 2000) -> list:
+        return self._map("encrypt", values, workers, chunk_size)
+
+    def decrypt_many(self, tokens, workers: int = None, chunk_size: int = 2000) -> list:
+        return self._map("decrypt", tokens, workers, chunk_size)
+
+    def rotate_many(self, tokens, workers: int = None, chunk_size: int = 2000) -> list:
+        return self._map("rotate", tokens, workers, chunk_size)
+
+    def _map(self, op: str, values, workers, chunk_size) -> list:
+        """
+        Apply `op` to every value, in order. Batches larger than one chunk
+        are split across `workers` processes (default: CPU count), each
+        holding its own cipher contexts; smaller ones run inline.
+        """
+        values = list(values)
+        workers = workers or os.cpu_count() or 1
+        if workers <= 1 or len(values) <= chunk_size:
+            fn = getattr(self, op)
+            return [fn(value) for value in values]
+
+        chunks = [values[i:i + chunk_size] for i in range(0, len(values), chunk_size)]
+        results = []
+        with ProcessPoolExecutor(workers, initializer=_init_worker, initargs=(self.ring.keys,)) as pool:
+            for chunk_results in pool.map(_run_chunk, [op] * len(chunks), chunks):
+                results.extend(chunk_results)
+        return results
+
+_worker_service = None
+
+def _init_worker(keys):
+    global _worker_service
+    _worker_service = CryptoService(KeyRing(keys))
+
+def _run_chunk(op, values):
+    fn = getattr(_worker_service, op)
+    return [fn(value) for value in values]
+
+def reencrypt_column(engine, table_name: str, column: str, service: "CryptoService",
+                     pk: str = "id", chunk_size: int = 1000, workers: int = 1, pause: float = 0) -> int:
+    """
+    Move every value in `table_name.column` to the primary key, one chunk
+    per short transaction, so the table is never locked for the whole run.
+
+    Rows are walked in primary-key order (keyset pagination) and only those
+    not already under the primary key are read. Each UPDATE is guarded by
+    the old ciphertext, so a row rewritten concurrently is left alone
+    rather than overwritten with stale data. `pause` seconds between
+    chunks keep a long run from competing with live traffic.
+
+    Returns:
+        int: Number of rows re-encrypted
+    """
+    from sqlalchemy import MetaData, Table, and_, bindparam, select, update
+
+    table = Table(table_name, MetaData(), autoload_with=engine)
+    id_col, value_col = table.c[pk], table.c[column]
+    stmt = (
+        update(table)
+        .where(and_(id_col == bindparam("_id"), value_col == bindparam("_old")))
+        .values({column: bindparam("_new")})
+    )
+    after, moved = None, 0
+    while True:
+        query = select(id_col, value_col).where(
+            value_col.is_not(None), value_col.not_like(service.prefix + "%")
+        )
+        if after is not None:
+            query = query.where(id_col > after)
+        with engine.begin() as conn:
+            rows = conn.execute(query.order_by(id_col).limit(chunk_size)).all()
+            if not rows:
+                break
+            new_values = service.rotate_many([row[1] for row in rows], workers=workers)
+            params = [{"_id": row[0], "_old": row[1], "_new": new} for row, new in zip(rows, new_values)]
+            moved += conn.execute(stmt, params).rowcount
+        after = rows[-1][0]
+        if pause:
+            time.sleep(pause)
+    return moved
+
+def count_versions(engine, table_name: str, column: str, versions) -> dict:
+    """
+    Rows of `table_name.column` still encrypted under each of `versions`,
+    plus "legacy": unprefixed tokens, which could be under any key.
+    """
+    from sqlalchemy import MetaData, Table, func, select
+
+    table = Table(table_name, MetaData(), autoload_with=engine)
+    value_col = table.c[column]
+    counts = {}
+    with engine.connect() as conn:
+        for version in versions:
+            counts[version] = conn.execute(
+                select(func.count()).where(value_col.like(f"v{int(version)}:%"))
+            ).scalar_one()
+        counts["legacy"] = conn.execute(
+            select(func.count()).where(value_col.is_not(None), value_col.not_like("v%:%"))
+        ).scalar_one()
+    return counts
+
+_service = None
+
+def get_service() -> CryptoService:
+    # One service per process, loaded on first use
+    global _service
+    if _service is None:
+        _service = CryptoService(KeyRing.load())
+    return _service
+
@@ -0,0 +1,34 @@
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+import os
+import threading
+
+DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./phase2.db")
+
+engine = create_engine(DATABASE_URL)
+SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+def get_db():
+    db = SessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
+
+_tables_ready = False
+_tables_lock = threading.Lock()
+
+def new_session():
+    """
+    A session for helpers called outside the API (app.pan_tokenizer,
+    app.ach). The API creates tables at startup (app.main); these helpers
+    can run without it, so the first call does the same, once per process.
+    """
+    global _tables_ready
+    if not _tables_ready:
+        with _tables_lock:
+            if not _tables_ready:
+                from app.models import Base
+                Base.metadata.create_all(bind=engine)
+                _tables_ready = True
+    return SessionLocal()
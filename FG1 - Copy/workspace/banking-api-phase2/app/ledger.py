@@ -0,0 +1,233 @@
+import queue
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import Future
+from typing import NamedTuple, Optional
+from sqlalchemy import bindparam, func, insert, or_, select, update
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import Session
+
+from app.models import JournalEntry, LedgerAccount, Posting
+
+# IN (...) lists are kept below SQLite's default bound-parameter limit
+BULK_CHUNK = 500
+
+class InsufficientFunds(ValueError):
+    pass
+
+class Transfer(NamedTuple):
+    sender: str
+    receiver: str
+    amount_cents: int
+    memo: Optional[str] = None
+
+def open_account(db: Session, owner: str, allow_negative: bool = False) -> LedgerAccount:
+    account = LedgerAccount(owner=owner, balance_cents=0, allow_negative=allow_negative)
+    db.add(account)
+    db.commit()
+    db.refresh(account)
+    return account
+
+def _load_accounts(db: Session, owners) -> dict:
+    # Sorted by id: on databases with row locks, FOR UPDATE takes them in
+    # the same order in every transaction, so two opposite transfers
+    # (A->B and B->A) cannot deadlock
+    found = {}
+    owners = sorted(owners)
+    for i in range(0, len(owners), BULK_CHUNK):
+        rows = db.execute(
+            select(LedgerAccount.owner, LedgerAccount.id, LedgerAccount.balance_cents, LedgerAccount.allow_negative)
+            .where(LedgerAccount.owner.in_(owners[i:i + BULK_CHUNK]))
+            .order_by(LedgerAccount.id)
+            .with_for_update()
+        )
+        for owner, account_id, balance, allow_negative in rows:
+            found[owner] = (account_id, balance, allow_negative)
+    return found
+
+def _plan(accounts: dict, transfers: list):
+    """Apply `transfers` in order to in-memory balances; return per-transfer results and net deltas."""
+    balances = {owner: balance for owner, (_, balance, _) in accounts.items()}
+    results, accepted, deltas = [], [], defaultdict(int)
+    for transfer in transfers:
+        sender, receiver, amount = transfer.sender, transfer.receiver, transfer.amount_cents
+        if amount <= 0:
+            results.append({"status": "rejected", "reason": "amount must be positive"})
+        elif sender == receiver:
+            results.append({"status": "rejected", "reason": "sender and receiver are the same account"})
+        elif sender not in accounts or receiver not in accounts:
+            results.append({"status": "rejected", "reason": "unknown account"})
+        elif balances[sender] < amount and not accounts[sender][2]:
+            results.append({"status": "rejected", "reason": "insufficient funds"})
+        else:
+            balances[sender] -= amount
+            balances[receiver] += amount
+            deltas[accounts[sender][0]] -= amount
+            deltas[accounts[receiver][0]] += amount
+            results.append({"status": "posted"})
+            accepted.append((len(results) - 1, transfer))
+    return results, accepted, deltas
+
+_apply_delta = (
+    update(LedgerAccount.__table__)
+    .where(
+        LedgerAccount.__table__.c.id == bindparam("_id"),
+        or_(
+            LedgerAccount.__table__.c.balance_cents + bindparam("_delta") >= 0,
+            LedgerAccount.__table__.c.allow_negative.is_(True),
+        ),
+    )
+    .values(balance_cents=LedgerAccount.__table__.c.balance_cents + bindparam("_delta"))
+)
+
+def post_transfers(db: Session, transfers, kind: str = "p2p", retries: int = 5) -> list:
+    """
+    Post a batch of transfers in one database transaction and one commit.
+
+    Every accepted transfer becomes a journal entry with two postings (a
+    debit of the sender and a credit of the receiver, summing to zero).
+    Balances are checked against the batch's running totals, in order,
+    and then changed with one relative UPDATE per touched account, taken
+    in ascending account id order, guarded so a balance cannot go below
+    zero. If a concurrent writer moved a balance in between (a guard does
+    not match, or SQLite reports the database busy) the batch is rolled
+    back and planned again.
+
+    Returns one dict per transfer, in order: {"status": "posted",
+    "journal_id": ...} or {"status": "rejected", "reason": ...}.
+    """
+    transfers = [Transfer(*transfer) for transfer in transfers]
+    owners = {t.sender for t in transfers} | {t.receiver for t in transfers}
+    for attempt in range(retries):
+        try:
+            accounts = _load_accounts(db, owners)
+            results, accepted, deltas = _plan(accounts, transfers)
+            if not accepted:
+                db.rollback()
+                return results
+            params = [{"_id": account_id, "_delta": delta} for account_id, delta in sorted(deltas.items()) if delta]
+            if db.execute(_apply_delta, params).rowcount != len(params):
+                raise InsufficientFunds("a balance changed concurrently")
+
+            journal_ids = db.execute(
+                insert(JournalEntry).returning(JournalEntry.id, sort_by_parameter_order=True),
+                [{"kind": kind, "memo": transfer.memo} for _, transfer in accepted],
+            ).scalars().all()
+            postings = []
+            for journal_id, (index, transfer) in zip(journal_ids, accepted):
+                results[index]["journal_id"] = journal_id
+                postings.append({"journal_id": journal_id, "account_id": accounts[transfer.sender][0],
+                                 "amount_cents": -transfer.amount_cents})
+                postings.append({"journal_id": journal_id, "account_id": accounts[transfer.receiver][0],
+                                 "amount_cents": transfer.amount_cents})
+            db.execute(insert(Posting), postings)
+            db.commit()
+            return results
+        except (InsufficientFunds, OperationalError):
+            db.rollback()
+            if attempt == retries - 1:
+                raise
+            time.sleep(0.001 * 2 ** attempt)
+
+def post_transfer(db: Session, sender: str, receiver: str, amount_cents: int, memo: str = None,
+                  kind: str = "p2p") -> int:
+    """Post one transfer and return its journal entry id."""
+    result = post_transfers(db, [Transfer(sender, receiver, amount_cents, memo)], kind)[0]
+    if result["status"] == "posted":
+        return result["journal_id"]
+    if result["reason"] == "insufficient funds":
+        raise InsufficientFunds(f"{sender} cannot cover {amount_cents} cents")
+    if result["reason"] == "unknown account":
+        raise KeyError(f"Unknown account in transfer {sender} -> {receiver}")
+    raise ValueError(result["reason"])
+
+def trial_balance(db: Session) -> dict:
+    """
+    Ledger invariants: balances and postings each sum to zero, and every
+    account's balance equals the sum of its postings.
+    """
+    posted = (
+        select(Posting.account_id, func.sum(Posting.amount_cents).label("total"))
+        .group_by(Posting.account_id)
+        .subquery()
+    )
+    mismatched = db.execute(
+        select(func.count())
+        .select_from(LedgerAccount)
+        .outerjoin(posted, posted.c.account_id == LedgerAccount.id)
+        .where(LedgerAccount.balance_cents != func.coalesce(posted.c.total, 0))
+    ).scalar_one()
+    balances = db.execute(select(func.coalesce(func.sum(LedgerAccount.balance_cents), 0))).scalar_one()
+    postings = db.execute(select(func.coalesce(func.sum(Posting.amount_cents), 0))).scalar_one()
+    return {
+        "balances_total": balances,
+        "postings_total": postings,
+        "mismatched_accounts": mismatched,
+        "balanced": balances == 0 and postings == 0 and mismatched == 0,
+    }
+
+class LedgerBatcher:
+    """
+    Micro-batching front end for post_transfers. Callers submit transfers
+    from any thread and get a Future; one writer thread takes everything
+    queued (up to `max_batch`, waiting at most `max_wait` seconds for more
+    after the first) and posts it as a single transaction. Under load the
+    queue fills while the previous batch commits, so the commit cost is
+    shared by many transfers; when idle a transfer is posted on its own.
+    """
+
+    def __init__(self, session_factory, max_batch: int = 100, max_wait: float = 0.0, kind: str = "p2p"):
+        self.session_factory = session_factory
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self.kind = kind
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._run, name="ledger-batcher", daemon=True)
+        self._thread.start()
+
+    def submit(self, sender: str, receiver: str, amount_cents: int, memo: str = None) -> Future:
+        future = Future()
+        self._queue.put((Transfer(sender, receiver, amount_cents, memo), future))
+        return future
+
+    def post(self, sender: str, receiver: str, amount_cents: int, memo: str = None) -> dict:
+        return self.submit(sender, receiver, amount_cents, memo).result()
+
+    def close(self):
+        """Post what is queued, then stop the writer thread."""
+        self._queue.put(None)
+        self._thread.join()
+
+    def _run(self):
+        stopping = False
+        while not stopping:
+            item = self._queue.get()
+            if item is None:
+                break
+            batch = [item]
+            deadline = time.monotonic() + self.max_wait
+            while len(batch) < self.max_batch:
+                try:
+                    item = self._queue.get(timeout=max(0.0, deadline - time.monotonic())) \
+                        if self.max_wait else self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if item is None:
+                    stopping = True
+                    break
+                batch.append(item)
+            self._flush(batch)
+
+    def _flush(self, batch):
+        db = self.session_factory()
+        try:
+            results = post_transfers(db, [transfer for transfer, _ in batch], self.kind)
+        except Exception as exc:
+            for _, future in batch:
+                future.set_exception(exc)
+            return
+        finally:
+            db.close()
+        for (_, future), result in zip(batch, results):
+            future.set_result(result)
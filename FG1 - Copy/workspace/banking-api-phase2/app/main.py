@@ -0,0 +1,18 @@
+from contextlib import asynccontextmanager
+from fastapi import FastAPI
+from app.database import engine
+from app.models import Base
+from app.vault_api import router as vault_router
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    Base.metadata.create_all(bind=engine)
+    yield
+
+app = FastAPI(lifespan=lifespan)
+
+app.include_router(vault_router)
+
+@app.get("/")
+def root():
+    return {"message": "Phase 2: KYC, ACH, P2P & PAN Tokenization"}
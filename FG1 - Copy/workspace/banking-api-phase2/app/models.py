@@ -0,0 +1,70 @@
+from sqlalchemy import Column, Integer, String, Date, DateTime, LargeBinary, Boolean, BigInteger, ForeignKey, Index
+from sqlalchemy.ext.declarative import declarative_base
+import datetime
+
+Base = declarative_base()
+
+class VaultEntry(Base):
+    """One row per distinct card; see app.pan_vault."""
+    __tablename__ = "pan_vault"
+    id = Column(Integer, primary_key=True, index=True)
+    # HMAC-SHA256 of the PAN: "seen this card?" is one unique-index probe
+    fingerprint = Column(LargeBinary(32), unique=True, nullable=False)
+    # Surrogate with the PAN's length, BIN and last four, never Luhn-valid
+    token = Column(String(19), unique=True, nullable=False)
+    encrypted_pan = Column(String, nullable=False)
+    last4 = Column(String(4), nullable=False)
+    created_at = Column(DateTime, default=datetime.datetime.utcnow)
+
+class LedgerAccount(Base):
+    """A ledger account; balance_cents always equals the sum of its postings (see app.ledger)."""
+    __tablename__ = "ledger_accounts"
+    id = Column(Integer, primary_key=True)
+    owner = Column(String, unique=True, nullable=False)
+    balance_cents = Column(BigInteger, nullable=False, default=0)
+    # System accounts (funding, clearing) may go negative; customer accounts may not
+    allow_negative = Column(Boolean, nullable=False, default=False)
+
+class JournalEntry(Base):
+    """One business event (a P2P payment); its postings sum to zero."""
+    __tablename__ = "journal_entries"
+    id = Column(Integer, primary_key=True)
+    kind = Column(String(16), nullable=False)
+    memo = Column(String, nullable=True)
+    created_at = Column(DateTime, default=datetime.datetime.utcnow)
+
+class Posting(Base):
+    """One side of a journal entry: negative amounts debit the account, positive credit it."""
+    __tablename__ = "postings"
+    id = Column(Integer, primary_key=True)
+    journal_id = Column(Integer, ForeignKey("journal_entries.id"), nullable=False, index=True)
+    account_id = Column(Integer, ForeignKey("ledger_accounts.id"), nullable=False)
+    amount_cents = Column(BigInteger, nullable=False)
+
+    __table_args__ = (
+        # Account statements: WHERE account_id = ? ORDER BY id
+        Index("ix_postings_account_id_id", "account_id", "id"),
+    )
+
+class AchTransfer(Base):
+    """An outbound ACH entry, queued until a NACHA file is written (see app.ach)."""
+    __tablename__ = "ach_transfers"
+    id = Column(Integer, primary_key=True)
+    routing_number = Column(String(9), nullable=False)
+    account_number = Column(String(17), nullable=False)
+    amount_cents = Column(BigInteger, nullable=False)
+    name = Column(String(22), nullable=False, default="")
+    individual_id = Column(String(15), nullable=False, default="")
+    transaction_code = Column(String(2), nullable=False)
+    sec_code = Column(String(3), nullable=False)
+    effective_date = Column(Date, nullable=False)
+    # pending -> sending (claimed by a file writer) -> sent
+    status = Column(String(8), nullable=False, default="pending")
+    file_id = Column(String(32), nullable=True, index=True)
+    created_at = Column(DateTime, default=datetime.datetime.utcnow)
+    sent_at = Column(DateTime, nullable=True)
+
+    __table_args__ = (
+        # The file writer's claim: WHERE status = 'pending' ORDER BY id
+        Index("ix_ach_transfers_status_id", "status", "id"),
+    )
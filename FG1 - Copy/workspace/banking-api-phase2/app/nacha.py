@@ -0,0 +1,330 @@
+import datetime
+from dataclasses import dataclass
+from decimal import Decimal
+from typing import Iterable, Iterator, Optional
+
+RECORD_SIZE = 94
+BLOCKING_FACTOR = 10
+PADDING = "9" * RECORD_SIZE
+# Transaction codes that take money out of the receiver's account
+DEBIT_CODES = {"27", "28", "29", "37", "38", "39", "47", "48", "49", "55", "56"}
+
+class NachaError(ValueError):
+    pass
+
+@dataclass
+class AchEntry:
+    routing_number: str  # receiver's 9-digit ABA routing number
+    account_number: str
+    amount_cents: int
+    name: str = ""
+    individual_id: str = ""
+    transaction_code: str = "22"  # 22 checking credit, 27 checking debit, 32/37 savings
+    sec_code: str = "PPD"
+    effective_date: Optional[datetime.date] = None
+
+@dataclass
+class AchBatch:
+    """
+    One batch of an outbound file. `entries` is read once, in order, as
+    the records are written, so it can be a generator (e.g. rows streamed
+    from the database). `service_class` is "200" (debits and credits),
+    "220" (credits only) or "225" (debits only); when None it is worked
+    out from `entries`, which then has to be a list.
+    """
+    sec_code: str
+    effective_date: datetime.date
+    entries: Iterable[AchEntry]
+    service_class: Optional[str] = None
+
+@dataclass
+class ParsedEntry:
+    """An entry detail record from an inbound file, with its return/NOC addenda if any."""
+    transaction_code: str
+    routing_number: str
+    account_number: str
+    amount_cents: int
+    individual_id: str
+    name: str
+    trace_number: str
+    sec_code: str
+    effective_date: str
+    addenda_type: Optional[str] = None  # "99" return, "98" notification of change
+    reason_code: Optional[str] = None  # R01..., C01...
+    original_trace: Optional[str] = None
+    corrected_data: Optional[str] = None
+    addenda_information: Optional[str] = None
+
+def _alpha(value: str, width: int) -> str:
+    return str(value or "").upper()[:width].ljust(width)
+
+def _num(value: int, width: int) -> str:
+    text = str(value)
+    if len(text) > width:
+        raise NachaError(f"{value} does not fit in {width} digits")
+    return text.rjust(width, "0")
+
+class AchBatcher:
+    """
+    Writes outbound ACH entries as a NACHA file.
+
+    Entries go out in one batch per (SEC code, effective date). The file
+    is produced record by record (iter_records / write) from batches whose
+    entries may be streamed, so writing never builds the whole file in
+    memory; batch and file control totals are accumulated as entries
+    stream out.
+    """
+
+    def __init__(self, immediate_destination: str, immediate_origin: str, odfi: str,
+                 company_name: str, company_id: str, destination_name: str = "", origin_name: str = "",
+                 entry_description: str = "PAYMENT"):
+        if len(odfi) != 8 or not odfi.isdigit():
+            raise NachaError(f"ODFI must be the 8-digit routing number prefix, got {odfi!r}")
+        self.immediate_destination = immediate_destination
+        self.immediate_origin = immediate_origin
+        self.odfi = odfi
+        self.company_name = company_name
+        self.company_id = company_id
+        self.destination_name = destination_name
+        self.origin_name = origin_name
+        self.entry_description = entry_description
+
+    @staticmethod
+    def batch_key(entry: AchEntry) -> tuple:
+        """Validate `entry` and return its batch: (SEC code, effective date, defaulting to the next business day)."""
+        if not routing_number_valid(entry.routing_number):
+            raise NachaError(f"Invalid routing number {entry.routing_number!r}")
+        if entry.amount_cents < 0:
+            raise NachaError("Amount must not be negative")
+        return entry.sec_code, entry.effective_date or _next_business_day(datetime.date.today())
+
+    def write(self, f, batches, file_id_modifier: str = "A", now: datetime.datetime = None) -> int:
+        """
+        Write a NACHA file to the text file `f` and return the number of
+        entries. `batches` is an iterable of AchBatch in file order, or a
+        dict {(SEC code, effective date): [AchEntry, ...]}.
+        """
+        buffer = []
+        count = 0
+        for record in self.iter_records(batches, file_id_modifier, now):
+            buffer.append(record)
+            count += record[0] == "6"
+            if len(buffer) >= 1000:
+                f.write("\n".join(buffer) + "\n")
+                buffer.clear()
+        if buffer:
+            f.write("\n".join(buffer) + "\n")
+        return count
+
+    def iter_records(self, batches, file_id_modifier: str = "A",
+                     now: datetime.datetime = None) -> Iterator[str]:
+        if isinstance(batches, dict):
+            batches = [AchBatch(sec_code, effective_date, batches[(sec_code, effective_date)])
+                       for sec_code, effective_date in sorted(batches)]
+        now = now or datetime.datetime.now()
+        yield (
+            "101"
+            + " " + _num(self.immediate_destination, 9)
+            + " " + _num(self.immediate_origin, 9)
+            + now.strftime("%y%m%d%H%M")
+            + file_id_modifier
+            + "094" + "10" + "1"
+            + _alpha(self.destination_name, 23)
+            + _alpha(self.origin_name, 23)
+            + " " * 8
+        )
+        records = 1
+        file_count = file_hash = file_debit = file_credit = 0
+        # Trace numbers (ODFI + sequence) must be unique within the file
+        sequence = 0
+
+        batch_number = 0
+        for batch in batches:
+            batch_number += 1
+            sec_code, effective_date = batch.sec_code, batch.effective_date
+            service_class = batch.service_class or service_class_for(entry.transaction_code for entry in batch.entries)
+            yield (
+                "5" + service_class
+                + _alpha(self.company_name, 16)
+                + " " * 20
+                + _alpha(self.company_id, 10)
+                + _alpha(sec_code, 3)
+                + _alpha(self.entry_description, 10)
+                + " " * 6
+                + effective_date.strftime("%y%m%d")
+                + "   " + "1"
+                + self.odfi
+                + _num(batch_number, 7)
+            )
+            count = entry_hash = debit = credit = 0
+            for entry in batch.entries:
+                sequence += 1
+                routing = entry.routing_number
+                yield (
+                    "6" + entry.transaction_code
+                    + routing
+                    + _alpha(entry.account_number, 17)
+                    + _num(entry.amount_cents, 10)
+                    + _alpha(entry.individual_id, 15)
+                    + _alpha(entry.name, 22)
+                    + "  " + "0"
+                    + self.odfi + _num(sequence, 7)
+                )
+                count += 1
+                entry_hash += int(routing[:8])
+                if entry.transaction_code in DEBIT_CODES:
+                    debit += entry.amount_cents
+                else:
+                    credit += entry.amount_cents
+            entry_hash %= 10 ** 10
+            yield (
+                "8" + service_class
+                + _num(count, 6)
+                + _num(entry_hash, 10)
+                + _num(debit, 12)
+                + _num(credit, 12)
+                + _alpha(self.company_id, 10)
+                + " " * 19 + " " * 6
+                + self.odfi
+                + _num(batch_number, 7)
+            )
+            records += count + 2
+            file_count += count
+            file_hash += entry_hash
+            file_debit += debit
+            file_credit += credit
+
+        records += 1
+        blocks = -(-records // BLOCKING_FACTOR)
+        yield (
+            "9"
+            + _num(batch_number, 6)
+            + _num(blocks, 6)
+            + _num(file_count, 8)
+            + _num(file_hash % 10 ** 10, 10)
+            + _num(file_debit, 12)
+            + _num(file_credit, 12)
+            + " " * 39
+        )
+        for _ in range(blocks * BLOCKING_FACTOR - records):
+            yield PADDING
+
+def service_class_for(transaction_codes) -> str:
+    """Batch service class code for a batch with these entry transaction codes."""
+    codes = set(transaction_codes)
+    debits = bool(codes & DEBIT_CODES)
+    credits = bool(codes - DEBIT_CODES)
+    return "200" if debits and credits else "225" if debits else "220"
+
+def routing_number_valid(routing: str) -> bool:
+    """9 digits with a valid ABA check digit."""
+    if len(routing) != 9 or not routing.isdigit():
+        return False
+    d = [int(ch) for ch in routing]
+    return (3 * (d[0] + d[3] + d[6]) + 7 * (d[1] + d[4] + d[7]) + d[2] + d[5] + d[8]) % 10 == 0
+
+def _next_business_day(day: datetime.date) -> datetime.date:
+    day += datetime.timedelta(days=1)
+    while day.weekday() >= 5:
+        day += datetime.timedelta(days=1)
+    return day
+
+def to_cents(amount) -> int:
+    return int((Decimal(str(amount)) * 100).quantize(Decimal("1")))
+
+def iter_records(f, chunk_size: int = 1 << 20) -> Iterator[str]:
+    """
+    94-character records from a text file, with or without line breaks
+    between them, read `chunk_size` characters at a time.
+    """
+    pending = ""
+    while True:
+        chunk = f.read(chunk_size)
+        if not chunk:
+            break
+        data = pending + chunk.replace("\r", "").replace("\n", "")
+        usable = len(data) - len(data) % RECORD_SIZE
+        for i in range(0, usable, RECORD_SIZE):
+            yield data[i:i + RECORD_SIZE]
+        pending = data[usable:]
+    if pending.strip():
+        raise NachaError(f"Trailing partial record: {pending!r}")
+
+def iter_entries(f, verify: bool = True) -> Iterator[ParsedEntry]:
+    """
+    Stream the entries of a NACHA file (returns and NOCs included), in
+    constant memory: only the current entry and running control totals are
+    held. With `verify`, batch and file control records are checked against
+    the totals of the records actually read.
+    """
+    sec_code = effective_date = ""
+    entry = None
+    batch = [0, 0, 0, 0]  # entry/addenda count, hash, debit, credit
+    totals = [0, 0, 0, 0, 0]  # batches, entry/addenda count, hash, debit, credit
+
+    for record in iter_records(f):
+        kind = record[0]
+        if kind == "6":
+            if entry is not None:
+                yield entry
+            amount = int(record[29:39])
+            code = record[1:3]
+            entry = ParsedEntry(
+                transaction_code=code,
+                routing_number=record[3:12],
+                account_number=record[12:29].strip(),
+                amount_cents=amount,
+                individual_id=record[39:54].strip(),
+                name=record[54:76].strip(),
+                trace_number=record[79:94],
+                sec_code=sec_code,
+                effective_date=effective_date,
+            )
+            batch[0] += 1
+            batch[1] += int(record[3:11])
+            batch[2 if code in DEBIT_CODES else 3] += amount
+        elif kind == "7":
+            batch[0] += 1
+            addenda_type = record[1:3]
+            if entry is not None and addenda_type in ("98", "99"):
+                entry.addenda_type = addenda_type
+                entry.reason_code = record[3:6]
+                entry.original_trace = record[6:21]
+                if addenda_type == "98":
+                    entry.corrected_data = record[35:64].strip()
+                else:
+                    entry.addenda_information = record[35:79].strip()
+        elif kind == "5":
+            sec_code = record[50:53]
+            effective_date = record[69:75]
+            batch = [0, 0, 0, 0]
+        elif kind == "8":
+            if entry is not None:
+                yield entry
+                entry = None
+            if verify:
+                _check(record, "batch", [(4, 10, batch[0]), (10, 20, batch[1] % 10 ** 10),
+                                          (20, 32, batch[2]), (32, 44, batch[3])])
+            totals[0] += 1
+            for i in range(4):
+                totals[i + 1] += batch[i]
+        elif kind == "9" and record != PADDING:
+            if verify:
+                _check(record, "file", [(1, 7, totals[0]), (13, 21, totals[1]), (21, 31, totals[2] % 10 ** 10),
+                                         (31, 43, totals[3]), (43, 55, totals[4])])
+        elif kind not in "19":
+            raise NachaError(f"Unknown record type {kind!r}")
+    if entry is not None:
+        yield entry
+
+def _check(record: str, level: str, fields):
+    for start, end, actual in fields:
+        if int(record[start:end]) != actual:
+            raise NachaError(f"{level} control mismatch at columns {start + 1}-{end}: "
+                             f"file says {int(record[start:end])}, entries add up to {actual}")
+
+def iter_returns(f, verify: bool = True) -> Iterator[ParsedEntry]:
+    """Only the returned (addenda 99) and corrected (98, NOC) entries of an inbound file."""
+    for entry in iter_entries(f, verify):
+        if entry.addenda_type is not None:
+            yield entry
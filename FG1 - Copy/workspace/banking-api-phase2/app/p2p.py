@@ -1,7 +1,20 @@
-def peer_to_peer_payment(sender: str, receiver: str, amount: float):
-    return {
+from sqlalchemy.orm import Session
+
+from app.idempotency import idempotent
+from app.ledger import post_transfer
+from app.nacha import to_cents
+
+@idempotent("p2p")
+def peer_to_peer_payment(sender: str, receiver: str, amount: float, db: Session = None):
+    result = {
         "sender": sender,
         "receiver": receiver,
         "amount": amount,
         "status": "sent"
     }
+    if db is not None:
+        # Post to the double-entry ledger (app.ledger); raises
+        # InsufficientFunds / KeyError instead of sending
+        result["journal_id"] = post_transfer(db, sender, receiver, to_cents(amount))
+        result["status"] = "posted"
+    return result
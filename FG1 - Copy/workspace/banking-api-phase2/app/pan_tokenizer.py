@@ -1,12 +1,34 @@
-from cryptography.fernet import Fernet
-import os
+from app import pan_vault
+from app.database import new_session
 
-# Generate key for demonstration; in real apps, load securely
-key = Fernet.generate_key()
-cipher = Fernet(key)
+# Tokens come from the PAN vault (app.pan_vault): the same card always gets
+# the same token, and the PAN is stored encrypted with the versioned keys
+# in app.crypto_service
 
 def tokenize_pan(pan: str):
-    return cipher.encrypt(pan.encode()).decode()
+    db = new_session()
+    try:
+        return pan_vault.tokenize(db, pan)
+    finally:
+        db.close()
 
 def detokenize_pan(token: str):
-    return cipher.decrypt(token.encode()).decode()
+    db = new_session()
+    try:
+        return pan_vault.detokenize(db, token)
+    finally:
+        db.close()
+
+def tokenize_pans(pans: list, workers: int = None):
+    db = new_session()
+    try:
+        return pan_vault.tokenize_many(db, pans, workers=workers)
+    finally:
+        db.close()
+
+def detokenize_pans(tokens: list, workers: int = None):
+    db = new_session()
+    try:
+        return pan_vault.detokenize_many(db, tokens, workers=workers)
+    finally:
+        db.close()
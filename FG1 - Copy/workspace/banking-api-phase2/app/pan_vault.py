@@ -0,0 +1,145 @@
+import hashlib
+import hmac
+import os
+import secrets
+from sqlalchemy import select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from app.crypto_service import get_service
+from app.models import VaultEntry
+
+# Fingerprint key: PAN_HMAC_KEY (hex), or a key file created on first use.
+# Changing it breaks deduplication against existing rows.
+HMAC_KEY_PATH = os.getenv("PAN_HMAC_KEY_PATH", "pan_hmac.key")
+# IN (...) lists are kept below SQLite's default bound-parameter limit
+BULK_CHUNK = 500
+# Commits tokenize_many tries before giving up on unique-constraint races
+TOKENIZE_ATTEMPTS = 5
+
+_hmac_key = None
+
+def _fingerprint_key() -> bytes:
+    global _hmac_key
+    if _hmac_key is None:
+        env = os.getenv("PAN_HMAC_KEY")
+        if env:
+            _hmac_key = bytes.fromhex(env)
+        elif os.path.exists(HMAC_KEY_PATH):
+            with open(HMAC_KEY_PATH) as f:
+                _hmac_key = bytes.fromhex(f.read().strip())
+        else:
+            _hmac_key = secrets.token_bytes(32)
+            fd = os.open(HMAC_KEY_PATH, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+            with os.fdopen(fd, "w") as f:
+                f.write(_hmac_key.hex())
+    return _hmac_key
+
+def luhn_valid(number: str) -> bool:
+    total = 0
+    for i, ch in enumerate(reversed(number)):
+        digit = int(ch)
+        if i % 2:
+            digit *= 2
+            if digit > 9:
+                digit -= 9
+        total += digit
+    return total % 10 == 0
+
+def normalize_pan(pan: str) -> str:
+    digits = pan.replace(" ", "").replace("-", "")
+    if not digits.isdigit() or not 12 <= len(digits) <= 19 or not luhn_valid(digits):
+        raise ValueError("Invalid card number")
+    return digits
+
+def fingerprint(pan: str) -> bytes:
+    return hmac.new(_fingerprint_key(), pan.encode(), hashlib.sha256).digest()
+
+def make_token(pan: str) -> str:
+    """
+    Random surrogate that keeps the PAN's length, first six and last four
+    digits, so it passes format checks and still shows the card on
+    receipts. It always fails the Luhn check, so a token can never be
+    mistaken for a real card number.
+    """
+    middle = [secrets.choice("0123456789") for _ in range(len(pan) - 10)]
+    token = pan[:6] + "".join(middle) + pan[-4:]
+    if luhn_valid(token):
+        middle[0] = str((int(middle[0]) + 1) % 10)
+        token = pan[:6] + "".join(middle) + pan[-4:]
+    return token
+
+def lookup_token(db: Session, pan: str):
+    """Token for a card already in the vault, or None. One index probe, nothing decrypted."""
+    return db.execute(
+        select(VaultEntry.token).where(VaultEntry.fingerprint == fingerprint(normalize_pan(pan)))
+    ).scalar_one_or_none()
+
+def tokenize(db: Session, pan: str) -> str:
+    """Vault `pan` (if new) and return its token; the same card always gets the same token."""
+    return tokenize_many(db, [pan])[0]
+
+def detokenize(db: Session, token: str) -> str:
+    encrypted = db.execute(select(VaultEntry.encrypted_pan).where(VaultEntry.token == token)).scalar_one_or_none()
+    if encrypted is None:
+        raise KeyError("Unknown token")
+    return get_service().decrypt(encrypted)
+
+def _tokens_by_fingerprint(db: Session, fingerprints) -> dict:
+    found = {}
+    fingerprints = list(fingerprints)
+    for i in range(0, len(fingerprints), BULK_CHUNK):
+        chunk = fingerprints[i:i + BULK_CHUNK]
+        rows = db.execute(select(VaultEntry.fingerprint, VaultEntry.token).where(VaultEntry.fingerprint.in_(chunk)))
+        found.update(rows.tuples().all())
+    return found
+
+def tokenize_many(db: Session, pans: list, workers: int = None) -> list:
+    """
+    Tokenize a batch in order. Known cards are found with chunked
+    fingerprint IN (...) probes. New ones are encrypted together
+    (app.crypto_service batch API) and inserted in one flush, then
+    committed. Duplicates within the batch share one row. A commit that
+    hits a unique constraint is retried up to TOKENIZE_ATTEMPTS times in
+    all, then the IntegrityError is raised.
+    """
+    pans = [normalize_pan(pan) for pan in pans]
+    prints = [fingerprint(pan) for pan in pans]
+    encrypted = {}
+    for attempt in range(1, TOKENIZE_ATTEMPTS + 1):
+        tokens = _tokens_by_fingerprint(db, set(prints))
+        new = {fp: pan for fp, pan in zip(prints, pans) if fp not in tokens}
+        if not new:
+            break
+        pending = [fp for fp in new if fp not in encrypted]
+        if pending:
+            ciphertexts = get_service().encrypt_many([new[fp] for fp in pending], workers=workers)
+            encrypted.update(zip(pending, ciphertexts))
+        for fp, pan in new.items():
+            tokens[fp] = make_token(pan)
+            db.add(VaultEntry(fingerprint=fp, token=tokens[fp], encrypted_pan=encrypted[fp], last4=pan[-4:]))
+        try:
+            db.commit()
+            break
+        except IntegrityError:
+            # Another request vaulted one of these cards, or a token
+            # collided; the next attempt picks up the stored rows and
+            # draws fresh tokens
+            db.rollback()
+            if attempt == TOKENIZE_ATTEMPTS:
+                raise
+    return [tokens[fp] for fp in prints]
+
+def detokenize_many(db: Session, tokens: list, workers: int = None) -> list:
+    """PANs for `tokens`, in order; raises KeyError if any token is unknown."""
+    encrypted = {}
+    unique = list(set(tokens))
+    for i in range(0, len(unique), BULK_CHUNK):
+        chunk = unique[i:i + BULK_CHUNK]
+        rows = db.execute(select(VaultEntry.token, VaultEntry.encrypted_pan).where(VaultEntry.token.in_(chunk)))
+        encrypted.update(rows.tuples().all())
+    missing = [token for token in unique if token not in encrypted]
+    if missing:
+        raise KeyError(f"Unknown token: {missing[0]}")
+    pans = dict(zip(encrypted, get_service().decrypt_many(list(encrypted.values()), workers=workers)))
+    return [pans[token] for token in tokens]
@@ -0,0 +1,83 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from dataclasses import dataclass
+from fastapi import HTTPException, Security
+from fastapi.security import APIKeyHeader
+
+# JSON object of API key -> {"name": ..., "scopes": [...], "per_minute": ...};
+# per_minute is how many items (PANs or tokens) the client may send to
+# rate-limited endpoints per minute
+VAULT_API_KEYS = os.getenv("VAULT_API_KEYS", "{}")
+DEFAULT_PER_MINUTE = int(os.getenv("VAULT_DEFAULT_PER_MINUTE", "600"))
+
+TOKENIZE = "vault:tokenize"
+DETOKENIZE = "vault:detokenize"  # returns cleartext PANs
+LOOKUP = "vault:lookup"  # reveals whether a card is in the vault
+
+api_key_header = APIKeyHeader(name="X-API-Key", auto_error=False)
+
+@dataclass(frozen=True)
+class Client:
+    name: str
+    scopes: frozenset
+    per_minute: int = DEFAULT_PER_MINUTE
+
+def _digest(api_key: str) -> bytes:
+    return hashlib.sha256(api_key.encode()).digest()
+
+def load_clients(raw: str = VAULT_API_KEYS) -> dict:
+    """Clients keyed by SHA-256 of their API key, so the keys themselves are not kept around."""
+    clients = {}
+    for api_key, item in json.loads(raw).items():
+        clients[_digest(api_key)] = Client(item["name"], frozenset(item.get("scopes", ())),
+                                           int(item.get("per_minute", DEFAULT_PER_MINUTE)))
+    return clients
+
+clients = load_clients()
+
+class RateLimiter:
+    """Token bucket per client: `per_minute` items, refilled continuously, with a full minute as burst."""
+
+    def __init__(self):
+        self._buckets = {}
+        self._lock = threading.Lock()
+
+    def take(self, client: Client, count: int, now: float = None) -> float:
+        """Take `count` items; returns 0 if allowed, else seconds until they would be."""
+        now = time.monotonic() if now is None else now
+        rate = client.per_minute / 60.0
+        with self._lock:
+            tokens, updated = self._buckets.get(client.name, (float(client.per_minute), now))
+            tokens = min(float(client.per_minute), tokens + (now - updated) * rate)
+            if count > tokens:
+                self._buckets[client.name] = (tokens, now)
+                return (count - tokens) / rate if rate > 0 and count <= client.per_minute else 60.0
+            self._buckets[client.name] = (tokens - count, now)
+            return 0.0
+
+    def reset(self):
+        with self._lock:
+            self._buckets.clear()
+
+rate_limiter = RateLimiter()
+
+def require_scope(scope: str):
+    """Dependency resolving X-API-Key to a Client holding `scope` (401 without a valid key, 403 without the scope)."""
+    def dependency(api_key: str = Security(api_key_header)) -> Client:
+        client = clients.get(_digest(api_key)) if api_key else None
+        if client is None:
+            raise HTTPException(status_code=401, detail="Missing or invalid API key",
+                                headers={"WWW-Authenticate": "ApiKey"})
+        if scope not in client.scopes:
+            raise HTTPException(status_code=403, detail=f"API key lacks the {scope} scope")
+        return client
+    return dependency
+
+def enforce_rate(client: Client, count: int):
+    wait = rate_limiter.take(client, count)
+    if wait:
+        raise HTTPException(status_code=429, detail="Rate limit exceeded",
+                            headers={"Retry-After": str(max(1, int(wait + 0.999)))})
@@ -1,8 +1,269 @@
+import datetime
+import io
+import json
+import os
+import tempfile
+
+# A throwaway SQLite database unless one is configured, and API keys for the vault tests
+os.environ.setdefault("DATABASE_URL", "sqlite:///" + os.path.join(tempfile.mkdtemp(), "phase2_test.db"))
+os.environ.setdefault("VAULT_API_KEYS", json.dumps({
+    "test-tokenizer": {"name": "tokenizer", "scopes": ["vault:tokenize"]},
+    "test-admin": {"name": "admin", "scopes": ["vault:tokenize", "vault:detokenize", "vault:lookup"]},
+    "test-limited": {"name": "limited", "scopes": ["vault:detokenize"], "per_minute": 5},
+}))
+
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine, insert
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import sessionmaker
+
 from app.kyc import verify_identity
-from app.ach import initiate_ach_transfer
+from app import nacha
+from app.ach import initiate_ach_transfer, write_ach_file
+from app.database import new_session
+from app.ledger import InsufficientFunds, LedgerBatcher, open_account, post_transfer, post_transfers, trial_balance
+from app.models import AchTransfer, Base, JournalEntry, LedgerAccount, Posting
 from app.p2p import peer_to_peer_payment
 from app.pan_tokenizer import tokenize_pan, detokenize_pan
 
+def run_tokenize_retry_tests():
+    from app import pan_vault
+
+    db = new_session()
+    taken = pan_vault.tokenize(db, "4111111111111111")
+    saved_make_token, draws = pan_vault.make_token, []
+
+    def colliding(pan):
+        draws.append(pan)
+        return taken if len(draws) < 3 else saved_make_token(pan)
+
+    pan_vault.make_token = colliding
+    try:
+        # Two token collisions, then a fresh token goes in
+        token = pan_vault.tokenize(db, "5105105105105100")
+        assert token != taken and len(draws) == 3 and pan_vault.detokenize(db, token) == "5105105105105100"
+
+        # Colliding every time: gives up after TOKENIZE_ATTEMPTS commits
+        draws.clear()
+        pan_vault.make_token = lambda pan: draws.append(pan) or taken
+        try:
+            pan_vault.tokenize(db, "4012888888881881")
+        except IntegrityError:
+            pass
+        else:
+            raise AssertionError("expected an IntegrityError")
+        assert len(draws) == pan_vault.TOKENIZE_ATTEMPTS
+        assert pan_vault.lookup_token(db, "4012888888881881") is None
+    finally:
+        pan_vault.make_token = saved_make_token
+        db.close()
+    print("Tokenize: token collisions retried, then raised after", pan_vault.TOKENIZE_ATTEMPTS, "attempts")
+
+def run_vault_api_tests():
+    from app.main import app
+    from app.security import rate_limiter
+
+    rate_limiter.reset()
+    tokenizer = {"X-API-Key": "test-tokenizer"}
+    admin = {"X-API-Key": "test-admin"}
+    limited = {"X-API-Key": "test-limited"}
+    pans = ["4111111111111111", "5500005555555559", "4111111111111111"]
+    with TestClient(app) as client:
+        assert client.post("/vault/tokenize", json={"pans": pans}).status_code == 401
+        assert client.post("/vault/tokenize", json={"pans": pans},
+                           headers={"X-API-Key": "wrong"}).status_code == 401
+        response = client.post("/vault/tokenize", json={"pans": pans}, headers=tokenizer)
+        assert response.status_code == 200
+        tokens = response.json()["tokens"]
+        assert tokens[0] == tokens[2] and tokens[0] != pans[0] and tokens[0][-4:] == "1111"
+        print("Tokenized:", tokens)
+
+        # Getting cleartext back needs the privileged scopes
+        assert client.post("/vault/detokenize", json={"tokens": tokens}, headers=tokenizer).status_code == 403
+        assert client.post("/vault/lookup", json={"pan": pans[0]}, headers=tokenizer).status_code == 403
+        response = client.post("/vault/detokenize", json={"tokens": tokens}, headers=admin)
+        assert response.status_code == 200 and response.json()["pans"] == pans
+        assert client.post("/vault/lookup", json={"pan": pans[1]}, headers=admin).json() == \
+            {"seen": True, "token": tokens[1]}
+        assert client.post("/vault/detokenize", json={"tokens": ["4111000000001111"]},
+                           headers=admin).status_code == 404
+        assert client.post("/vault/detokenize", json={"tokens": tokens * 50}, headers=admin).status_code == 422
+
+        # 5 items a minute: the second batch of 3 is refused
+        assert client.post("/vault/detokenize", json={"tokens": tokens}, headers=limited).status_code == 200
+        response = client.post("/vault/detokenize", json={"tokens": tokens}, headers=limited)
+        assert response.status_code == 429 and int(response.headers["Retry-After"]) >= 1
+        print("Vault API: 401 without a key, 403 without the scope, 429 over the rate limit")
+
+def run_ach_tests():
+    tmp = tempfile.mkdtemp()
+    routing = ["091000019", "021000021", "011000138"]
+    monday = datetime.date(2026, 10, 19)
+    sent = []
+    for i in range(25):
+        sec_code = "CCD" if i % 5 == 0 else "PPD"
+        result = initiate_ach_transfer(f"cust{i}", f"9876{i:05d}", 10 + i * 1.25, routing_number=routing[i % 3],
+                                       sec_code=sec_code, effective_date=monday, name=f"Payee {i}")
+        assert result["status"] == "queued"
+        sent.append((routing[i % 3], f"9876{i:05d}", 1000 + i * 125, f"CUST{i}", f"PAYEE {i}", sec_code))
+
+    # Queued in the database, not in the process: a failed write leaves them pending
+    try:
+        write_ach_file(os.path.join(tmp, "missing", "out.ach"))
+    except OSError:
+        pass
+    else:
+        raise AssertionError("expected the write to fail")
+    db = new_session()
+    assert db.query(AchTransfer).filter(AchTransfer.status == "pending").count() == 25
+    db.close()
+
+    path = os.path.join(tmp, "out.ach")
+    assert write_ach_file(path) == 25
+    with open(path) as f:
+        text = f.read()
+    records = text.splitlines()
+    assert all(len(record) == nacha.RECORD_SIZE for record in records) and len(records) % nacha.BLOCKING_FACTOR == 0
+
+    # Round trip: every entry comes back as written, with controls verified
+    parsed = list(nacha.iter_entries(io.StringIO(text)))
+    assert sorted((e.routing_number, e.account_number, e.amount_cents, e.individual_id, e.name, e.sec_code)
+                  for e in parsed) == sorted(sent)
+    assert all(e.transaction_code == "22" and e.effective_date == "261019" for e in parsed)
+    assert len({e.trace_number for e in parsed}) == 25
+
+    # Control totals: one batch per SEC code, entry hash of the routing numbers, credits only
+    batch_controls = [r for r in records if r[0] == "8"]
+    file_control = next(r for r in records if r[0] == "9" and r != nacha.PADDING)
+    assert [int(r[4:10]) for r in batch_controls] == [5, 20]  # CCD, PPD
+    assert int(file_control[1:7]) == 2 and int(file_control[7:13]) == len(records) // nacha.BLOCKING_FACTOR
+    assert int(file_control[13:21]) == 25
+    assert int(file_control[21:31]) == sum(int(entry[0][:8]) for entry in sent) % 10 ** 10
+    assert int(file_control[31:43]) == 0 and int(file_control[43:55]) == sum(entry[2] for entry in sent)
+    tampered = text.replace(file_control, file_control[:43] + nacha._num(1, 12) + file_control[55:])
+    try:
+        list(nacha.iter_entries(io.StringIO(tampered)))
+    except nacha.NachaError:
+        pass
+    else:
+        raise AssertionError("expected a control total mismatch")
+
+    db = new_session()
+    assert db.query(AchTransfer).filter(AchTransfer.status == "sent").count() == 25
+    db.close()
+    assert write_ach_file(os.path.join(tmp, "empty.ach")) == 0
+    assert not os.path.exists(os.path.join(tmp, "empty.ach"))
+
+    for odfi in ("0910000", "091000019", "0910000A"):
+        try:
+            nacha.AchBatcher("091000019", "021000021", odfi, "BANKING API", "0000000000")
+        except nacha.NachaError:
+            pass
+        else:
+            raise AssertionError(f"ODFI {odfi!r} was accepted")
+    print("ACH: 25 entries persisted, written once, parsed back with matching control totals")
+
+def run_ledger_tests():
+    # Own database: the unbalanced case below corrupts it on purpose
+    engine = create_engine("sqlite:///" + os.path.join(tempfile.mkdtemp(), "ledger_test.db"))
+    Base.metadata.create_all(bind=engine)
+    Session = sessionmaker(bind=engine)
+    db = Session()
+    open_account(db, "funding", allow_negative=True)
+    for owner in ("alice", "bob", "carol"):
+        open_account(db, owner)
+
+    # Balanced: each journal entry is a debit and a credit summing to zero
+    journal_id = post_transfer(db, "funding", "alice", 10000)
+    postings = db.query(Posting).filter(Posting.journal_id == journal_id).all()
+    assert sorted(p.amount_cents for p in postings) == [-10000, 10000]
+    results = post_transfers(db, [("alice", "bob", 2500), ("bob", "carol", 2500), ("alice", "carol", 100)])
+    assert [r["status"] for r in results] == ["posted"] * 3
+
+    # Rejected transfers leave no postings behind
+    journals = db.query(JournalEntry).count()
+    results = post_transfers(db, [("carol", "bob", 5000), ("alice", "alice", 1), ("alice", "nobody", 1),
+                                  ("bob", "carol", 0), ("carol", "alice", 2600)])
+    assert [r.get("reason") for r in results] == ["insufficient funds", "sender and receiver are the same account",
+                                                  "unknown account", "amount must be positive", None]
+    for sender, receiver, error in (("bob", "alice", InsufficientFunds), ("alice", "nobody", KeyError)):
+        try:
+            post_transfer(db, sender, receiver, 1)
+        except error:
+            pass
+        else:
+            raise AssertionError(f"expected {error.__name__}")
+    assert db.query(JournalEntry).count() == journals + 1
+
+    balances = dict(db.query(LedgerAccount.owner, LedgerAccount.balance_cents))
+    assert balances == {"funding": -10000, "alice": 10000, "bob": 0, "carol": 0}
+    batcher = LedgerBatcher(Session, max_batch=10)
+    futures = [batcher.submit("alice", "bob", 100) for _ in range(20)]
+    batcher.close()
+    assert [f.result()["status"] for f in futures] == ["posted"] * 20
+    report = trial_balance(db)
+    assert report == {"balances_total": 0, "postings_total": 0, "mismatched_accounts": 0, "balanced": True}
+
+    # Unbalanced: a posting without its other side is caught by the trial balance
+    journal = db.execute(insert(JournalEntry).values(kind="manual").returning(JournalEntry.id)).scalar_one()
+    alice = db.query(LedgerAccount.id).filter(LedgerAccount.owner == "alice").scalar()
+    db.execute(insert(Posting).values(journal_id=journal, account_id=alice, amount_cents=500))
+    db.commit()
+    report = trial_balance(db)
+    assert not report["balanced"] and report["postings_total"] == 500 and report["mismatched_accounts"] == 1
+    db.close()
+    print("Ledger: balanced postings, rejected transfers, trial balance", report)
+
+def run_idempotency_tests():
+    # Identical in banking-api-eft and banking-api-phase2, like app/idempotency.py itself
+    from app import idempotency
+    from app.idempotency import (IdempotencyKeyReused, IdempotencyStore, RequestInProgress, idempotent,
+                                 request_hash)
+
+    path = os.path.join(tempfile.mkdtemp(), "idempotency.db")
+    saved_store, idempotency._store = idempotency._store, IdempotencyStore(path)
+    calls = []
+
+    @idempotent("test")
+    def pay(to: str, amount: float, db=None):
+        calls.append((to, amount))
+        return {"to": to, "amount": amount, "call": len(calls)}
+
+    try:
+        assert pay("bob", 5.0, idempotency_key="k1") == {"to": "bob", "amount": 5.0, "call": 1}
+        assert pay("bob", 5.0, db=object(), idempotency_key="k1")["call"] == 1  # replayed; db is not fingerprinted
+        assert pay("bob", 5.0)["call"] == 2  # no key, no deduplication
+        for bad in (lambda: pay("bob", 6.0, idempotency_key="k1"), lambda: pay("bob", 5.0, idempotency_key="")):
+            try:
+                bad()
+            except (IdempotencyKeyReused, ValueError):
+                pass
+            else:
+                raise AssertionError("expected the key to be refused")
+        assert len(calls) == 2
+
+        store = IdempotencyStore(path, wait=0)
+        try:
+            store.run("test", "k2", {}, lambda: 1 / 0)
+        except ZeroDivisionError:
+            pass
+        assert store.run("test", "k2", {}, lambda: "retried") == "retried"  # a failure releases the key
+
+        assert store._claim("test", "k3", request_hash({}), "another-worker")
+        try:
+            store.run("test", "k3", {}, lambda: "duplicate")
+        except RequestInProgress:
+            pass
+        else:
+            raise AssertionError("expected RequestInProgress")
+
+        expiring = IdempotencyStore(path, ttl=-1)
+        assert expiring.run("test", "k4", {}, lambda: "first") == "first"
+        assert expiring.run("test", "k4", {}, lambda: "second") == "second"  # expired keys are reusable
+        print("Idempotency: replay, key reuse, failure release, in-progress and expiry")
+    finally:
+        idempotency._store = saved_store
+
 def run_tests():
     print(verify_identity("user123", "passport"))
     print(initiate_ach_transfer("acc001", "acc002", 150.75))
@@ -10,6 +271,13 @@ def run_tests():
     token = tokenize_pan("4111111111111111")
     print("Token:", token)
     print("Original:", detokenize_pan(token))
+    assert detokenize_pan(token) == "4111111111111111"
+
+    run_idempotency_tests()
+    run_ach_tests()
+    run_ledger_tests()
+    run_tokenize_retry_tests()
+    run_vault_api_tests()
 
 if __name__ == "__main__":
     run_tests()
@@ -0,0 +1,78 @@
+import logging
+import os
+from typing import List
+from fastapi import APIRouter, Depends, HTTPException, Request
+from pydantic import BaseModel, Field
+from sqlalchemy.orm import Session
+
+from app import pan_vault
+from app.database import get_db
+from app.security import DETOKENIZE, LOOKUP, TOKENIZE, Client, enforce_rate, require_scope
+
+router = APIRouter(prefix="/vault")
+
+MAX_BATCH = 10000
+# Cleartext leaves the vault in much smaller batches than it comes in
+MAX_DETOKENIZE_BATCH = int(os.getenv("VAULT_MAX_DETOKENIZE_BATCH", "100"))
+
+# Who did what to how many cards; never PANs or tokens
+audit = logging.getLogger("app.vault.audit")
+
+class TokenizeRequest(BaseModel):
+    pans: List[str] = Field(..., max_length=MAX_BATCH)
+
+class DetokenizeRequest(BaseModel):
+    tokens: List[str] = Field(..., max_length=MAX_DETOKENIZE_BATCH)
+
+class LookupRequest(BaseModel):
+    pan: str
+
+def _audit(request: Request, client: Client, action: str, count: int, outcome: str):
+    audit.info("vault %s by %s from %s: %d item(s), %s", action, client.name,
+               request.client.host if request.client else "-", count, outcome)
+
+@router.post("/tokenize")
+def tokenize(req: TokenizeRequest, request: Request, db: Session = Depends(get_db),
+             client: Client = Depends(require_scope(TOKENIZE))):
+    try:
+        tokens = pan_vault.tokenize_many(db, req.pans)
+    except ValueError as e:
+        _audit(request, client, "tokenize", len(req.pans), "rejected")
+        raise HTTPException(status_code=400, detail=str(e))
+    _audit(request, client, "tokenize", len(req.pans), "ok")
+    return {"tokens": tokens}
+
+@router.post("/detokenize")
+def detokenize(req: DetokenizeRequest, request: Request, db: Session = Depends(get_db),
+               client: Client = Depends(require_scope(DETOKENIZE))):
+    # Charged before the lookup, so guessing tokens costs the same as
+    # detokenizing real ones
+    try:
+        enforce_rate(client, len(req.tokens))
+    except HTTPException:
+        _audit(request, client, "detokenize", len(req.tokens), "rate limited")
+        raise
+    try:
+        pans = pan_vault.detokenize_many(db, req.tokens)
+    except KeyError:
+        _audit(request, client, "detokenize", len(req.tokens), "unknown token")
+        raise HTTPException(status_code=404, detail="Unknown token")
+    _audit(request, client, "detokenize", len(req.tokens), "ok")
+    return {"pans": pans}
+
+@router.post("/lookup")
+def lookup(req: LookupRequest, request: Request, db: Session = Depends(get_db),
+           client: Client = Depends(require_scope(LOOKUP))):
+    # POST so the PAN never ends up in a URL or access log
+    try:
+        enforce_rate(client, 1)
+    except HTTPException:
+        _audit(request, client, "lookup", 1, "rate limited")
+        raise
+    try:
+        token = pan_vault.lookup_token(db, req.pan)
+    except ValueError as e:
+        _audit(request, client, "lookup", 1, "rejected")
+        raise HTTPException(status_code=400, detail=str(e))
+    _audit(request, client, "lookup", 1, "seen" if token is not None else "not seen")
+    return {"seen": token is not None, "token": token}
@@ -0,0 +1,106 @@
+# Ledger throughput: transfers/s by batch size and contention
+#
+# For each number of accounts (fewer accounts = more transfers touching the
+# same rows) and each batch size, --producers threads submit --transfers
+# random P2P transfers through a LedgerBatcher(max_batch=N). "direct" posts
+# each transfer from its own thread and session with post_transfer, so
+# writers compete for the database instead of queueing. Each run uses a
+# fresh SQLite file and ends with a trial balance check.
+#
+#   python bench_ledger.py --accounts 2 20 2000 --batch-sizes 1 10 100 500
+import argparse
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from app.ledger import InsufficientFunds, LedgerBatcher, open_account, post_transfer, post_transfers, trial_balance
+from app.models import Base
+
+def setup(path, accounts):
+    engine = create_engine(f"sqlite:///{path}", connect_args={"timeout": 30})
+    Base.metadata.create_all(engine)
+    Session = sessionmaker(bind=engine)
+    db = Session()
+    open_account(db, "funding", allow_negative=True)
+    for i in range(accounts):
+        open_account(db, f"user{i}")
+    post_transfers(db, [("funding", f"user{i}", 10 ** 9) for i in range(accounts)], kind="funding")
+    db.close()
+    return engine, Session
+
+def workload(accounts, count, seed):
+    rng = random.Random(seed)
+    pairs = []
+    for _ in range(count):
+        sender, receiver = rng.sample(range(accounts), 2)
+        pairs.append((f"user{sender}", f"user{receiver}", rng.randint(1, 10000)))
+    return pairs
+
+def run(accounts, batch_size, transfers, producers):
+    tmp = tempfile.mkdtemp()
+    path = os.path.join(tmp, "ledger.db")
+    engine, Session = setup(path, accounts)
+    chunks = [workload(accounts, transfers // producers, seed) for seed in range(producers)]
+
+    if batch_size == "direct":
+        def producer(chunk):
+            db = Session()
+            for sender, receiver, amount in chunk:
+                try:
+                    post_transfer(db, sender, receiver, amount)
+                except InsufficientFunds:
+                    pass
+            db.close()
+        batcher = None
+    else:
+        batcher = LedgerBatcher(Session, max_batch=batch_size)
+
+        def producer(chunk):
+            futures = [batcher.submit(*transfer) for transfer in chunk]
+            for future in futures:
+                future.result()
+
+    threads = [threading.Thread(target=producer, args=(chunk,)) for chunk in chunks]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+    if batcher is not None:
+        batcher.close()
+
+    db = Session()
+    balanced = trial_balance(db)["balanced"]
+    db.close()
+    engine.dispose()
+    for name in os.listdir(tmp):
+        os.remove(os.path.join(tmp, name))
+    os.rmdir(tmp)
+    return sum(len(chunk) for chunk in chunks) / elapsed, balanced
+
+def main():
+    parser = argparse.ArgumentParser(description="Double-entry ledger throughput")
+    parser.add_argument("--accounts", type=int, nargs="+", default=[2, 20, 2000])
+    parser.add_argument("--batch-sizes", nargs="+", default=["direct", "1", "10", "100", "500"])
+    parser.add_argument("--transfers", type=int, default=4000)
+    parser.add_argument("--producers", type=int, default=8)
+    args = parser.parse_args()
+
+    print(f"{'accounts':>8}  {'batch':>6}  {'transfers/s':>11}  balanced")
+    for accounts in args.accounts:
+        for batch_size in args.batch_sizes:
+            size = batch_size if batch_size == "direct" else int(batch_size)
+            rate, balanced = run(accounts, size, args.transfers, args.producers)
+            print(f"{accounts:>8}  {batch_size:>6}  {rate:>11,.0f}  {balanced}")
+
+if __name__ == "__main__":
+    main()
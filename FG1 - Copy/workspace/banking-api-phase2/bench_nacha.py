@@ -0,0 +1,107 @@
+# NACHA throughput: outbound file writing and inbound return parsing
+#
+# Writes a file of --entries outbound entries with AchBatcher, streamed
+# from generators as app.ach streams them from the database, then
+# generates an inbound return file of --returns entries (each with a 99
+# addenda) and streams it through iter_returns(), reporting entries/s,
+# MB/s and how much the process's peak RSS grew while parsing.
+#
+#   python bench_nacha.py --entries 1000000 --returns 2000000
+import argparse
+import datetime
+import os
+import resource
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from app.nacha import AchBatch, AchBatcher, AchEntry, iter_returns
+
+ROUTING = ["091000019", "021000021", "011000138", "121000358"]
+
+def peak_rss_mb():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+def write_returns(path, count, per_batch=100000):
+    # Return file: entries followed by addenda 99, with matching controls
+    with open(path, "w") as f:
+        f.write("101 091000019 0210000212610180000A094101" + " " * 54 + "\n")
+        records, batch_number, total_hash, total_credit = 1, 0, 0, 0
+        for start in range(0, count, per_batch):
+            batch_number += 1
+            n = min(per_batch, count - start)
+            f.write("5220RETURNS" + " " * 29 + "0000000000PPDRETURN    " + " " * 6 + "261019   1"
+                    + "09100001" + str(batch_number).rjust(7, "0") + "\n")
+            lines, batch_hash, credit = [], 0, 0
+            for i in range(start, start + n):
+                routing = ROUTING[i % 4]
+                trace = "09100001" + str(i % 10 ** 7).rjust(7, "0")
+                lines.append("621" + routing + str(i).ljust(17) + "0000001234" + "ID".ljust(15)
+                             + "RETURNED PAYEE".ljust(22) + "  1" + trace)
+                lines.append("799R01" + trace + " " * 6 + routing[:8] + "INSUFFICIENT FUNDS".ljust(44) + trace)
+                batch_hash += int(routing[:8])
+                credit += 1234
+                if len(lines) >= 2000:
+                    f.write("\n".join(lines) + "\n")
+                    lines.clear()
+            if lines:
+                f.write("\n".join(lines) + "\n")
+            f.write("8220" + str(2 * n).rjust(6, "0") + str(batch_hash % 10 ** 10).rjust(10, "0") + "0" * 12
+                    + str(credit).rjust(12, "0") + "0000000000" + " " * 25 + "09100001"
+                    + str(batch_number).rjust(7, "0") + "\n")
+            records += 2 * n + 2
+            total_hash += batch_hash
+            total_credit += credit
+        records += 1
+        blocks = -(-records // 10)
+        f.write("9" + str(batch_number).rjust(6, "0") + str(blocks).rjust(6, "0") + str(2 * count).rjust(8, "0")
+                + str(total_hash % 10 ** 10).rjust(10, "0") + "0" * 12 + str(total_credit).rjust(12, "0")
+                + " " * 39 + "\n")
+        f.write(("9" * 94 + "\n") * (blocks * 10 - records))
+
+def main():
+    parser = argparse.ArgumentParser(description="NACHA write/parse throughput")
+    parser.add_argument("--entries", type=int, default=1000000)
+    parser.add_argument("--returns", type=int, default=2000000)
+    args = parser.parse_args()
+    tmp = tempfile.mkdtemp()
+
+    batcher = AchBatcher("091000019", "021000021", "09100001", "BANKING API", "0000000000")
+
+    def entries(sec_code, effective_date, offset):
+        # Every fourth entry overall: one of the four (SEC code, date) batches
+        for i in range(offset, args.entries, 4):
+            yield AchEntry(ROUTING[i % 4], str(i), 100 + i % 5000, name="PAYEE", individual_id=str(i),
+                           transaction_code="22" if i % 3 else "27", sec_code=sec_code,
+                           effective_date=effective_date)
+    keys = [(sec_code, datetime.date(2026, 10, day)) for sec_code in ("CCD", "PPD") for day in (19, 20)]
+    batches = [AchBatch(sec_code, date, entries(sec_code, date, offset), service_class="200")
+               for offset, (sec_code, date) in enumerate(keys)]
+    out = os.path.join(tmp, "outbound.ach")
+    start = time.perf_counter()
+    with open(out, "w") as f:
+        written = batcher.write(f, batches)
+    assert written == args.entries
+    elapsed = time.perf_counter() - start
+    size = os.path.getsize(out) / 1e6
+    print(f"write  {args.entries:>9,} entries  {args.entries / elapsed:>9,.0f} entries/s  {size / elapsed:>6.1f} MB/s")
+
+    returns = os.path.join(tmp, "returns.ach")
+    write_returns(returns, args.returns)
+    size = os.path.getsize(returns) / 1e6
+    rss_before = peak_rss_mb()
+    start = time.perf_counter()
+    with open(returns) as f:
+        count = sum(1 for _ in iter_returns(f))
+    elapsed = time.perf_counter() - start
+    print(f"parse  {count:>9,} returns  {count / elapsed:>9,.0f} entries/s  {size / elapsed:>6.1f} MB/s  "
+          f"({size:,.0f} MB file, peak RSS +{peak_rss_mb() - rss_before:.0f} MB)")
+
+    os.remove(out)
+    os.remove(returns)
+    os.rmdir(tmp)
+
+if __name__ == "__main__":
+    main()
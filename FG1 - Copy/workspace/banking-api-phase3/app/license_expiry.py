@@ -0,0 +1,226 @@
+import asyncio
+import datetime
+import logging
+import os
+import time
+from sqlalchemy import func, inspect, literal_column, select, text, tuple_, update
+
+from app.database import SessionLocal, engine as default_engine
+from app.license_service import license_cache
+from app.models import License
+
+# Seconds between sweeps
+LICENSE_SWEEP_INTERVAL = float(os.getenv("LICENSE_SWEEP_INTERVAL", "3600"))
+# Licenses expiring within this many days get an expiring-soon notice
+LICENSE_NOTICE_DAYS = float(os.getenv("LICENSE_NOTICE_DAYS", "30"))
+# Rows read and marked per transaction, so the write lock is held briefly
+LICENSE_SWEEP_BATCH = int(os.getenv("LICENSE_SWEEP_BATCH", "1000"))
+# Seconds publish_to waits for room in a full webhook queue before leaving
+# the rest of a batch for the next sweep
+LICENSE_NOTIFY_TIMEOUT = float(os.getenv("LICENSE_NOTIFY_TIMEOUT", "30"))
+
+# Upper bounds (days from now) of the buckets reported by expiry_buckets;
+# everything beyond the last one is "later"
+EXPIRY_BUCKETS = (("within_7d", 7), ("within_30d", 30), ("within_90d", 90))
+
+# Rendered as a literal so SQLite can match it to ix_licenses_expiry_open
+_OPEN = License.expiry_state != literal_column("'expired'")
+
+logger = logging.getLogger(__name__)
+
+def ensure_expiry_schema(bind=default_engine):
+    """Add expiry_state and the expiry indexes to a licenses table created before them."""
+    inspector = inspect(bind)
+    if not inspector.has_table("licenses"):
+        License.__table__.create(bind)
+        return
+    columns = {column["name"] for column in inspector.get_columns("licenses")}
+    with bind.begin() as conn:
+        if "expiry_state" not in columns:
+            conn.execute(text("ALTER TABLE licenses ADD COLUMN expiry_state VARCHAR(8) NOT NULL DEFAULT 'active'"))
+        for index in License.__table__.indexes:
+            index.create(conn, checkfirst=True)
+
+def _mark(session, ids, from_state, to_state, before) -> list:
+    # Guarded so a license renewed since it was read (expiry moved out of
+    # range, state reset to "active") is left alone
+    marked = session.execute(
+        update(License)
+        .where(License.id.in_(ids), License.expiry_state == from_state, License.expiry < before)
+        .values(expiry_state=to_state)
+        .returning(License.id, License.user_id, License.license_key, License.expiry)
+    ).all()
+    session.commit()
+    return [{"id": id_, "user_id": user_id, "license_key": key, "expiry": expiry.isoformat()}
+            for id_, user_id, key, expiry in marked]
+
+def _unmark(session, ids, from_state, to_state) -> int:
+    # Hand licenses whose notice did not go out back to the next sweep
+    count = session.execute(
+        update(License)
+        .where(License.id.in_(ids), License.expiry_state == to_state)
+        .values(expiry_state=from_state)
+    ).rowcount
+    session.commit()
+    return count
+
+def _sweep_range(session_factory, from_states, to_state, start, before, batch_size, notify) -> int:
+    """Keyset scan of open licenses with start <= expiry < before, marking them `to_state` a batch at a time."""
+    marked, cursor = 0, None
+    with session_factory() as session:
+        while True:
+            query = (
+                select(License.id, License.expiry, License.expiry_state)
+                .where(_OPEN, License.expiry_state.in_(from_states), License.expiry < before)
+                .order_by(License.expiry, License.id)
+                .limit(batch_size)
+            )
+            if start is not None:
+                query = query.where(License.expiry >= start)
+            if cursor is not None:
+                query = query.where(tuple_(License.expiry, License.id) > cursor)
+            rows = session.execute(query).all()
+            session.rollback()  # end the read transaction before taking the write lock
+            if not rows:
+                return marked
+            cursor = (rows[-1].expiry, rows[-1].id)
+            for state in from_states:
+                ids = [row.id for row in rows if row.expiry_state == state]
+                if not ids:
+                    continue
+                done = _mark(session, ids, state, to_state, before)
+                marked += len(done)
+                if to_state == "expired":
+                    for item in done:
+                        license_cache.invalidate(item["license_key"])
+                if done and notify is not None:
+                    try:
+                        sent = notify("expired" if to_state == "expired" else "expiring", done)
+                    except BaseException:
+                        _unmark(session, [item["id"] for item in done], state, to_state)
+                        raise
+                    if sent is not None and sent < len(done):
+                        marked -= _unmark(session, [item["id"] for item in done[sent:]], state, to_state)
+            if len(rows) < batch_size:
+                return marked
+
+def sweep_expiring(session_factory=SessionLocal, notice_days: float = LICENSE_NOTICE_DAYS,
+                   batch_size: int = LICENSE_SWEEP_BATCH, notify=None, now: datetime.datetime = None) -> dict:
+    """
+    One pass over licenses that still need attention: those past their
+    expiry are marked "expired" and those expiring within `notice_days`
+    are marked "notified". `notify(kind, licenses)` is called after each
+    committed batch with kind "expired" or "expiring" and the licenses
+    just marked, so each license is reported once per state. If it
+    returns a count, only that many licenses (from the front) were sent;
+    the rest, like a batch whose notify raised, go back to their previous
+    state and are picked up again by the next sweep. Expired
+    licenses drop out of ix_licenses_expiry_open, so later sweeps only
+    read rows that are still open.
+    """
+    now = now or datetime.datetime.utcnow()
+    started = time.perf_counter()
+    expired = _sweep_range(session_factory, ("active", "notified"), "expired", None, now, batch_size, notify)
+    expiring = _sweep_range(session_factory, ("active",), "notified", now,
+                            now + datetime.timedelta(days=notice_days), batch_size, notify)
+    return {
+        "at": now.isoformat(),
+        "expired": expired,
+        "expiring": expiring,
+        "seconds": round(time.perf_counter() - started, 3),
+    }
+
+def expiry_buckets(session_factory=SessionLocal, now: datetime.datetime = None) -> dict:
+    """License counts by time to expiry: expired, each EXPIRY_BUCKETS range, and later."""
+    now = now or datetime.datetime.utcnow()
+    bounds = [now + datetime.timedelta(days=days) for _, days in EXPIRY_BUCKETS]
+    ranges = [("expired", None, now)]
+    lower = now
+    for (name, _), upper in zip(EXPIRY_BUCKETS, bounds):
+        ranges.append((name, lower, upper))
+        lower = upper
+    ranges.append(("later", lower, None))
+    counts = {}
+    # One range count per bucket; each is answered from ix_licenses_expiry
+    # without reading the table
+    with session_factory() as session:
+        for name, lower, upper in ranges:
+            query = select(func.count()).select_from(License)
+            if lower is not None:
+                query = query.where(License.expiry >= lower)
+            if upper is not None:
+                query = query.where(License.expiry < upper)
+            counts[name] = session.execute(query).scalar_one()
+    return counts
+
+def publish_to(delivery, timeout: float = LICENSE_NOTIFY_TIMEOUT):
+    """
+    A sweep `notify` that sends "license.expired" / "license.expiring"
+    events through a DeliveryEngine. A full endpoint queue holds the sweep
+    back (up to `timeout` seconds per event) instead of dropping events;
+    what still does not fit is reported back, and resent by a later sweep
+    under the same event id.
+    """
+    loop = asyncio.get_running_loop()
+
+    def notify(kind, licenses):
+        # Called on the sweep thread; the engine's queues belong to the loop
+        async def publish():
+            for sent, item in enumerate(licenses):
+                if not await delivery.put(f"license.{kind}", item, event_id=f"license_{item['id']}_{kind}",
+                                          timeout=timeout):
+                    return sent
+            return len(licenses)
+        return asyncio.run_coroutine_threadsafe(publish(), loop).result()
+    return notify
+
+class ExpirySweeper:
+    """
+    Runs sweep_expiring every `interval` seconds from an asyncio task.
+    The sweep itself runs in a worker thread, and commits a batch at a
+    time, so request handling carries on while it works. start() upgrades
+    the licenses table first even when `interval` is 0 (sweeping off).
+    """
+
+    def __init__(self, session_factory=SessionLocal, interval: float = LICENSE_SWEEP_INTERVAL,
+                 notice_days: float = LICENSE_NOTICE_DAYS, batch_size: int = LICENSE_SWEEP_BATCH,
+                 notify=None, bind=default_engine):
+        self.session_factory = session_factory
+        self.interval = interval
+        self.notice_days = notice_days
+        self.batch_size = batch_size
+        self.notify = notify
+        self.bind = bind
+        self.last_report = None
+        self._task = None
+
+    async def start(self):
+        # Always: models.License maps expiry_state and renew_license writes
+        # it, whether or not this process sweeps
+        await asyncio.to_thread(ensure_expiry_schema, self.bind)
+        if self.interval <= 0:
+            return
+        self._task = asyncio.create_task(self._run(), name="license-expiry-sweeper")
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def run_once(self) -> dict:
+        self.last_report = await asyncio.to_thread(
+            sweep_expiring, self.session_factory, self.notice_days, self.batch_size, self.notify
+        )
+        return self.last_report
+
+    async def _run(self):
+        while True:
+            try:
+                report = await self.run_once()
+                if report["expired"] or report["expiring"]:
+                    logger.info("License sweep: %(expired)d expired, %(expiring)d expiring soon (%(seconds)ss)",
+                                report)
+            except Exception:
+                logger.exception("License expiry sweep failed")
+            await asyncio.sleep(self.interval)
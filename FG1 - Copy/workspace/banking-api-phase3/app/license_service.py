@@ -1,18 +1,145 @@
 from app.models import License
 from app.database import SessionLocal
+from collections import OrderedDict
 import datetime
+import os
+import threading
+import time
+
+# Valid keys are re-read at least this often, so a license revoked or
+# shortened by another process is noticed within the TTL
+LICENSE_CACHE_TTL = float(os.getenv("LICENSE_CACHE_TTL", "300"))
+# Unknown and expired keys; also bounds how long another process's
+# create_license can go unseen here
+LICENSE_NEGATIVE_TTL = float(os.getenv("LICENSE_NEGATIVE_TTL", "30"))
+LICENSE_CACHE_SIZE = int(os.getenv("LICENSE_CACHE_SIZE", "100000"))
+# IN (...) lists are kept below SQLite's default bound-parameter limit
+BULK_CHUNK = 500
+
+VALID = {"status": "valid"}
+INVALID = {"status": "invalid or expired"}
+
+def _epoch(expiry: datetime.datetime) -> float:
+    # expiry is stored as naive UTC
+    return expiry.replace(tzinfo=datetime.timezone.utc).timestamp()
+
+class LicenseCache:
+    """
+    LRU of license check results, keyed by license key.
+
+    A valid key is cached until its `expiry` or for `ttl` seconds,
+    whichever comes first, so a hit never reports an expired license as
+    valid. Unknown and expired keys are cached as invalid for
+    `negative_ttl` seconds, so repeated checks of a bad key do not reach
+    the database either.
+    """
+
+    def __init__(self, max_size: int = LICENSE_CACHE_SIZE, ttl: float = LICENSE_CACHE_TTL,
+                 negative_ttl: float = LICENSE_NEGATIVE_TTL):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self._entries: OrderedDict[str, tuple[bool, float]] = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: str, now: float = None):
+        """True/False for a cached key, None on a miss."""
+        now = time.time() if now is None else now
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[1] <= now:
+                if entry is not None:
+                    del self._entries[key]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key: str, expiry: datetime.datetime = None, now: float = None) -> bool:
+        """Cache the result for `key` given its expiry (None if unknown); returns whether it is valid."""
+        now = time.time() if now is None else now
+        expires_at = _epoch(expiry) if expiry is not None else None
+        valid = expires_at is not None and expires_at > now
+        until = min(expires_at, now + self.ttl) if valid else now + self.negative_ttl
+        if self.max_size <= 0:
+            return valid
+        with self._lock:
+            self._entries[key] = (valid, until)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+        return valid
+
+    def invalidate(self, key: str):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"size": len(self._entries), "hits": self.hits, "misses": self.misses}
+
+license_cache = LicenseCache()
 
 def create_license(user_id: str, license_key: str):
-    session = SessionLocal()
-    license_obj = License(user_id=user_id, license_key=license_key,
-                          expiry=datetime.datetime.utcnow() + datetime.timedelta(days=365))
-    session.add(license_obj)
-    session.commit()
+    with SessionLocal() as session:
+        license_obj = License(user_id=user_id, license_key=license_key,
+                              expiry=datetime.datetime.utcnow() + datetime.timedelta(days=365))
+        session.add(license_obj)
+        session.commit()
+    # Drop a negative entry from an earlier check of this key
+    license_cache.invalidate(license_key)
     return {"status": "created", "license_key": license_key}
 
+def renew_license(license_key: str, days: int = 365):
+    """Extend a license by `days` from the later of now and its current expiry."""
+    with SessionLocal() as session:
+        license_obj = session.query(License).filter(License.license_key == license_key).one_or_none()
+        if license_obj is None:
+            return {"status": "not found", "license_key": license_key}
+        base = max(license_obj.expiry or datetime.datetime.utcnow(), datetime.datetime.utcnow())
+        license_obj.expiry = base + datetime.timedelta(days=days)
+        # Due for expiry notices again (see app.license_expiry)
+        license_obj.expiry_state = "active"
+        session.commit()
+        expiry = license_obj.expiry
+    license_cache.invalidate(license_key)
+    return {"status": "renewed", "license_key": license_key, "expiry": expiry.isoformat()}
+
 def check_license(license_key: str):
-    session = SessionLocal()
-    lic = session.query(License).filter(License.license_key == license_key).first()
-    if lic and lic.expiry > datetime.datetime.utcnow():
-        return {"status": "valid"}
-    return {"status": "invalid or expired"}
+    valid = license_cache.get(license_key)
+    if valid is None:
+        with SessionLocal() as session:
+            expiry = session.query(License.expiry).filter(License.license_key == license_key).scalar()
+        valid = license_cache.put(license_key, expiry)
+    return dict(VALID if valid else INVALID)
+
+def check_licenses(license_keys) -> dict:
+    """
+    Check many keys at once: cached keys are answered from memory and the
+    rest with one IN (...) query per BULK_CHUNK keys. Returns
+    {license_key: {"status": ...}}.
+    """
+    results, missing = {}, []
+    for key in dict.fromkeys(license_keys):
+        valid = license_cache.get(key)
+        if valid is None:
+            missing.append(key)
+        else:
+            results[key] = dict(VALID if valid else INVALID)
+    if missing:
+        with SessionLocal() as session:
+            for i in range(0, len(missing), BULK_CHUNK):
+                chunk = missing[i:i + BULK_CHUNK]
+                found = dict(
+                    session.query(License.license_key, License.expiry).filter(License.license_key.in_(chunk)).all()
+                )
+                for key in chunk:
+                    results[key] = dict(VALID if license_cache.put(key, found.get(key)) else INVALID)
+    return results
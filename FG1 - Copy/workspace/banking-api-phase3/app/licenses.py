@@ -0,0 +1,16 @@
+from fastapi import APIRouter
+from starlette.concurrency import run_in_threadpool
+from app.license_expiry import ExpirySweeper, expiry_buckets
+
+router = APIRouter(prefix="/licenses")
+
+# Marks expired and soon-to-expire licenses every LICENSE_SWEEP_INTERVAL
+# seconds; started from the app lifespan
+sweeper = ExpirySweeper()
+
+@router.get("/expiry")
+async def license_expiry():
+    return {
+        "buckets": await run_in_threadpool(expiry_buckets),
+        "last_sweep": sweeper.last_report,
+    }
@@ -1,9 +1,25 @@
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
-from app.webhooks import router as webhook_router
+from app.license_expiry import publish_to
+from app.licenses import router as license_router, sweeper
+from app.webhooks import delivery, pipeline, router as webhook_router
 
-app = FastAPI()
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    pipeline.start()
+    await delivery.start()
+    sweeper.notify = publish_to(delivery)
+    # Upgrades the licenses table, then sweeps unless LICENSE_SWEEP_INTERVAL is 0
+    await sweeper.start()
+    yield
+    await sweeper.stop()
+    await delivery.stop()
+    pipeline.stop()
+
+app = FastAPI(lifespan=lifespan)
 
 app.include_router(webhook_router)
+app.include_router(license_router)
 
 @app.get("/")
 def root():
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, DateTime
+from sqlalchemy import Column, Integer, String, DateTime, Index, text
 from sqlalchemy.ext.declarative import declarative_base
 import datetime
 
@@ -9,4 +9,17 @@ class License(Base):
     id = Column(Integer, primary_key=True, index=True)
     user_id = Column(String, index=True)
     license_key = Column(String, unique=True)
-    expiry = Column(DateTime, default=datetime.datetime.utcnow)
+    expiry = Column(DateTime, default=datetime.datetime.utcnow, index=True)
+    # "active", "notified" (expiring-soon notice sent) or "expired"; set by
+    # the sweeper in app.license_expiry
+    expiry_state = Column(String(8), nullable=False, default="active", server_default="active")
+
+    __table_args__ = (
+        # Only licenses the sweeper still has to look at; rows leave the
+        # index once marked expired, so sweeps do not rescan old expiries.
+        # (expiry, id) is the sweep's keyset order, and with expiry_state
+        # included its scan reads no table rows
+        Index("ix_licenses_expiry_open", "expiry", "id", "expiry_state",
+              sqlite_where=text("expiry_state != 'expired'"),
+              postgresql_where=text("expiry_state != 'expired'")),
+    )
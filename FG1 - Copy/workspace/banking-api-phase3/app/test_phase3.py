@@ -0,0 +1,288 @@
+import asyncio
+import datetime
+import json
+import os
+import tempfile
+import time
+
+# A throwaway SQLite database and webhook log unless one is configured
+os.environ.setdefault("DATABASE_URL", "sqlite:///" + os.path.join(tempfile.mkdtemp(), "phase3_test.db"))
+os.environ.setdefault("WEBHOOK_QUEUE_DB", os.path.join(tempfile.mkdtemp(), "webhooks_test.db"))
+os.environ.setdefault("WEBHOOK_SECRET", "s-inbound")
+
+import sqlite3
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine, inspect, text
+
+from app.database import SessionLocal, engine
+from app.license_expiry import ExpirySweeper, expiry_buckets, publish_to, sweep_expiring
+from app.license_service import check_license, check_licenses, create_license, license_cache, renew_license
+from app.models import Base, License
+from app.webhook_delivery import DeliveryEngine, Endpoint, transaction_status_changed
+from app.webhook_queue import (
+    SIGNATURE_HEADER, SIGNATURE_TOLERANCE, WEBHOOK_SECRETS, WebhookPipeline, requeue_dead_letter, sign,
+    verify_signature,
+)
+from app.webhooks import pipeline, router as webhook_router
+
+class StandInReceiver:
+    """
+    Minimal HTTP/1.1 keep-alive server standing in for a partner endpoint.
+    Answers `fail_first` requests with `fail_status`, then 200; counts TCP
+    connections so connection reuse can be checked.
+    """
+
+    def __init__(self, secret: str, fail_first: int = 0, fail_status: int = 503, delay: float = 0):
+        self.secret = secret
+        self.fail_first = fail_first
+        self.fail_status = fail_status
+        self.delay = delay
+        self.connections = self.requests = self.bad_signatures = 0
+        self.events = []
+
+    async def start(self):
+        self.server = await asyncio.start_server(self._handle, "127.0.0.1", 0)
+        self.url = f"http://127.0.0.1:{self.server.sockets[0].getsockname()[1]}/hooks"
+        return self
+
+    async def stop(self):
+        self.server.close()
+        await self.server.wait_closed()
+
+    async def _handle(self, reader, writer):
+        self.connections += 1
+        try:
+            while True:
+                head = (await reader.readuntil(b"\r\n\r\n")).decode("latin-1").split("\r\n")
+                headers = {k.lower(): v.strip() for k, _, v in (line.partition(":") for line in head[1:] if line)}
+                body = await reader.readexactly(int(headers.get("content-length", 0)))
+                self.requests += 1
+                if self.delay:
+                    await asyncio.sleep(self.delay)
+                if self.requests <= self.fail_first:
+                    status = self.fail_status
+                elif not verify_signature(body, headers.get(SIGNATURE_HEADER.lower()), secrets=[self.secret]):
+                    self.bad_signatures += 1
+                    status = 401
+                else:
+                    self.events.extend(json.loads(body)["events"])
+                    status = 200
+                writer.write(f"HTTP/1.1 {status} X\r\nContent-Type: application/json\r\n"
+                             f"Retry-After: 0\r\nContent-Length: 2\r\n\r\n{{}}".encode())
+                await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionResetError):
+            pass
+        finally:
+            writer.close()
+
+async def run_delivery_tests():
+    steady = await StandInReceiver("s-steady").start()
+    flaky = await StandInReceiver("s-flaky", fail_first=3).start()
+    rejecting = await StandInReceiver("s-reject", fail_first=10 ** 6, fail_status=400).start()
+    slow = await StandInReceiver("s-slow", delay=0.2).start()
+
+    engine = DeliveryEngine(backoff=0.01)
+    engine.add_endpoint(Endpoint("steady", steady.url, "s-steady", max_concurrency=4, batch_size=100))
+    engine.add_endpoint(Endpoint("flaky", flaky.url, "s-flaky",
+                                 events=frozenset({"transaction.status_changed"}), max_concurrency=1))
+    engine.add_endpoint(Endpoint("rejecting", rejecting.url, "s-reject",
+                                 events=frozenset({"transaction.status_changed"})))
+    engine.add_endpoint(Endpoint("slow", slow.url, "s-slow", events=frozenset({"transaction.status_changed"}),
+                                 max_concurrency=1, batch_size=1))
+    await engine.start()
+
+    start = time.perf_counter()
+    for i in range(5000):
+        engine.publish("ledger.posted", {"n": i})
+    for i in range(5):
+        transaction_status_changed(engine, i, "pending", "completed", amount="10.00")
+    while engine.destinations["steady"].queue.qsize() or engine.metrics()["steady"]["delivered"] < 5005:
+        await asyncio.sleep(0.01)
+    steady_elapsed = time.perf_counter() - start
+    slow_backlog = engine.metrics()["slow"]["delivered"] < 5
+    await engine.stop()
+
+    metrics = engine.metrics()
+    print(f"steady: {len(steady.events)} events in {steady.requests} requests over {steady.connections} "
+          f"connections, {len(steady.events) / steady_elapsed:,.0f} events/s", metrics["steady"])
+    print(f"flaky: {len(flaky.events)} delivered after {flaky.requests - 1} failed attempts", metrics["flaky"])
+    print(f"rejecting: {len(rejecting.events)} delivered, {len(engine.dead_letters)} dead letters",
+          metrics["rejecting"])
+    print(f"slow: {len(slow.events)} delivered, still sending when steady finished: {slow_backlog}", metrics["slow"])
+    assert len({e["id"] for e in steady.events}) == 5005 and steady.bad_signatures == 0
+    assert steady.connections <= 4
+    assert len(flaky.events) == 5 and metrics["flaky"]["retries"] == 3
+    assert metrics["rejecting"]["failed"] == 5 and metrics["rejecting"]["attempts"] == 1
+    assert slow_backlog and len(slow.events) == 5
+
+    for receiver in (steady, flaky, rejecting, slow):
+        await receiver.stop()
+
+def _wait_for(condition, timeout: float = 10):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.01)
+
+def run_webhook_tests():
+    app = FastAPI()
+    app.include_router(webhook_router)
+    client = TestClient(app)
+    secret = WEBHOOK_SECRETS[0]
+
+    def post(body: bytes, signature: str):
+        return client.post("/webhooks/event", content=body, headers={SIGNATURE_HEADER: signature})
+
+    body = json.dumps({"id": "evt_in_1", "type": "payment.settled"}).encode()
+    assert post(body, sign("not-the-secret", body)).status_code == 401
+    assert post(body, sign(secret, body, int(time.time()) - SIGNATURE_TOLERANCE - 60)).status_code == 401
+    no_id = json.dumps({"type": "payment.settled"}).encode()
+    assert post(no_id, sign(secret, no_id)).status_code == 400
+    assert post(body, sign(secret, body)).json() == {"status": "received"}
+    assert post(body, sign(secret, body)).json() == {"status": "duplicate"}
+    pipeline.stop()
+    print("receive_webhook: 401 on bad or stale signatures, 400 without an id, duplicates reported")
+
+    # A failing handler is retried, then dead-lettered after max_attempts; requeueing runs it again
+    path = os.path.join(tempfile.mkdtemp(), "dispatch.db")
+    calls, fixed = [], []
+    inbound = WebhookPipeline(path, workers=2, max_attempts=3, backoff=0.01, poll_interval=0.01)
+
+    @inbound.handler("invoice.paid")
+    def flaky(event):
+        calls.append(event["id"])
+        if not fixed:
+            raise RuntimeError("downstream unavailable")
+
+    inbound.start()
+    event = json.dumps({"id": "evt_a"}).encode()
+    assert asyncio.run(inbound.accept("evt_a", "invoice.paid", event))
+    assert not asyncio.run(inbound.accept("evt_a", "invoice.paid", event))  # EventLog drops the repeat
+    _wait_for(lambda: inbound.stats()["dead_letters"] == 1)
+    assert calls == ["evt_a"] * 3
+    conn = sqlite3.connect(path)
+    assert conn.execute("SELECT event_id, attempts FROM webhook_dead_letters").fetchall() == [("evt_a", 3)]
+    assert conn.execute("SELECT status FROM webhook_events WHERE event_id = 'evt_a'").fetchone() == ("dead",)
+    conn.close()
+
+    fixed.append(True)
+    assert requeue_dead_letter(path, "evt_a")
+    assert not requeue_dead_letter(path, "evt_a")  # no longer dead
+    _wait_for(lambda: inbound.stats().get("done") == 1)
+    assert inbound.stats() == {"done": 1, "dead_letters": 0} and calls == ["evt_a"] * 4
+    inbound.stop()
+    print("Dispatcher: 3 attempts, dead letter, requeued and handled")
+
+def run_license_tests():
+    Base.metadata.create_all(bind=engine)
+    license_cache.clear()
+    print(check_license("LIC-NEW"))  # unknown: cached as invalid
+    print(create_license("user1", "LIC-NEW"))
+    print(check_license("LIC-NEW"))  # create_license dropped the negative entry
+    assert check_license("LIC-NEW")["status"] == "valid"
+
+    with SessionLocal() as session:
+        session.add(License(user_id="user2", license_key="LIC-OLD",
+                            expiry=datetime.datetime.utcnow() - datetime.timedelta(days=1)))
+        session.add_all([License(user_id=f"bulk{i}", license_key=f"LIC-{i}",
+                                 expiry=datetime.datetime.utcnow() + datetime.timedelta(days=30))
+                         for i in range(2000)])
+        session.commit()
+    license_cache.clear()
+    keys = [f"LIC-{i}" for i in range(2000)] + ["LIC-OLD", "LIC-MISSING"]
+    results = check_licenses(keys)
+    print("bulk:", sum(r["status"] == "valid" for r in results.values()), "valid of", len(results),
+          "| LIC-OLD:", results["LIC-OLD"], "| LIC-MISSING:", results["LIC-MISSING"])
+    assert sum(r["status"] == "valid" for r in results.values()) == 2000
+
+    start = time.perf_counter()
+    for _ in range(10000):
+        check_license("LIC-7")
+    cached = (time.perf_counter() - start) / 10000
+    start = time.perf_counter()
+    for i in range(200):
+        license_cache.invalidate("LIC-7")
+        check_license("LIC-7")
+    uncached = (time.perf_counter() - start) / 200
+    print(f"check_license: {cached * 1e6:.1f} us cached, {uncached * 1e6:.0f} us from the database",
+          license_cache.stats())
+
+async def run_expiry_tests():
+    now = datetime.datetime.utcnow()
+    with SessionLocal() as session:
+        session.query(License).delete()
+        session.add_all([License(user_id=f"exp{i}", license_key=f"EXP-{i}",
+                                 expiry=now + datetime.timedelta(days=days))
+                         for i, days in enumerate([-400, -2, -0.5, 3, 6, 20, 45, 200] * 300)])
+        session.commit()
+    buckets = expiry_buckets()
+    print("buckets:", buckets)
+    assert buckets == {"expired": 900, "within_7d": 600, "within_30d": 300, "within_90d": 300, "later": 300}
+
+    notices = []
+    report = sweep_expiring(batch_size=250, notify=lambda kind, items: notices.append((kind, len(items))))
+    print("first sweep:", report)
+    assert report["expired"] == 900 and report["expiring"] == 900
+    assert sum(n for kind, n in notices if kind == "expired") == 900
+    again = sweep_expiring(batch_size=250)
+    print("second sweep:", again)
+    assert again["expired"] == 0 and again["expiring"] == 0
+
+    # A renewed license is out of the notice window and due notices again
+    print(renew_license("EXP-3"))
+    later = sweep_expiring(now=now + datetime.timedelta(days=400))
+    print("sweep 400 days on:", later)
+    assert later["expired"] == 1500 and later["expiring"] == 0
+    assert check_license("EXP-3")["status"] == "valid" and check_license("EXP-1")["status"] != "valid"
+
+    # Sweeping off still upgrades a licenses table from before expiry_state
+    legacy = create_engine("sqlite:///" + os.path.join(tempfile.mkdtemp(), "legacy.db"))
+    with legacy.begin() as conn:
+        conn.execute(text("CREATE TABLE licenses (id INTEGER PRIMARY KEY, user_id VARCHAR,"
+                          " license_key VARCHAR UNIQUE, expiry DATETIME)"))
+    idle = ExpirySweeper(interval=0, bind=legacy)
+    await idle.start()
+    assert idle._task is None
+    assert "expiry_state" in {c["name"] for c in inspect(legacy).get_columns("licenses")}
+    assert "ix_licenses_expiry_open" in {i["name"] for i in inspect(legacy).get_indexes("licenses")}
+    await idle.stop()
+
+    sweeper = ExpirySweeper(interval=0.05)
+    await sweeper.start()
+    await asyncio.sleep(0.2)
+    await sweeper.stop()
+    print("scheduled sweeper:", sweeper.last_report)
+    assert sweeper.last_report is not None
+
+    # A full webhook queue holds licenses back for the next sweep rather than losing their notices
+    with SessionLocal() as session:
+        session.query(License).delete()
+        session.add_all([License(user_id=f"bp{i}", license_key=f"BP-{i}", expiry=now - datetime.timedelta(days=1))
+                         for i in range(5)])
+        session.commit()
+    receiver = await StandInReceiver("s-bp").start()
+    delivery = DeliveryEngine(backoff=0.01)
+    delivery.add_endpoint(Endpoint("partner", receiver.url, "s-bp", events=frozenset({"license.expired"}),
+                                   max_queue=2))
+    # Not started yet, so nothing drains the queue
+    report = await asyncio.to_thread(sweep_expiring, notify=publish_to(delivery, timeout=0.05))
+    print("sweep into a full queue:", report, delivery.metrics()["partner"])
+    assert report["expired"] == 2 and delivery.metrics()["partner"]["backlog"] == 2
+    with SessionLocal() as session:
+        assert session.query(License).filter(License.expiry_state == "expired").count() == 2
+    await delivery.start()
+    report = await asyncio.to_thread(sweep_expiring, notify=publish_to(delivery, timeout=5))
+    await delivery.stop()
+    await receiver.stop()
+    assert report["expired"] == 3
+    assert sorted(e["data"]["license_key"] for e in receiver.events) == [f"BP-{i}" for i in range(5)]
+
+def run_tests():
+    run_license_tests()
+    asyncio.run(run_expiry_tests())
+    asyncio.run(run_delivery_tests())
+    run_webhook_tests()
+
+if __name__ == "__main__":
+    run_tests()
@@ -0,0 +1,275 @@
+import asyncio
+import json
+import logging
+import os
+import random
+import time
+import uuid
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Optional
+import httpx
+
+from app.webhook_queue import SIGNATURE_HEADER, sign
+
+# JSON list of {"name", "url", "secret", "events" (optional list of types),
+# "max_concurrency", "batch_size"}; loaded by DeliveryEngine.from_env()
+WEBHOOK_ENDPOINTS = os.getenv("WEBHOOK_ENDPOINTS", "[]")
+DELIVERY_MAX_CONNECTIONS = int(os.getenv("WEBHOOK_DELIVERY_MAX_CONNECTIONS", "100"))
+DELIVERY_TIMEOUT = float(os.getenv("WEBHOOK_DELIVERY_TIMEOUT", "10"))
+DELIVERY_MAX_ATTEMPTS = int(os.getenv("WEBHOOK_DELIVERY_MAX_ATTEMPTS", "8"))
+# Statuses worth retrying; any other 4xx means the receiver rejected the batch
+RETRYABLE_STATUS = {408, 425, 429, 500, 502, 503, 504}
+
+logger = logging.getLogger(__name__)
+
+@dataclass
+class Endpoint:
+    name: str
+    url: str
+    secret: str
+    events: Optional[frozenset] = None  # event types to send; None = all
+    max_concurrency: int = 4  # batches in flight to this destination
+    batch_size: int = 100
+    batch_wait: float = 0.01  # seconds to wait for more events before sending a short batch
+    max_queue: int = 10000
+
+    def wants(self, event_type: str) -> bool:
+        return self.events is None or event_type in self.events
+
+@dataclass
+class EndpointStats:
+    queued: int = 0
+    delivered: int = 0
+    batches: int = 0
+    attempts: int = 0
+    retries: int = 0
+    failed: int = 0  # events given up on (in dead_letters)
+    dropped: int = 0  # events refused because the queue was full
+    latencies: deque = field(default_factory=lambda: deque(maxlen=10000))  # publish -> acknowledged, seconds
+
+    def snapshot(self, backlog: int) -> dict:
+        latencies = sorted(self.latencies)
+
+        def pct(p):
+            return round(latencies[min(len(latencies) - 1, int(len(latencies) * p))] * 1000, 2) if latencies else None
+        return {
+            "backlog": backlog,
+            "queued": self.queued,
+            "delivered": self.delivered,
+            "batches": self.batches,
+            "attempts": self.attempts,
+            "retries": self.retries,
+            "failed": self.failed,
+            "dropped": self.dropped,
+            "latency_ms_p50": pct(0.5),
+            "latency_ms_p99": pct(0.99),
+        }
+
+class _Destination:
+    def __init__(self, endpoint: Endpoint):
+        self.endpoint = endpoint
+        self.queue = asyncio.Queue(endpoint.max_queue)
+        self.stats = EndpointStats()
+        self.tasks = []
+
+class DeliveryEngine:
+    """
+    Outbound webhooks, delivered from the event loop.
+
+    Each endpoint has its own bounded queue and `max_concurrency` sender
+    tasks, so a slow or failing partner only holds up its own events. A
+    sender takes up to `batch_size` queued events (waiting `batch_wait`
+    for a batch to fill) and POSTs them as {"events": [...]}, signed like
+    inbound webhooks (X-Webhook-Signature). All endpoints share one
+    httpx.AsyncClient, whose pool keeps connections alive between
+    batches. Network errors, timeouts and 408/429/5xx are retried with
+    exponential backoff and full jitter (honouring Retry-After); after
+    `max_attempts`, or on any other 4xx, the batch goes to dead_letters.
+    Events to one endpoint can arrive out of order when max_concurrency
+    is above one; each carries its id and creation time.
+    """
+
+    def __init__(self, client: httpx.AsyncClient = None, max_attempts: int = DELIVERY_MAX_ATTEMPTS,
+                 backoff: float = 0.5, max_backoff: float = 60, dead_letter_size: int = 10000):
+        self.client = client
+        self.max_attempts = max_attempts
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.destinations = {}
+        self.dead_letters = deque(maxlen=dead_letter_size)
+        self._owns_client = client is None
+        self._running = False
+
+    @classmethod
+    def from_env(cls, raw: str = WEBHOOK_ENDPOINTS) -> "DeliveryEngine":
+        engine = cls()
+        for item in json.loads(raw):
+            events = item.pop("events", None)
+            engine.add_endpoint(Endpoint(events=frozenset(events) if events else None, **item))
+        return engine
+
+    def add_endpoint(self, endpoint: Endpoint):
+        destination = _Destination(endpoint)
+        self.destinations[endpoint.name] = destination
+        if self._running:
+            self._spawn(destination)
+
+    async def start(self):
+        if self.client is None:
+            self.client = httpx.AsyncClient(
+                timeout=DELIVERY_TIMEOUT,
+                limits=httpx.Limits(max_connections=DELIVERY_MAX_CONNECTIONS,
+                                    max_keepalive_connections=DELIVERY_MAX_CONNECTIONS),
+            )
+        self._running = True
+        for destination in self.destinations.values():
+            self._spawn(destination)
+
+    async def stop(self, drain_timeout: float = 10):
+        """Give queued events up to `drain_timeout` seconds to go out, then stop the senders."""
+        try:
+            await asyncio.wait_for(
+                asyncio.gather(*(d.queue.join() for d in self.destinations.values())), drain_timeout
+            )
+        except asyncio.TimeoutError:
+            logger.warning("Stopping webhook delivery with events still queued")
+        self._running = False
+        for destination in self.destinations.values():
+            for task in destination.tasks:
+                task.cancel()
+            await asyncio.gather(*destination.tasks, return_exceptions=True)
+            destination.tasks = []
+        if self._owns_client and self.client is not None:
+            await self.client.aclose()
+            self.client = None
+
+    @staticmethod
+    def _event(event_type: str, data: dict, event_id: str = None) -> dict:
+        return {
+            "id": event_id or f"evt_{uuid.uuid4().hex}",
+            "type": event_type,
+            "created": int(time.time()),
+            "data": data,
+        }
+
+    def publish(self, event_type: str, data: dict, event_id: str = None) -> int:
+        """Queue an event for every endpoint subscribed to `event_type`; returns how many took it."""
+        event = self._event(event_type, data, event_id)
+        now = time.monotonic()
+        accepted = 0
+        for destination in self.destinations.values():
+            if not destination.endpoint.wants(event_type):
+                continue
+            try:
+                destination.queue.put_nowait((now, event))
+            except asyncio.QueueFull:
+                destination.stats.dropped += 1
+                continue
+            destination.stats.queued += 1
+            accepted += 1
+        return accepted
+
+    async def put(self, event_type: str, data: dict, event_id: str = None, timeout: float = None) -> bool:
+        """
+        Like publish, but waits up to `timeout` seconds for room in a full
+        queue instead of dropping the event at once. Returns False if some
+        subscribed endpoint's queue stayed full; endpoints that took the
+        event keep it, so a retry should reuse `event_id`.
+        """
+        event = self._event(event_type, data, event_id)
+        now = time.monotonic()
+        taken = True
+        for destination in self.destinations.values():
+            if not destination.endpoint.wants(event_type):
+                continue
+            try:
+                await asyncio.wait_for(destination.queue.put((now, event)), timeout)
+            except asyncio.TimeoutError:
+                destination.stats.dropped += 1
+                taken = False
+                continue
+            destination.stats.queued += 1
+        return taken
+
+    def metrics(self) -> dict:
+        return {name: d.stats.snapshot(d.queue.qsize()) for name, d in self.destinations.items()}
+
+    def _spawn(self, destination: _Destination):
+        destination.tasks = [
+            asyncio.create_task(self._sender(destination), name=f"webhook-delivery-{destination.endpoint.name}")
+            for _ in range(destination.endpoint.max_concurrency)
+        ]
+
+    async def _sender(self, destination: _Destination):
+        endpoint, queue = destination.endpoint, destination.queue
+        while True:
+            batch = [await queue.get()]
+            deadline = time.monotonic() + endpoint.batch_wait
+            while len(batch) < endpoint.batch_size:
+                if not queue.empty():
+                    batch.append(queue.get_nowait())
+                    continue
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(queue.get(), remaining))
+                except asyncio.TimeoutError:
+                    break
+            try:
+                await self._deliver(destination, batch)
+            finally:
+                for _ in batch:
+                    queue.task_done()
+
+    async def _deliver(self, destination: _Destination, batch: list):
+        endpoint, stats = destination.endpoint, destination.stats
+        body = json.dumps({"events": [event for _, event in batch]}, separators=(",", ":")).encode()
+        error = None
+        for attempt in range(self.max_attempts):
+            if attempt:
+                stats.retries += 1
+            stats.attempts += 1
+            retry_after = None
+            try:
+                response = await self.client.post(endpoint.url, content=body, headers={
+                    "Content-Type": "application/json",
+                    SIGNATURE_HEADER: sign(endpoint.secret, body),
+                })
+            except httpx.HTTPError as exc:
+                error = f"{type(exc).__name__}: {exc}"
+            else:
+                if response.is_success:
+                    now = time.monotonic()
+                    stats.delivered += len(batch)
+                    stats.batches += 1
+                    stats.latencies.extend(now - queued_at for queued_at, _ in batch)
+                    return
+                error = f"HTTP {response.status_code}"
+                if response.status_code not in RETRYABLE_STATUS:
+                    break
+                retry_after = _retry_after(response.headers.get("Retry-After"))
+            if attempt < self.max_attempts - 1:
+                delay = random.uniform(0, min(self.max_backoff, self.backoff * 2 ** attempt))
+                await asyncio.sleep(max(delay, retry_after or 0))
+
+        logger.warning("Giving up on %d events to %s: %s", len(batch), endpoint.name, error)
+        stats.failed += len(batch)
+        self.dead_letters.extend((endpoint.name, event, error) for _, event in batch)
+
+def _retry_after(value: Optional[str]) -> Optional[float]:
+    try:
+        return min(float(value), 300.0) if value else None
+    except ValueError:
+        return None
+
+def transaction_status_changed(engine: DeliveryEngine, transaction_id, old_status: str, new_status: str,
+                               **details) -> int:
+    """Publish a "transaction.status_changed" event, e.g. when a pending transaction completes."""
+    return engine.publish("transaction.status_changed", {
+        "transaction_id": transaction_id,
+        "previous_status": old_status,
+        "status": new_status,
+        **details,
+    })
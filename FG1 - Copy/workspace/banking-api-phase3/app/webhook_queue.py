@@ -0,0 +1,396 @@
+import asyncio
+import hashlib
+import hmac
+import json
+import logging
+import os
+import queue
+import random
+import sqlite3
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+
+# Shared secret(s) for inbound signatures; comma-separated during rotation
+WEBHOOK_SECRETS = [s for s in os.getenv("WEBHOOK_SECRET", "").split(",") if s]
+SIGNATURE_HEADER = "X-Webhook-Signature"
+SIGNATURE_TOLERANCE = int(os.getenv("WEBHOOK_TOLERANCE", "300"))  # seconds of clock skew / replay window
+WEBHOOK_QUEUE_DB = os.getenv("WEBHOOK_QUEUE_DB", "webhooks.db")
+WEBHOOK_WORKERS = int(os.getenv("WEBHOOK_WORKERS", "4"))
+WEBHOOK_MAX_ATTEMPTS = int(os.getenv("WEBHOOK_MAX_ATTEMPTS", "5"))
+WEBHOOK_RETRY_BACKOFF = float(os.getenv("WEBHOOK_RETRY_BACKOFF", "1"))  # seconds, doubled per attempt
+# Processed event ids are kept this long so partner retries are dropped as duplicates
+WEBHOOK_DEDUPE_SECONDS = int(os.getenv("WEBHOOK_DEDUPE_SECONDS", str(7 * 24 * 60 * 60)))
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS webhook_events (
+    seq INTEGER PRIMARY KEY,
+    event_id TEXT NOT NULL UNIQUE,
+    event_type TEXT NOT NULL,
+    body BLOB NOT NULL,
+    received_at REAL NOT NULL,
+    status TEXT NOT NULL DEFAULT 'pending',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    next_attempt_at REAL NOT NULL,
+    locked_until REAL,
+    processed_at REAL,
+    last_error TEXT
+);
+CREATE INDEX IF NOT EXISTS ix_webhook_events_status_next ON webhook_events (status, next_attempt_at);
+CREATE INDEX IF NOT EXISTS ix_webhook_events_status_processed ON webhook_events (status, processed_at);
+CREATE TABLE IF NOT EXISTS webhook_dead_letters (
+    seq INTEGER PRIMARY KEY,
+    event_id TEXT NOT NULL,
+    event_type TEXT NOT NULL,
+    body BLOB NOT NULL,
+    attempts INTEGER NOT NULL,
+    last_error TEXT,
+    failed_at REAL NOT NULL
+);
+"""
+
+def sign(secret: str, body: bytes, timestamp: int = None) -> str:
+    """Signature header value for `body`: "t=<unix time>,v1=<hex HMAC-SHA256 of 't.body'>"."""
+    timestamp = int(time.time()) if timestamp is None else timestamp
+    digest = hmac.new(secret.encode(), f"{timestamp}.".encode() + body, hashlib.sha256).hexdigest()
+    return f"t={timestamp},v1={digest}"
+
+def verify_signature(body: bytes, header: str, secrets=None, tolerance: int = SIGNATURE_TOLERANCE,
+                     now: float = None) -> bool:
+    """
+    Check a signature header against every configured secret, in constant
+    time. The timestamp is signed too, and must be within `tolerance`
+    seconds, so a captured request cannot be replayed later.
+    """
+    secrets = WEBHOOK_SECRETS if secrets is None else secrets
+    if not header or not secrets:
+        return False
+    fields = {}
+    for part in header.split(","):
+        name, _, value = part.strip().partition("=")
+        fields.setdefault(name, []).append(value)
+    try:
+        timestamp = int(fields["t"][0])
+    except (KeyError, ValueError):
+        return False
+    now = time.time() if now is None else now
+    if abs(now - timestamp) > tolerance:
+        return False
+    for secret in secrets:
+        expected = sign(secret, body, timestamp).split("v1=", 1)[1]
+        if any(hmac.compare_digest(expected, candidate) for candidate in fields.get("v1", [])):
+            return True
+    return False
+
+def _connect(path: str, synchronous: str) -> sqlite3.Connection:
+    conn = sqlite3.connect(path, timeout=30, isolation_level=None, check_same_thread=False)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute(f"PRAGMA synchronous={synchronous}")
+    return conn
+
+class EventLog:
+    """
+    Durable append log for received events, in SQLite (WAL).
+
+    append() hands the event to one writer thread, which drains everything
+    queued (up to `max_batch`), inserts it in one transaction with
+    synchronous=FULL and resolves the callers' futures after the commit.
+    An acknowledged event is therefore on disk, and the fsync is shared by
+    the whole burst (group commit). Events whose id is already in the log
+    are ignored and reported as duplicates.
+    """
+
+    def __init__(self, path: str = WEBHOOK_QUEUE_DB, max_batch: int = 2000, on_commit=None):
+        self.path = path
+        self.max_batch = max_batch
+        self.on_commit = on_commit
+        self._conn = _connect(path, "FULL")
+        self._conn.executescript(SCHEMA)
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._run, name="webhook-log", daemon=True)
+        self._thread.start()
+
+    def append(self, event_id: str, event_type: str, body: bytes) -> Future:
+        """Future resolving to True once stored, False if `event_id` was seen before."""
+        future = Future()
+        self._queue.put((event_id, event_type, body, future))
+        return future
+
+    async def append_async(self, event_id: str, event_type: str, body: bytes) -> bool:
+        return await asyncio.wrap_future(self.append(event_id, event_type, body))
+
+    def close(self):
+        self._queue.put(None)
+        self._thread.join()
+        self._conn.close()
+
+    def _run(self):
+        stopping = False
+        while not stopping:
+            item = self._queue.get()
+            if item is None:
+                break
+            batch = [item]
+            while len(batch) < self.max_batch:
+                try:
+                    item = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if item is None:
+                    stopping = True
+                    break
+                batch.append(item)
+            self._write(batch)
+
+    def _write(self, batch):
+        now = time.time()
+        try:
+            self._conn.execute("BEGIN")
+            stored = [
+                self._conn.execute(
+                    "INSERT OR IGNORE INTO webhook_events (event_id, event_type, body, received_at, next_attempt_at) "
+                    "VALUES (?, ?, ?, ?, ?)",
+                    (event_id, event_type, body, now, now),
+                ).rowcount == 1
+                for event_id, event_type, body, _ in batch
+            ]
+            self._conn.execute("COMMIT")
+        except Exception as exc:
+            if self._conn.in_transaction:
+                self._conn.execute("ROLLBACK")
+            for *_, future in batch:
+                future.set_exception(exc)
+            return
+        for (*_, future), new in zip(batch, stored):
+            future.set_result(new)
+        if self.on_commit is not None and any(stored):
+            self.on_commit()
+
+class Dispatcher:
+    """
+    Delivers logged events to handlers on a bounded thread pool.
+
+    Due events are claimed with one UPDATE ... RETURNING (status
+    'pending' -> 'processing'), never more than the pool has free slots,
+    so a burst waits in the log rather than in memory. A handler that
+    raises is retried with exponential backoff and jitter; after
+    `max_attempts` the event moves to webhook_dead_letters. Outcomes are
+    written back in one transaction per cycle. Claims left behind by a
+    crashed process go back to 'pending' once `lock_timeout` passes.
+    """
+
+    def __init__(self, path: str = WEBHOOK_QUEUE_DB, handlers: dict = None, workers: int = WEBHOOK_WORKERS,
+                 max_attempts: int = WEBHOOK_MAX_ATTEMPTS, backoff: float = WEBHOOK_RETRY_BACKOFF,
+                 lock_timeout: float = 60, poll_interval: float = 0.25, dedupe_seconds: int = WEBHOOK_DEDUPE_SECONDS):
+        self.handlers = handlers if handlers is not None else {}
+        self.workers = workers
+        self.max_attempts = max_attempts
+        self.backoff = backoff
+        self.lock_timeout = lock_timeout
+        self.poll_interval = poll_interval
+        self.dedupe_seconds = dedupe_seconds
+        # Outcomes can be lost on power failure; the claim then expires and
+        # the event is delivered again, which handlers must tolerate anyway
+        self._conn = _connect(path, "NORMAL")
+        self._conn.executescript(SCHEMA)
+        self._pool = ThreadPoolExecutor(workers, thread_name_prefix="webhook-worker")
+        self._outcomes = queue.Queue()
+        self._in_flight = 0
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+        self._last_sweep = 0.0
+
+    def handler(self, event_type: str):
+        """Register a handler for `event_type` ("*" catches types with no handler of their own)."""
+        def decorator(fn):
+            self.handlers[event_type] = fn
+            return fn
+        return decorator
+
+    def wake(self):
+        self._wake.set()
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="webhook-dispatcher", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Stop claiming, let in-flight handlers finish and record their outcomes."""
+        self._stop.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join()
+        self._pool.shutdown(wait=True)
+        self._record_outcomes()
+        self._conn.close()
+
+    def _run(self):
+        while not self._stop.is_set():
+            if not self.run_once():
+                self._wake.wait(self.poll_interval)
+                self._wake.clear()
+
+    def run_once(self) -> int:
+        """One cycle: record finished events, sweep if due, claim and submit more. Returns events claimed."""
+        self._record_outcomes()
+        now = time.time()
+        if now - self._last_sweep >= 60:
+            self._sweep(now)
+        free = self.workers * 2 - self._in_flight
+        if free <= 0:
+            return 0
+        rows = self._conn.execute(
+            "UPDATE webhook_events SET status = 'processing', locked_until = :lock "
+            "WHERE seq IN (SELECT seq FROM webhook_events WHERE status = 'pending' AND next_attempt_at <= :now "
+            "ORDER BY next_attempt_at LIMIT :limit) "
+            "RETURNING seq, event_id, event_type, body, attempts",
+            {"now": now, "lock": now + self.lock_timeout, "limit": free},
+        ).fetchall()
+        for row in rows:
+            self._in_flight += 1
+            future = self._pool.submit(self._deliver, row)
+            future.row = row
+            future.add_done_callback(self._finished)
+        return len(rows)
+
+    def _deliver(self, row):
+        seq, event_id, event_type, body, attempts = row
+        handler = self.handlers.get(event_type) or self.handlers.get("*")
+        if handler is None:
+            raise LookupError(f"No handler for event type {event_type!r}")
+        handler(json.loads(body))
+
+    def _finished(self, future: Future):
+        self._outcomes.put(future)
+        self._wake.set()
+
+    def _record_outcomes(self):
+        done, failed = [], []
+        while True:
+            try:
+                future = self._outcomes.get_nowait()
+            except queue.Empty:
+                break
+            self._in_flight -= 1
+            row = future.row
+            error = future.exception()
+            if error is None:
+                done.append(row)
+            else:
+                failed.append((row, f"{type(error).__name__}: {error}"))
+        if not done and not failed:
+            return
+
+        now = time.time()
+        conn = self._conn
+        conn.execute("BEGIN")
+        conn.executemany(
+            "UPDATE webhook_events SET status = 'done', processed_at = ?, locked_until = NULL, last_error = NULL "
+            "WHERE seq = ?",
+            [(now, row[0]) for row in done],
+        )
+        for row, error in failed:
+            seq, event_id, event_type, body, attempts = row
+            attempts += 1
+            if attempts >= self.max_attempts:
+                logger.warning("Webhook %s dead-lettered after %d attempts: %s", event_id, attempts, error)
+                conn.execute(
+                    "INSERT INTO webhook_dead_letters (event_id, event_type, body, attempts, last_error, failed_at) "
+                    "VALUES (?, ?, ?, ?, ?, ?)",
+                    (event_id, event_type, body, attempts, error, now),
+                )
+                conn.execute(
+                    "UPDATE webhook_events SET status = 'dead', attempts = ?, last_error = ?, locked_until = NULL, "
+                    "processed_at = ? WHERE seq = ?",
+                    (attempts, error, now, seq),
+                )
+            else:
+                delay = self.backoff * 2 ** (attempts - 1) * (0.5 + random.random())
+                conn.execute(
+                    "UPDATE webhook_events SET status = 'pending', attempts = ?, last_error = ?, "
+                    "next_attempt_at = ?, locked_until = NULL WHERE seq = ?",
+                    (attempts, error, now + delay, seq),
+                )
+        conn.execute("COMMIT")
+
+    def _sweep(self, now: float):
+        self._last_sweep = now
+        self._conn.execute(
+            "UPDATE webhook_events SET status = 'pending', locked_until = NULL "
+            "WHERE status = 'processing' AND locked_until < ?", (now,)
+        )
+        self._conn.execute(
+            "DELETE FROM webhook_events WHERE status IN ('done', 'dead') AND processed_at < ?",
+            (now - self.dedupe_seconds,),
+        )
+
+class WebhookPipeline:
+    """
+    Inbound webhooks: the endpoint verifies and appends to the EventLog,
+    which acknowledges after a durable commit; the Dispatcher drains the
+    log to the registered handlers. Started lazily on first use or by
+    start() from the application's lifespan.
+    """
+
+    def __init__(self, path: str = WEBHOOK_QUEUE_DB, workers: int = WEBHOOK_WORKERS, **dispatcher_options):
+        self.path = path
+        self.workers = workers
+        self.dispatcher_options = dispatcher_options
+        self.handlers = {}
+        self.log = None
+        self.dispatcher = None
+        self._lock = threading.Lock()
+
+    def handler(self, event_type: str):
+        def decorator(fn):
+            self.handlers[event_type] = fn
+            return fn
+        return decorator
+
+    def start(self):
+        with self._lock:
+            if self.log is None:
+                self.dispatcher = Dispatcher(self.path, self.handlers, self.workers, **self.dispatcher_options)
+                self.log = EventLog(self.path, on_commit=self.dispatcher.wake)
+                self.dispatcher.start()
+        return self
+
+    def stop(self):
+        with self._lock:
+            if self.log is not None:
+                self.log.close()
+                self.dispatcher.stop()
+                self.log = self.dispatcher = None
+
+    async def accept(self, event_id: str, event_type: str, body: bytes) -> bool:
+        if self.log is None:
+            self.start()
+        return await self.log.append_async(event_id, event_type, body)
+
+    def stats(self) -> dict:
+        conn = sqlite3.connect(self.path)
+        try:
+            counts = dict(conn.execute("SELECT status, count(*) FROM webhook_events GROUP BY status").fetchall())
+            counts["dead_letters"] = conn.execute("SELECT count(*) FROM webhook_dead_letters").fetchone()[0]
+        finally:
+            conn.close()
+        return counts
+
+def requeue_dead_letter(path: str, event_id: str) -> bool:
+    """Send a dead-lettered event through the handlers again (after fixing the cause)."""
+    conn = _connect(path, "FULL")
+    try:
+        conn.execute("BEGIN")
+        moved = conn.execute(
+            "UPDATE webhook_events SET status = 'pending', attempts = 0, next_attempt_at = ?, processed_at = NULL "
+            "WHERE event_id = ? AND status = 'dead'",
+            (time.time(), event_id),
+        ).rowcount
+        conn.execute("DELETE FROM webhook_dead_letters WHERE event_id = ?", (event_id,))
+        conn.execute("COMMIT")
+        return moved == 1
+    finally:
+        conn.close()
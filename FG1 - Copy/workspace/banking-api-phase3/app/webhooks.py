@@ -1,9 +1,37 @@
-from fastapi import APIRouter, Request
+import json
+import logging
+from fastapi import APIRouter, HTTPException, Request
+from app.webhook_delivery import DeliveryEngine
+from app.webhook_queue import SIGNATURE_HEADER, WebhookPipeline, verify_signature
+
+logger = logging.getLogger(__name__)
 
 router = APIRouter(prefix="/webhooks")
 
+# Verified events are appended to a durable local log and acknowledged;
+# handlers run afterwards on the pipeline's worker pool
+pipeline = WebhookPipeline()
+
+# Outbound notifications to the partner endpoints in WEBHOOK_ENDPOINTS
+delivery = DeliveryEngine.from_env()
+
+@pipeline.handler("*")
+def log_event(event: dict):
+    logger.info("Received webhook %s (%s)", event.get("id"), event.get("type"))
+
 @router.post("/event")
 async def receive_webhook(request: Request):
-    data = await request.json()
-    print("Received webhook:", data)
-    return {"status": "received"}
+    body = await request.body()
+    if not verify_signature(body, request.headers.get(SIGNATURE_HEADER)):
+        raise HTTPException(status_code=401, detail="Invalid webhook signature")
+    try:
+        data = json.loads(body)
+        event_id = str(data["id"])
+    except (ValueError, KeyError, TypeError):
+        raise HTTPException(status_code=400, detail="Webhook body must be a JSON object with an id")
+    new = await pipeline.accept(event_id, str(data.get("type", "")), body)
+    return {"status": "received" if new else "duplicate"}
+
+@router.get("/delivery/metrics")
+def delivery_metrics():
+    return delivery.metrics()
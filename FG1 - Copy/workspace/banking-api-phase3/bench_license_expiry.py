@@ -0,0 +1,140 @@
+# License expiry sweeper over a large licenses table
+#
+# Loads --rows licenses (expiries spread from --past-days ago to
+# --future-days ahead) into a throwaway SQLite database, then compares the
+# expiry-indexed queries with full table scans: bucket counts, the
+# expiring-soon range, the first sweep (which marks the whole expired
+# backlog) and a steady-state sweep a day later. While the first sweep
+# runs on a worker thread, uncached check_license calls are timed to show
+# request handling is not held up.
+#
+#   python bench_license_expiry.py --rows 3000000
+import argparse
+import datetime
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+DB_PATH = os.path.join(tempfile.mkdtemp(), "licenses.db")
+os.environ["DATABASE_URL"] = "sqlite:///" + DB_PATH
+
+FMT = "%Y-%m-%d %H:%M:%S.%f"  # how SQLAlchemy stores DateTime in SQLite
+
+def timed(fn, *args, **kwargs):
+    start = time.perf_counter()
+    result = fn(*args, **kwargs)
+    return result, time.perf_counter() - start
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p))]
+
+def load(rows, past_days, future_days, now):
+    # The table as it was before expiry_state; ensure_expiry_schema adds
+    # the column and indexes after the load
+    rng = random.Random(7)
+    span = (past_days + future_days) * 86400
+    conn = sqlite3.connect(DB_PATH)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("CREATE TABLE licenses (id INTEGER PRIMARY KEY, user_id VARCHAR, license_key VARCHAR UNIQUE,"
+                 " expiry DATETIME)")
+    start = time.perf_counter()
+    chunk = 100000
+    for offset in range(0, rows, chunk):
+        conn.executemany(
+            "INSERT INTO licenses (id, user_id, license_key, expiry) VALUES (?, ?, ?, ?)",
+            ((i, f"user{i % 50000}", f"LIC-{i:08d}",
+              (now + datetime.timedelta(seconds=rng.uniform(-past_days * 86400, span - past_days * 86400)))
+              .strftime(FMT))
+             for i in range(offset + 1, min(rows, offset + chunk) + 1)),
+        )
+        conn.commit()
+    conn.close()
+    return time.perf_counter() - start
+
+def full_scan_buckets(conn, now):
+    bounds = [now + datetime.timedelta(days=d) for d in (0, 7, 30, 90)]
+    return conn.execute(
+        "SELECT sum(expiry < ?), sum(expiry >= ? AND expiry < ?), sum(expiry >= ? AND expiry < ?),"
+        " sum(expiry >= ? AND expiry < ?), sum(expiry >= ?) FROM licenses NOT INDEXED",
+        [b.strftime(FMT) for b in (bounds[0], bounds[0], bounds[1], bounds[1], bounds[2], bounds[2], bounds[3],
+                                   bounds[3])],
+    ).fetchone()
+
+def main():
+    parser = argparse.ArgumentParser(description="License expiry sweeper benchmark")
+    parser.add_argument("--rows", type=int, default=3000000)
+    parser.add_argument("--past-days", type=int, default=730)
+    parser.add_argument("--future-days", type=int, default=730)
+    parser.add_argument("--batch", type=int, default=1000)
+    args = parser.parse_args()
+
+    from app.database import engine
+    from app.license_expiry import ensure_expiry_schema, expiry_buckets, sweep_expiring
+    from app.license_service import check_license, license_cache
+
+    now = datetime.datetime.utcnow()
+    print(f"loading {args.rows:,} licenses into {DB_PATH}")
+    load_s = load(args.rows, args.past_days, args.future_days, now)
+    _, index_s = timed(ensure_expiry_schema, engine)
+    print(f"  insert {load_s:.1f}s ({args.rows / load_s:,.0f} rows/s), add expiry_state and indexes {index_s:.1f}s")
+
+    conn = sqlite3.connect(DB_PATH)
+    buckets, indexed_s = timed(expiry_buckets, now=now)
+    scanned, scan_s = timed(full_scan_buckets, conn, now)
+    assert tuple(buckets.values()) == scanned
+    print(f"bucket counts {buckets}")
+    print(f"  indexed range counts {indexed_s * 1000:.0f} ms, full table scan {scan_s * 1000:.0f} ms")
+
+    soon = [(now + datetime.timedelta(days=d)).strftime(FMT) for d in (0, 30)]
+    query = "SELECT id, license_key FROM licenses {} WHERE expiry >= ? AND expiry < ? ORDER BY expiry, id"
+    found, soon_indexed = timed(lambda: conn.execute(query.format(""), soon).fetchall())
+    _, soon_scan = timed(lambda: conn.execute(query.format("NOT INDEXED"), soon).fetchall())
+    print(f"expiring within 30 days: {len(found):,} rows, indexed {soon_indexed * 1000:.0f} ms, "
+          f"full table scan {soon_scan * 1000:.0f} ms")
+
+    # First sweep marks the whole backlog; time uncached checks alongside it
+    sample = [f"LIC-{random.randint(1, args.rows):08d}" for _ in range(2000)]
+    latencies, idle = [], []
+    for key in sample[:200]:
+        license_cache.invalidate(key)
+        idle.append(timed(check_license, key)[1])
+    done = threading.Event()
+    report = {}
+
+    def sweep():
+        report.update(sweep_expiring(batch_size=args.batch, now=now))
+        done.set()
+
+    threading.Thread(target=sweep).start()
+    for key in sample:
+        if done.is_set():
+            break
+        license_cache.invalidate(key)
+        latencies.append(timed(check_license, key)[1])
+        time.sleep(0.005)
+    done.wait()
+    marked = report["expired"] + report["expiring"]
+    print(f"first sweep: {report['expired']:,} expired + {report['expiring']:,} expiring marked in "
+          f"{report['seconds']:.1f}s ({marked / report['seconds']:,.0f} rows/s, batch {args.batch})")
+    print(f"  check_license idle p50 {percentile(idle, 0.5) * 1000:.2f} ms p99 {percentile(idle, 0.99) * 1000:.2f} ms;"
+          f" during sweep ({len(latencies)} calls) p50 {percentile(latencies, 0.5) * 1000:.2f} ms"
+          f" p99 {percentile(latencies, 0.99) * 1000:.2f} ms")
+
+    for days in (0, 1):
+        report = sweep_expiring(batch_size=args.batch, now=now + datetime.timedelta(days=days))
+        print(f"sweep {days} day(s) later: {report['expired']:,} expired + {report['expiring']:,} expiring "
+              f"in {report['seconds'] * 1000:.0f} ms")
+    _, naive_s = timed(lambda: conn.execute(
+        "SELECT count(*) FROM licenses NOT INDEXED WHERE expiry_state != 'expired' AND expiry < ?",
+        [(now + datetime.timedelta(days=31)).strftime(FMT)]).fetchone())
+    print(f"  (a sweep without the partial index reads the whole table: {naive_s * 1000:.0f} ms per pass)")
+
+if __name__ == "__main__":
+    main()
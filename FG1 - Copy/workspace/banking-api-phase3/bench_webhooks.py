@@ -0,0 +1,92 @@
+# Webhook ingestion burst: accept latency and drain rate
+#
+# Fires --events signed events at POST /webhooks/event (in process, through
+# the ASGI app) with --concurrency requests in flight, and reports accept
+# latency percentiles and accepted events/s. The handler sleeps
+# --handler-ms per event to stand in for real work; the drain rate is how
+# fast the worker pool empties the log. --duplicates re-sends that share
+# of events to exercise deduplication.
+#
+#   python bench_webhooks.py --events 20000 --concurrency 500 --workers 8
+import argparse
+import asyncio
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+SECRET = "bench-secret"
+os.environ["WEBHOOK_SECRET"] = SECRET
+os.environ.setdefault("WEBHOOK_QUEUE_DB", os.path.join(tempfile.mkdtemp(), "webhooks.db"))
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p))]
+
+async def burst(app, events, concurrency, duplicates):
+    import httpx
+    from app.webhook_queue import SIGNATURE_HEADER, sign
+
+    bodies = [json.dumps({"id": f"evt_{i}", "type": "bench", "data": {"amount": i}}).encode() for i in range(events)]
+    bodies += random.Random(1).sample(bodies, int(events * duplicates))
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+
+    async def send(client, body):
+        async with semaphore:
+            start = time.perf_counter()
+            response = await client.post("/webhooks/event", content=body, headers={
+                "Content-Type": "application/json", SIGNATURE_HEADER: sign(SECRET, body)})
+            latencies.append((time.perf_counter() - start) * 1000)
+            assert response.status_code == 200, response.text
+
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        start = time.perf_counter()
+        await asyncio.gather(*[send(client, body) for body in bodies])
+        elapsed = time.perf_counter() - start
+    return len(bodies), elapsed, latencies
+
+def main():
+    parser = argparse.ArgumentParser(description="Webhook ingestion burst benchmark")
+    parser.add_argument("--events", type=int, default=20000)
+    parser.add_argument("--concurrency", type=int, default=500)
+    parser.add_argument("--workers", type=int, default=8)
+    parser.add_argument("--handler-ms", type=float, default=2.0)
+    parser.add_argument("--duplicates", type=float, default=0.05, help="share of events sent twice")
+    args = parser.parse_args()
+
+    from app import webhooks
+    from app.main import app
+
+    pipeline = webhooks.pipeline
+    pipeline.workers = args.workers
+
+    @pipeline.handler("bench")
+    def handle(event):
+        time.sleep(args.handler_ms / 1000)
+
+    pipeline.start()
+    start = time.perf_counter()
+    sent, elapsed, latencies = asyncio.run(burst(app, args.events, args.concurrency, args.duplicates))
+    print(f"accepted {sent:,} requests in {elapsed:.2f}s ({sent / elapsed:,.0f}/s), "
+          f"latency p50={percentile(latencies, 0.5):.1f} ms p99={percentile(latencies, 0.99):.1f} ms "
+          f"max={max(latencies):.1f} ms")
+
+    while True:
+        stats = pipeline.stats()
+        if not stats.get("pending") and not stats.get("processing"):
+            break
+        time.sleep(0.05)
+    drained = time.perf_counter() - start
+    pipeline.stop()
+    print(f"drained {stats.get('done', 0):,} unique events in {drained:.2f}s from the start of the burst "
+          f"({stats.get('done', 0) / drained:,.0f}/s with {args.workers} workers at {args.handler_ms} ms/event); "
+          f"dead letters: {stats['dead_letters']}")
+
+if __name__ == "__main__":
+    main()
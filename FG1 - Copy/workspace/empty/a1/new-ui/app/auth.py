@@ -1,11 +1,16 @@
-from fastapi import APIRouter, Depends, HTTPException, status, Body
+from fastapi import APIRouter, Depends, HTTPException, status, Body, Form
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
 from jose import JWTError, jwt
 from passlib.context import CryptContext
 from datetime import datetime, timedelta
 from typing import Optional
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from . import models, schemas
-from .database import get_db
+from .database import get_async_db
+from .passwords import hasher, PasswordQueueFull
+from .token_cache import Principal, token_cache
+from .totp import generate_secret, provisioning_uri, totp_verifier
 
 # Security configuration
 SECRET_KEY = "your-secret-key-here"  # Move to .env in production
@@ -22,6 +27,23 @@ def verify_password(plain_password, hashed_password):
 def get_password_hash(password):
     return pwd_context.hash(password)
 
+async def verify_password_async(plain_password, hashed_password):
+    return await _password_work(verify_password, plain_password, hashed_password)
+
+async def get_password_hash_async(password):
+    return await _password_work(get_password_hash, password)
+
+async def _password_work(fn, *args):
+    # bcrypt costs 100-250 ms of CPU; keep it off the event loop
+    try:
+        return await hasher.run(fn, *args)
+    except PasswordQueueFull:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Too many authentication requests, please retry",
+            headers={"Retry-After": "1"},
+        )
+
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     to_encode = data.copy()
     expire = datetime.utcnow() + (expires_delta or timedelta(minutes=15))
@@ -29,7 +51,16 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
-async def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)):
+async def authenticate_token(token: str, db: AsyncSession) -> Principal:
+    """
+    Resolve a bearer token to its Principal, from the verified-token cache
+    when possible; otherwise verify the JWT, load the user and cache the
+    result until the token expires.
+    """
+    principal = token_cache.get(token)
+    if principal is not None:
+        return principal
+
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
@@ -43,40 +74,103 @@ async def get_current_user(token: str = Depends(oauth2_scheme), db: Session = De
     except JWTError:
         raise credentials_exception
     
-    user = db.query(models.User).filter(models.User.username == username).first()
+    user = await db.scalar(select(models.User).where(models.User.username == username))
     if user is None:
         raise credentials_exception
-    return user
+    principal = Principal.from_user(user)
+    if payload.get("exp"):
+        token_cache.put(token, principal, payload["exp"])
+    return principal
+
+async def get_current_user(token: str = Depends(oauth2_scheme), db: AsyncSession = Depends(get_async_db)):
+    return await authenticate_token(token, db)
 
 @router.post("/register", response_model=schemas.User)
-async def register(user: schemas.UserCreate, db: Session = Depends(get_db)):
-    db_user = db.query(models.User).filter(models.User.username == user.username).first()
+async def register(user: schemas.UserCreate, db: AsyncSession = Depends(get_async_db)):
+    db_user = await db.scalar(select(models.User).where(models.User.username == user.username))
     if db_user:
         raise HTTPException(status_code=400, detail="Username already registered")
     
-    hashed_password = get_password_hash(user.password)
+    hashed_password = await get_password_hash_async(user.password)
     db_user = models.User(
         username=user.username,
-        email=user.email,
+        name=user.name,
         hashed_password=hashed_password
     )
     db.add(db_user)
-    db.commit()
-    db.refresh(db_user)
+    await db.commit()
+    await db.refresh(db_user)
     return db_user
 
 @router.post("/token")
-async def login(form_data: OAuth2PasswordRequestForm = Depends(), db: Session = Depends(get_db)):
-    user = db.query(models.User).filter(models.User.username == form_data.username).first()
-    if not user or not verify_password(form_data.password, user.hashed_password):
+async def login(form_data: OAuth2PasswordRequestForm = Depends(), otp: Optional[str] = Form(None),
+                db: AsyncSession = Depends(get_async_db)):
+    user = await db.scalar(select(models.User).where(models.User.username == form_data.username))
+    if not user or not await verify_password_async(form_data.password, user.hashed_password):
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Incorrect username or password",
             headers={"WWW-Authenticate": "Bearer"},
         )
-    
+    # Checked only after the password, so guessing codes (and using up
+    # time steps) needs the password first
+    if user.twofa_enabled:
+        if not otp:
+            raise HTTPException(
+                status_code=status.HTTP_401_UNAUTHORIZED,
+                detail="Two-factor code required",
+                headers={"WWW-Authenticate": "Bearer", "X-2FA-Required": "true"},
+            )
+        if not await totp_verifier.verify(db, user, otp):
+            raise HTTPException(
+                status_code=status.HTTP_401_UNAUTHORIZED,
+                detail="Invalid or already used two-factor code",
+                headers={"WWW-Authenticate": "Bearer", "X-2FA-Required": "true"},
+            )
+
     access_token = create_access_token(
         data={"sub": user.username},
         expires_delta=timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
     )
     return {"access_token": access_token, "token_type": "bearer"}
+
+async def _current_user_row(principal: Principal, db: AsyncSession) -> models.User:
+    user = await db.get(models.User, principal.id)
+    if user is None:
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Could not validate credentials")
+    return user
+
+@router.post("/2fa/setup", response_model=schemas.TwoFactorSetup)
+async def setup_2fa(principal: Principal = Depends(get_current_user), db: AsyncSession = Depends(get_async_db)):
+    """Issue a new secret; 2FA stays off until /2fa/enable confirms a code from it."""
+    user = await _current_user_row(principal, db)
+    if user.twofa_enabled:
+        raise HTTPException(status_code=400, detail="Two-factor authentication is already enabled")
+    user.twofa_secret = generate_secret()
+    await db.commit()
+    return {"secret": user.twofa_secret, "otpauth_uri": provisioning_uri(user.twofa_secret, user.username)}
+
+@router.post("/2fa/enable")
+async def enable_2fa(body: schemas.TwoFactorCode, principal: Principal = Depends(get_current_user),
+                     db: AsyncSession = Depends(get_async_db)):
+    user = await _current_user_row(principal, db)
+    if not user.twofa_secret:
+        raise HTTPException(status_code=400, detail="Call /2fa/setup first")
+    if not await totp_verifier.verify(db, user, body.code):
+        raise HTTPException(status_code=400, detail="Invalid or already used two-factor code")
+    user.twofa_enabled = 1
+    await db.commit()
+    return {"twofa_enabled": True}
+
+@router.post("/2fa/disable")
+async def disable_2fa(body: schemas.TwoFactorCode, principal: Principal = Depends(get_current_user),
+                      db: AsyncSession = Depends(get_async_db)):
+    user = await _current_user_row(principal, db)
+    if not user.twofa_enabled:
+        raise HTTPException(status_code=400, detail="Two-factor authentication is not enabled")
+    if not await totp_verifier.verify(db, user, body.code):
+        raise HTTPException(status_code=400, detail="Invalid or already used two-factor code")
+    user.twofa_enabled = 0
+    user.twofa_secret = None
+    await db.commit()
+    return {"twofa_enabled": False}
@@ -0,0 +1,137 @@
+from decimal import Decimal
+from typing import Optional
+from sqlalchemy import insert, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+from . import models
+
+def _balance_update(account_id: int, amount: Decimal, user_id: Optional[int], allow_overdraft: bool):
+    stmt = (
+        update(models.Account)
+        .where(models.Account.id == account_id)
+        .values(balance=models.Account.balance + amount)
+        .execution_options(synchronize_session=False)
+    )
+    if user_id is not None:
+        stmt = stmt.where(models.Account.user_id == user_id)
+    if amount < 0 and not allow_overdraft:
+        stmt = stmt.where(models.Account.balance + amount >= 0)
+    return stmt
+
+def _transaction_insert(account_id: int, amount: Decimal, transfer_type: Optional[str], status: str):
+    return insert(models.Transaction).values(
+        account_id=account_id,
+        amount=amount,
+        transfer_type=transfer_type,
+        status=status,
+    )
+
+def apply_balance_change(
+    db: Session,
+    account_id: int,
+    amount: Decimal,
+    user_id: Optional[int] = None,
+    transfer_type: Optional[str] = None,
+    status: str = "pending",
+    allow_overdraft: bool = False,
+) -> int:
+    """
+    Atomically add `amount` to an account balance and record the transaction.
+
+    The balance is changed with a single conditional
+    UPDATE accounts SET balance = balance + :amt WHERE ...
+    so concurrent postings never read a stale balance in Python. The
+    Transaction row is inserted in the same database transaction, and only
+    if the UPDATE matched. Passing `user_id` restricts the update to accounts
+    owned by that user. Debits that would take the balance below zero do not
+    match unless `allow_overdraft` is set.
+
+    The caller owns the transaction and must commit (or roll back).
+
+    Returns:
+        int: Number of account rows changed (0 or 1)
+    """
+    rows = db.execute(_balance_update(account_id, amount, user_id, allow_overdraft)).rowcount
+    if rows:
+        db.execute(_transaction_insert(account_id, amount, transfer_type, status))
+    return rows
+
+async def apply_balance_change_async(
+    db: AsyncSession,
+    account_id: int,
+    amount: Decimal,
+    user_id: Optional[int] = None,
+    transfer_type: Optional[str] = None,
+    status: str = "pending",
+    allow_overdraft: bool = False,
+) -> int:
+    """
+    Async version of apply_balance_change.
+    """
+    result = await db.execute(_balance_update(account_id, amount, user_id, allow_overdraft))
+    rows = result.rowcount
+    if rows:
+        await db.execute(_transaction_insert(account_id, amount, transfer_type, status))
+    return rows
+
+def deposit_by_user(db: Session, user_id: int, amount: Decimal, **kwargs) -> Optional[models.Account]:
+    """
+    Post a deposit to the user's account and commit.
+
+    Returns the refreshed Account, or None if the user has no account.
+    """
+    account_id = db.query(models.Account.id).filter(models.Account.user_id == user_id).scalar()
+    if account_id is None:
+        return None
+    return deposit_to_account(db, account_id, amount, **kwargs)
+
+def deposit_to_account(db: Session, account_id: int, amount: Decimal, **kwargs) -> Optional[models.Account]:
+    """
+    Post a deposit to an account and commit.
+
+    Returns the refreshed Account, or None if no account row was changed.
+    """
+    try:
+        rows = apply_balance_change(db, account_id, amount, **kwargs)
+        if not rows:
+            db.rollback()
+            return None
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    account = db.get(models.Account, account_id)
+    db.refresh(account)
+    return account
+
+async def deposit_by_user_async(db: AsyncSession, user_id: int, amount: Decimal, **kwargs) -> Optional[models.Account]:
+    """
+    Async version of deposit_by_user. Accepts deposit_to_account_async's
+    `commit` flag.
+    """
+    account_id = await db.scalar(select(models.Account.id).where(models.Account.user_id == user_id))
+    if account_id is None:
+        return None
+    return await deposit_to_account_async(db, account_id, amount, **kwargs)
+
+async def deposit_to_account_async(db: AsyncSession, account_id: int, amount: Decimal, commit: bool = True,
+                                   **kwargs) -> Optional[models.Account]:
+    """
+    Async version of deposit_to_account. With commit=False the deposit is
+    left in the open transaction for the caller to commit together with
+    its own writes (the idempotency store records the response that way).
+    """
+    if not commit:
+        if not await apply_balance_change_async(db, account_id, amount, **kwargs):
+            return None
+        return await db.get(models.Account, account_id, populate_existing=True)
+    try:
+        rows = await apply_balance_change_async(db, account_id, amount, **kwargs)
+        if not rows:
+            await db.rollback()
+            return None
+        await db.commit()
+    except Exception:
+        await db.rollback()
+        raise
+    return await db.get(models.Account, account_id, populate_existing=True)
@@ -4,10 +4,52 @@ import os
 class Settings(BaseSettings):
     # Default to SQLite if no environment variable is set
     database_url: str = "sqlite:///./bank.db"
+    # Async driver URL; derived from database_url (sqlite+aiosqlite) if empty
+    async_database_url: str = ""
     secret_key: str = "supersecretkey"
     algorithm: str = "HS256"
     access_token_expire_minutes: int = 30
 
+    # SQLite profile: "production" applies the pragmas below on every new
+    # connection; "default" leaves SQLite's rollback-journal defaults alone
+    sqlite_profile: str = "production"
+    sqlite_journal_mode: str = "WAL"
+    sqlite_synchronous: str = "NORMAL"  # Safe with WAL; fsync only at checkpoints
+    sqlite_busy_timeout_ms: int = 5000
+    sqlite_mmap_size: int = 256 * 1024 * 1024  # 256 MiB
+    sqlite_cache_size: int = -64000  # Negative = KiB, so ~64 MB per connection
+    sqlite_temp_store: str = "MEMORY"
+
+    # Connection pool. Size it to the request thread pool: WAL readers run
+    # in parallel, writers queue on busy_timeout instead of failing
+    db_pool_size: int = 20
+    db_max_overflow: int = 10
+    db_pool_timeout: int = 30
+
+    # bcrypt runs on a bounded thread pool off the event loop. 0 workers
+    # hashes inline; max_queue 0 means no limit on waiting operations
+    password_hash_workers: int = min(4, os.cpu_count() or 1)
+    password_hash_max_queue: int = 256
+
+    # Verified-token cache: max entries (0 disables) and an optional cap in
+    # seconds on how long an entry lives (0 = until the token expires)
+    token_cache_size: int = 10000
+    token_cache_max_ttl: int = 0
+
+    # Idempotency-Key store: how long a key's response is replayed, how long
+    # a claim may run before another request can take it over, and how long
+    # a duplicate waits for an in-flight original before answering 409
+    idempotency_ttl_seconds: int = 24 * 60 * 60
+    idempotency_lock_seconds: int = 30
+    idempotency_wait_seconds: float = 5.0
+
+    # TOTP 2FA: time steps of clock drift accepted either side of now,
+    # users whose decoded secrets are cached, and the issuer shown in
+    # authenticator apps
+    totp_window: int = 1
+    totp_cache_size: int = 10000
+    totp_issuer: str = "Bank"
+
     class Config:
         env_file = ".env"
 
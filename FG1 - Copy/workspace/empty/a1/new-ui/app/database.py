@@ -1,11 +1,111 @@
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event, make_url
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.orm import sessionmaker, declarative_base
-from .config import settings
+from .config import Settings, settings
+
+def _apply_sqlite_pragmas(dbapi_connection, config: Settings):
+    cursor = dbapi_connection.cursor()
+    try:
+        cursor.execute(f"PRAGMA journal_mode={config.sqlite_journal_mode}")
+        cursor.execute(f"PRAGMA synchronous={config.sqlite_synchronous}")
+        cursor.execute(f"PRAGMA busy_timeout={int(config.sqlite_busy_timeout_ms)}")
+        cursor.execute(f"PRAGMA mmap_size={int(config.sqlite_mmap_size)}")
+        cursor.execute(f"PRAGMA cache_size={int(config.sqlite_cache_size)}")
+        cursor.execute(f"PRAGMA temp_store={config.sqlite_temp_store}")
+    finally:
+        cursor.close()
+
+def _sqlite_engine_args(config: Settings, url: str) -> dict:
+    """
+    create_engine/create_async_engine keyword arguments for a SQLite URL
+    under the configured profile.
+    """
+    if config.sqlite_profile != "production":
+        return {"connect_args": {"check_same_thread": False}}  # SQLite specific config
+
+    args = {
+        "connect_args": {
+            "check_same_thread": False,
+            "timeout": config.sqlite_busy_timeout_ms / 1000,
+        },
+    }
+    if make_url(url).database not in (None, "", ":memory:"):
+        # File database: a real queue pool (in-memory databases keep
+        # SQLAlchemy's per-thread pool)
+        args.update(
+            pool_size=config.db_pool_size,
+            max_overflow=config.db_max_overflow,
+            pool_timeout=config.db_pool_timeout,
+        )
+    return args
+
+def _install_sqlite_pragmas(engine, config: Settings):
+    if config.sqlite_profile != "production":
+        return
+
+    @event.listens_for(engine, "connect")
+    def set_sqlite_pragmas(dbapi_connection, connection_record):
+        _apply_sqlite_pragmas(dbapi_connection, config)
+
+def build_engine(config: Settings = settings, url: str | None = None):
+    """
+    Create the SQLAlchemy engine for `config`, applying the production
+    SQLite profile when it is enabled.
+    """
+    url = url or config.database_url
+    if not url.startswith("sqlite"):
+        return create_engine(url)
+
+    engine = create_engine(url, **_sqlite_engine_args(config, url))
+    _install_sqlite_pragmas(engine, config)
+    return engine
+
+def async_database_url(config: Settings = settings) -> str:
+    """
+    The async driver URL: ASYNC_DATABASE_URL if set, otherwise the
+    aiosqlite form of a SQLite DATABASE_URL.
+    """
+    if config.async_database_url:
+        return config.async_database_url
+    url = make_url(config.database_url)
+    if url.get_backend_name() == "sqlite":
+        return url.set(drivername="sqlite+aiosqlite").render_as_string(hide_password=False)
+    raise ValueError("ASYNC_DATABASE_URL must be set for non-SQLite databases")
+
+def build_async_engine(config: Settings = settings, url: str | None = None):
+    """
+    Create the async engine used by the async session dependency, with the
+    same SQLite profile as the sync engine.
+    """
+    url = url or async_database_url(config)
+    if not url.startswith("sqlite"):
+        return create_async_engine(url)
+
+    engine = create_async_engine(url, **_sqlite_engine_args(config, url))
+    _install_sqlite_pragmas(engine.sync_engine, config)
+    return engine
 
 # SQLAlchemy engine and session setup
-engine = create_engine(
-    settings.database_url,
-    connect_args={"check_same_thread": False}  # SQLite specific config
-)
+engine = build_engine()
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 Base = declarative_base()
+
+# Async engine and session setup. expire_on_commit=False so handlers can
+# return ORM objects after committing without an implicit (sync) reload
+async_engine = build_async_engine()
+AsyncSessionLocal = async_sessionmaker(
+    async_engine, class_=AsyncSession, autoflush=False, expire_on_commit=False
+)
+
+# Dependency to get DB session
+def get_db():
+    db = SessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
+
+# Dependency to get an async DB session
+async def get_async_db():
+    async with AsyncSessionLocal() as db:
+        yield db
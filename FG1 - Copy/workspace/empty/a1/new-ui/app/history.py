@@ -0,0 +1,121 @@
+import base64
+import csv
+import io
+from typing import Iterator, Optional
+from sqlalchemy import String, literal, select, tuple_, type_coerce
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+from . import models, schemas
+from .database import SessionLocal
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 500
+EXPORT_BATCH_SIZE = 1000
+CSV_COLUMNS = ["id", "account_id", "amount", "timestamp", "transfer_type", "status"]
+
+# The timestamp is selected as the raw stored value so the cursor compares
+# exactly against what is in the column (SQLite stores DATETIME as text).
+_raw_timestamp = type_coerce(models.Transaction.timestamp, String).label("raw_timestamp")
+
+class InvalidCursor(ValueError):
+    pass
+
+def encode_cursor(raw_timestamp: str, transaction_id: int) -> str:
+    return base64.urlsafe_b64encode(f"{raw_timestamp}|{transaction_id}".encode()).decode()
+
+def decode_cursor(cursor: str) -> tuple[str, int]:
+    try:
+        raw_timestamp, transaction_id = base64.urlsafe_b64decode(cursor.encode()).decode().rsplit("|", 1)
+        return raw_timestamp, int(transaction_id)
+    except Exception:
+        raise InvalidCursor("Invalid pagination cursor")
+
+def _timeline(account_id: int, cursor: Optional[str] = None):
+    """
+    Newest-first transactions for an account, ordered on (timestamp, id)
+    and starting strictly after `cursor` if given.
+    """
+    stmt = (
+        select(models.Transaction, _raw_timestamp)
+        .where(models.Transaction.account_id == account_id)
+        .order_by(models.Transaction.timestamp.desc(), models.Transaction.id.desc())
+    )
+    if cursor:
+        raw_timestamp, transaction_id = decode_cursor(cursor)
+        stmt = stmt.where(
+            tuple_(models.Transaction.timestamp, models.Transaction.id)
+            < tuple_(literal(raw_timestamp, String), literal(transaction_id))
+        )
+    return stmt
+
+def transaction_page(
+    db: Session,
+    account_id: int,
+    limit: int = DEFAULT_PAGE_SIZE,
+    cursor: Optional[str] = None,
+) -> tuple[list[models.Transaction], Optional[str]]:
+    """
+    Fetch one keyset page of an account's transaction history.
+
+    Reads at most `limit + 1` rows whatever the size of the history.
+
+    Returns:
+        tuple: (transactions, next_cursor); next_cursor is None on the last page
+    """
+    rows = db.execute(_timeline(account_id, cursor).limit(limit + 1)).all()
+    return _page(rows, limit)
+
+async def transaction_page_async(
+    db: AsyncSession,
+    account_id: int,
+    limit: int = DEFAULT_PAGE_SIZE,
+    cursor: Optional[str] = None,
+) -> tuple[list[models.Transaction], Optional[str]]:
+    """
+    Async version of transaction_page.
+    """
+    rows = (await db.execute(_timeline(account_id, cursor).limit(limit + 1))).all()
+    return _page(rows, limit)
+
+def _page(rows, limit: int) -> tuple[list[models.Transaction], Optional[str]]:
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        last, raw_timestamp = rows[-1]
+        next_cursor = encode_cursor(raw_timestamp, last.id)
+    return [transaction for transaction, _ in rows], next_cursor
+
+def iter_transactions(account_id: int, batch_size: int = EXPORT_BATCH_SIZE) -> Iterator[models.Transaction]:
+    """
+    Yield every transaction for an account, newest first, from a
+    server-side cursor. Uses its own session because the rows are consumed
+    while the response is streaming, after request dependencies have closed.
+    """
+    db = SessionLocal()
+    try:
+        result = db.execute(
+            _timeline(account_id).execution_options(stream_results=True, yield_per=batch_size)
+        )
+        for partition in result.partitions():
+            for transaction, _ in partition:
+                yield transaction
+            db.expunge_all()
+    finally:
+        db.close()
+
+def ndjson_lines(transactions: Iterator[models.Transaction]) -> Iterator[str]:
+    for transaction in transactions:
+        yield schemas.Transaction.model_validate(transaction).model_dump_json() + "\n"
+
+def csv_lines(transactions: Iterator[models.Transaction]) -> Iterator[str]:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(CSV_COLUMNS)
+    for transaction in transactions:
+        writer.writerow([getattr(transaction, column) for column in CSV_COLUMNS])
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    # Header only, for an empty history
+    if buffer.getvalue():
+        yield buffer.getvalue()
@@ -0,0 +1,193 @@
+import asyncio
+import hashlib
+import json
+import secrets
+import time
+from typing import Awaitable, Callable
+from fastapi import HTTPException, Response
+from sqlalchemy import and_, delete, insert, or_, select, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+from . import models
+from .config import settings
+
+HEADER = "Idempotency-Key"
+REPLAY_HEADER = "Idempotent-Replayed"
+MAX_KEY_LENGTH = 255
+
+def request_hash(payload) -> str:
+    """SHA-256 of the request body, so a reused key with a different body is caught."""
+    return hashlib.sha256(
+        json.dumps(payload, sort_keys=True, separators=(",", ":"), default=str).encode()
+    ).hexdigest()
+
+def _json_response(status_code: int, body: str, replayed: bool) -> Response:
+    headers = {REPLAY_HEADER: "true"} if replayed else None
+    return Response(content=body, status_code=status_code, media_type="application/json", headers=headers)
+
+class IdempotencyStore:
+    """
+    Database-backed Idempotency-Key handling for money-moving endpoints.
+
+    The first request with a key claims it by inserting an in-progress row
+    (primary key (scope, key)) and committing. The operation then runs in a
+    new transaction, and its response is written to the row *in that same
+    transaction*, so the money movement and the stored response commit or
+    roll back together. A replay of a completed key returns the stored
+    response without touching the operation. A duplicate that arrives
+    while the original is still running polls the row for up to
+    `wait` seconds, then gets 409 with Retry-After.
+
+    A claim not completed within `lock_timeout` seconds (its process died)
+    can be taken over. If the original does finish afterwards, its
+    completion UPDATE no longer matches its claim token, so its
+    transaction is rolled back instead of moving the money a second time.
+    Completed keys are replayed for `ttl` seconds; expired rows are reused
+    on the next claim and purged every `purge_every` claims.
+    """
+
+    def __init__(self, ttl: int, lock_timeout: int, wait: float, purge_every: int = 1000):
+        self.ttl = ttl
+        self.lock_timeout = lock_timeout
+        self.wait = wait
+        self.purge_every = purge_every
+        self._claims = 0
+
+    async def run(
+        self,
+        db: AsyncSession,
+        scope: str,
+        key: str,
+        payload,
+        operation: Callable[[], Awaitable[dict]],
+    ) -> Response:
+        """
+        Run `operation` at most once per (scope, key) and return its
+        response. `operation` must not commit; it returns the JSON body of
+        a 200 response or raises HTTPException. 4xx errors are stored and
+        replayed like successes; anything else releases the key so the
+        client can retry.
+        """
+        if not key or len(key) > MAX_KEY_LENGTH:
+            raise HTTPException(status_code=400, detail=f"{HEADER} must be 1-{MAX_KEY_LENGTH} characters")
+        digest = request_hash(payload)
+        owner = secrets.token_hex(16)
+        deadline = time.monotonic() + self.wait
+        delay = 0.01
+
+        while not await self._claim(db, scope, key, digest, owner):
+            row = (await db.execute(
+                select(models.IdempotencyKey.request_hash, models.IdempotencyKey.status_code,
+                       models.IdempotencyKey.response_body)
+                .where(models.IdempotencyKey.scope == scope, models.IdempotencyKey.key == key)
+            )).first()
+            # End the read so the next poll sees fresh data
+            await db.rollback()
+            if row is None:
+                continue  # purged in between; claim again
+            if row.request_hash != digest:
+                raise HTTPException(status_code=422, detail=f"{HEADER} was already used for a different request")
+            if row.status_code is not None:
+                return _json_response(row.status_code, row.response_body, replayed=True)
+            if time.monotonic() >= deadline:
+                raise HTTPException(
+                    status_code=409,
+                    detail=f"A request with this {HEADER} is still being processed",
+                    headers={"Retry-After": "1"},
+                )
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, 0.2)
+
+        try:
+            status_code, body = 200, await operation()
+        except HTTPException as exc:
+            await db.rollback()
+            if exc.status_code >= 500:
+                await self._release(db, scope, key, owner)
+                raise
+            status_code, body = exc.status_code, {"detail": exc.detail}
+        except BaseException:
+            await db.rollback()
+            await self._release(db, scope, key, owner)
+            raise
+
+        body = json.dumps(body, separators=(",", ":"), default=str)
+        result = await db.execute(
+            update(models.IdempotencyKey)
+            .where(models.IdempotencyKey.scope == scope, models.IdempotencyKey.key == key,
+                   models.IdempotencyKey.owner == owner)
+            .values(owner=None, status_code=status_code, response_body=body, expires_at=time.time() + self.ttl)
+            .execution_options(synchronize_session=False)
+        )
+        if result.rowcount != 1:
+            # Our claim timed out and another request took the key over
+            await db.rollback()
+            raise HTTPException(
+                status_code=409,
+                detail=f"A request with this {HEADER} is still being processed",
+                headers={"Retry-After": "1"},
+            )
+        await db.commit()
+        return _json_response(status_code, body, replayed=False)
+
+    async def _claim(self, db: AsyncSession, scope: str, key: str, digest: str, owner: str) -> bool:
+        now = time.time()
+        values = {
+            "request_hash": digest,
+            "owner": owner,
+            "status_code": None,
+            "response_body": None,
+            "locked_until": now + self.lock_timeout,
+            "expires_at": now + self.ttl,
+        }
+        self._claims += 1
+        if self._claims % self.purge_every == 0:
+            await self.purge(db, now)
+        try:
+            await db.execute(insert(models.IdempotencyKey).values(scope=scope, key=key, **values))
+            await db.commit()
+            return True
+        except IntegrityError:
+            await db.rollback()
+
+        # The key exists: take it over only if it expired, or if it is an
+        # abandoned claim
+        result = await db.execute(
+            update(models.IdempotencyKey)
+            .where(
+                models.IdempotencyKey.scope == scope,
+                models.IdempotencyKey.key == key,
+                or_(
+                    models.IdempotencyKey.expires_at < now,
+                    and_(models.IdempotencyKey.status_code.is_(None), models.IdempotencyKey.locked_until < now),
+                ),
+            )
+            .values(**values)
+            .execution_options(synchronize_session=False)
+        )
+        await db.commit()
+        return result.rowcount == 1
+
+    async def _release(self, db: AsyncSession, scope: str, key: str, owner: str):
+        await db.execute(
+            delete(models.IdempotencyKey)
+            .where(models.IdempotencyKey.scope == scope, models.IdempotencyKey.key == key,
+                   models.IdempotencyKey.owner == owner)
+            .execution_options(synchronize_session=False)
+        )
+        await db.commit()
+
+    async def purge(self, db: AsyncSession, now: float = None) -> int:
+        """Delete expired keys (an index range scan on expires_at)."""
+        now = time.time() if now is None else now
+        result = await db.execute(
+            delete(models.IdempotencyKey)
+            .where(models.IdempotencyKey.expires_at < now)
+            .execution_options(synchronize_session=False)
+        )
+        await db.commit()
+        return result.rowcount
+
+idempotency_store = IdempotencyStore(
+    settings.idempotency_ttl_seconds, settings.idempotency_lock_seconds, settings.idempotency_wait_seconds
+)
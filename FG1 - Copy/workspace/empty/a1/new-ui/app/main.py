@@ -1,18 +1,32 @@
-from fastapi import FastAPI, Depends, HTTPException, Request
+from fastapi import FastAPI, Depends, Header, HTTPException, Query, Request, Response
 from fastapi.exception_handlers import http_exception_handler
+from sqlalchemy import select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
-from fastapi.responses import HTMLResponse, JSONResponse, FileResponse
+from fastapi.responses import HTMLResponse, JSONResponse, FileResponse, StreamingResponse
 from decimal import Decimal
 import os
 import traceback
 
 from . import models, schemas
-from .database import SessionLocal, engine
+from .database import SessionLocal, engine, get_db, get_async_db
 from .utils import generate_routing_number, generate_account_number
-from .auth import router as auth_router
+from .balances import deposit_by_user_async, deposit_to_account_async
+from .idempotency import HEADER as IDEMPOTENCY_HEADER, idempotency_store
+from .onboarding import (
+    validate_user_name, onboard_user, bulk_onboard_users, find_username_conflict, is_username_conflict
+)
+from .history import (
+    DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE, InvalidCursor, transaction_page, transaction_page_async,
+    iter_transactions, ndjson_lines, csv_lines
+)
+from .auth import router as auth_router, get_password_hash
+from .passwords import hasher
+from .static_cache import StaticAssetCache
 from fastapi.routing import APIRoute
 
 # Create database tables
@@ -46,8 +60,8 @@ templates = Jinja2Templates(directory="app/templates")
 # Mount static files (if needed later)
 # app.mount("/static", StaticFiles(directory="app/static"), name="static")
 
-# Mount the React-based html/ folder as static
-app.mount("/", StaticFiles(directory="../../html", html=True), name="frontend")
+# React build output (new-ui/html), resolved relative to this package
+HTML_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'html')
 
 # Remove or comment out the previous catch-all route
 # @app.get("/{full_path:path}", response_class=HTMLResponse)
@@ -55,6 +69,10 @@ app.mount("/", StaticFiles(directory="../../html", html=True), name="frontend")
 #     index_path = os.path.join(os.path.dirname(__file__), '../../html/index.html')
 #     return FileResponse(index_path)
 
+# index.html and the hashed html/assets bundles, held in memory with
+# precomputed gzip/brotli variants and ETags
+static_assets = StaticAssetCache(HTML_DIR).load()
+
 # New catch-all for SPA, but skip docs and API routes
 @app.middleware("http")
 async def spa_router(request: Request, call_next):
@@ -64,12 +82,20 @@ async def spa_router(request: Request, call_next):
        request.url.path.startswith("/redoc") or \
        request.url.path.startswith("/api") or \
        request.url.path.startswith("/auth") or \
+       request.url.path.startswith("/users") or \
        request.url.path.startswith("/accounts"):
         return await call_next(request)
-    # Serve React index.html for all other GET requests
-    if request.method == "GET":
-        index_path = os.path.join(os.path.dirname(__file__), '../../html/index.html')
-        return FileResponse(index_path)
+    # Serve cached frontend files, and React index.html for all other GET
+    # requests, from memory with conditional-request support
+    if request.method in ("GET", "HEAD"):
+        asset = static_assets.lookup(request.url.path)
+        if asset is None and not request.url.path.startswith("/assets/"):
+            asset = static_assets.lookup("/index.html")
+        if asset is not None:
+            status_code, headers, body = static_assets.respond(
+                asset, request.headers, head=request.method == "HEAD"
+            )
+            return Response(content=body, status_code=status_code, headers=headers)
     return await call_next(request)
 
 # Custom exception handlers
@@ -97,52 +123,42 @@ def read_root():
         "documentation": "/docs",
         "endpoints": {
             "create_user": "/users/",
+            "create_users_bulk": "/users/bulk",
             "get_user": "/users/{user_id}",
             "get_account": "/users/{user_id}/account",
             "deposit": "/users/{user_id}/deposit",
             "get_transactions": "/accounts/{account_id}/transactions",
+            "export_transactions": "/accounts/{account_id}/transactions/export",
             "account_page": "/account/{user_id}"
         }
     }
 
-# Dependency to get DB session
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
+# Password hashing pool: queue depth, running and completed counts
+@app.get("/api/metrics/password-hashing")
+def password_hashing_metrics():
+    return hasher.stats()
 
 @app.post("/users/", response_model=schemas.User)
 def create_user(user: schemas.UserCreate, db: Session = Depends(get_db)):
     try:
         # Validate user data
-        if not user.name or not user.name.strip():
-            raise HTTPException(status_code=400, detail="User name must not be empty")
-        
-        # Check if name is too long
-        if len(user.name) > 100:
-            raise HTTPException(status_code=400, detail="User name is too long (max 100 characters)")
+        error = validate_user_name(user.name)
+        if error:
+            raise HTTPException(status_code=400, detail=error)
             
-        # Create user
-        db_user = models.User(name=user.name)
-        db.add(db_user)
-        db.commit()
-        db.refresh(db_user)
-        
-        # Create initial account with $40 balance - using the simplified schema
-        account = models.Account(
-            user_id=db_user.id,
-            balance=40.00  # Initial $40 balance
+        if db.query(models.User.id).filter(models.User.username == user.username).first():
+            raise HTTPException(status_code=400, detail="Username already registered")
+            
+        # Create user, initial account with $40 balance and the initial
+        # deposit transaction in a single commit
+        db_user, account = onboard_user(
+            db,
+            user.name,
+            username=user.username,
+            hashed_password=get_password_hash(user.password)
         )
-        db.add(account)
-        db.commit()
-        db.refresh(account)
-        
-        # Create initial deposit transaction
-        transaction = models.Transaction(account_id=account.id, amount=40.00)
-        db.add(transaction)
         db.commit()
+        db.refresh(db_user)
         
         # Log successful user creation
         print(f"Created new user: {db_user.id} - {db_user.name} with account {account.id}")
@@ -152,6 +168,13 @@ def create_user(user: schemas.UserCreate, db: Session = Depends(get_db)):
     except HTTPException as http_ex:
         # Re-raise HTTP exceptions
         raise http_ex
+    except IntegrityError as e:
+        db.rollback()
+        if not is_username_conflict(e):
+            print(f"Error creating user: {e}")
+            raise HTTPException(status_code=500, detail=f"Failed to create user: {str(e)}")
+        # Registered concurrently, between the check and the insert
+        raise HTTPException(status_code=400, detail="Username already registered")
     except Exception as e:
         # Log the error with full details
         error_details = {
@@ -163,6 +186,39 @@ def create_user(user: schemas.UserCreate, db: Session = Depends(get_db)):
         db.rollback()  # Rollback transaction on error
         raise HTTPException(status_code=500, detail=f"Failed to create user: {str(e)}")
 
+@app.post("/users/bulk", response_model=schemas.BulkUserResult)
+def create_users_bulk(req: schemas.BulkUserCreate, db: Session = Depends(get_db)):
+    # Validate every row before writing anything
+    for index, user in enumerate(req.users):
+        error = validate_user_name(user.name)
+        if error:
+            raise HTTPException(status_code=400, detail=f"users[{index}]: {error}")
+    conflict = find_username_conflict(db, [user.username for user in req.users])
+    if conflict:
+        index, error = conflict
+        raise HTTPException(status_code=400, detail=f"users[{index}]: {error}")
+    try:
+        user_ids = bulk_onboard_users(db, [user.model_dump() for user in req.users])
+        db.commit()
+    except IntegrityError as e:
+        db.rollback()
+        if not is_username_conflict(e):
+            print(f"Error creating users in bulk: {e}")
+            raise HTTPException(status_code=500, detail="Failed to create users")
+        # A username registered concurrently, between the check and the insert
+        raise HTTPException(status_code=400, detail="Username already registered")
+    except Exception as e:
+        error_details = {
+            "error": str(e),
+            "type": type(e).__name__,
+            "traceback": traceback.format_exc()
+        }
+        print(f"Error creating users in bulk: {error_details}")
+        db.rollback()
+        raise HTTPException(status_code=500, detail="Failed to create users")
+    print(f"Created {len(user_ids)} users in bulk")
+    return {"created": len(user_ids), "user_ids": user_ids}
+
 @app.get("/users/{user_id}", response_model=schemas.User)
 def read_user(user_id: int, db: Session = Depends(get_db)):
     db_user = db.query(models.User).filter(models.User.id == user_id).first()
@@ -195,38 +251,54 @@ def verify_bank(user_id: int, req: schemas.VerifyBankRequest, db: Session = Depe
     return {"message": "Bank verified successfully", "is_bank_verified": True}
 
 @app.post("/users/{user_id}/deposit", response_model=schemas.Account)
-def deposit(user_id: int, deposit: schemas.DepositRequest, db: Session = Depends(get_db)):
+async def deposit(
+    user_id: int,
+    deposit: schemas.DepositRequest,
+    idempotency_key: str | None = Header(None, alias=IDEMPOTENCY_HEADER),
+    db: AsyncSession = Depends(get_async_db)
+):
     if deposit.amount <= 0:
         raise HTTPException(status_code=400, detail="Deposit amount must be positive")
-    account = db.query(models.Account).filter(models.Account.user_id == user_id).first()
-    if not account:
-        raise HTTPException(status_code=404, detail="Account not found")
     # Remove bank link/verify check for simplified flow
     if not deposit.agree_terms:
         raise HTTPException(status_code=400, detail="You must agree to ACH terms and conditions")
-    # Simulate processing
-    account.balance += deposit.amount
-    # Log transaction
-    transaction = models.Transaction(
-        account_id=account.id,
-        amount=deposit.amount,
+    if idempotency_key is not None:
+        # Retries with the same key replay the first response instead of
+        # depositing again
+        async def operation():
+            account = await deposit_by_user_async(
+                db, user_id, deposit.amount, commit=False, transfer_type=deposit.transfer_type, status="pending"
+            )
+            if not account:
+                raise HTTPException(status_code=404, detail="Account not found")
+            return schemas.Account.model_validate(account).model_dump(mode="json")
+
+        return await idempotency_store.run(
+            db, f"POST /users/{user_id}/deposit", idempotency_key, deposit.model_dump(mode="json"), operation
+        )
+    # Atomic balance update + transaction log
+    account = await deposit_by_user_async(
+        db,
+        user_id,
+        deposit.amount,
         transfer_type=deposit.transfer_type,
         status="pending"  # In real app, would update after processing
     )
-    db.add(transaction)
-    db.commit()
-    db.refresh(account)
+    if not account:
+        raise HTTPException(status_code=404, detail="Account not found")
     return account
 
-@app.get("/users/{user_id}/account", response_model=schemas.Account)
-def get_account(user_id: int, db: Session = Depends(get_db)):
-    account = db.query(models.Account).filter(models.Account.user_id == user_id).first()
+# user_id is an int path segment so /users/me/account falls through to the
+# authenticated route below
+@app.get("/users/{user_id:int}/account", response_model=schemas.Account)
+async def get_account(user_id: int, db: AsyncSession = Depends(get_async_db)):
+    account = await db.scalar(select(models.Account).where(models.Account.user_id == user_id))
     if not account:
         raise HTTPException(status_code=404, detail="Account not found")
     return account
 
 @app.get("/account/{user_id}", response_class=HTMLResponse)
-def get_account_page(request: Request, user_id: int, db: Session = Depends(get_db)):
+def get_account_page(request: Request, user_id: int, cursor: str | None = None, db: Session = Depends(get_db)):
     user = db.query(models.User).filter(models.User.id == user_id).first()
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
@@ -235,9 +307,10 @@ def get_account_page(request: Request, user_id: int, db: Session = Depends(get_d
     if not account:
         raise HTTPException(status_code=404, detail="Account not found")
     
-    transactions = db.query(models.Transaction).filter(
-        models.Transaction.account_id == account.id
-    ).order_by(models.Transaction.timestamp.desc()).all()
+    try:
+        transactions, next_cursor = transaction_page(db, account.id, cursor=cursor)
+    except InvalidCursor as e:
+        raise HTTPException(status_code=400, detail=str(e))
     
     return templates.TemplateResponse(
         "account_details.html",
@@ -247,91 +320,109 @@ def get_account_page(request: Request, user_id: int, db: Session = Depends(get_d
             "routing_number": account.routing_number,
             "account_number": account.account_number,
             "balance": float(account.balance),
-            "transactions": transactions
+            "transactions": transactions,
+            "next_cursor": next_cursor
         }
     )
 
 @app.get("/accounts/{account_id}/transactions", response_model=list[schemas.Transaction])
-def get_transactions(account_id: int, db: Session = Depends(get_db)):
-    transactions = db.query(models.Transaction).filter(models.Transaction.account_id == account_id).order_by(models.Transaction.timestamp.desc()).all()
+async def get_transactions(
+    account_id: int,
+    response: Response,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    cursor: str | None = None,
+    db: AsyncSession = Depends(get_async_db)
+):
+    # Keyset pagination on (timestamp, id); the cursor for the next page is
+    # returned in the X-Next-Cursor header
+    try:
+        transactions, next_cursor = await transaction_page_async(db, account_id, limit=limit, cursor=cursor)
+    except InvalidCursor as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
     return transactions
 
+@app.get("/accounts/{account_id}/transactions/export")
+def export_transactions(
+    account_id: int,
+    format: str = Query("ndjson", pattern="^(ndjson|csv)$")
+):
+    # Streams the full history from a server-side cursor; memory stays flat
+    # regardless of how many transactions the account has
+    rows = iter_transactions(account_id)
+    if format == "csv":
+        return StreamingResponse(
+            csv_lines(rows),
+            media_type="text/csv",
+            headers={"Content-Disposition": f"attachment; filename=transactions-{account_id}.csv"}
+        )
+    return StreamingResponse(ndjson_lines(rows), media_type="application/x-ndjson")
+
 from fastapi import APIRouter, Security
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
-from jose import JWTError, jwt
-from pydantic import BaseModel
-from .auth import SECRET_KEY, ALGORITHM
-
-# Define TokenData class for JWT payload validation
-class TokenData(BaseModel):
-    username: str
+from .auth import authenticate_token
+from .token_cache import Principal
 
 router = APIRouter()
 
 # JWT Security
 security = HTTPBearer()
 
-# Function to get the current user from the JWT token
-def get_current_user(credentials: HTTPAuthorizationCredentials = Security(security), db: Session = Depends(get_db)):
-    credentials_exception = HTTPException(
-        status_code=401,
-        detail="Could not validate credentials",
-        headers={"WWW-Authenticate": "Bearer"},
-    )
-    
-    try:
-        token = credentials.credentials
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        username: str = payload.get("sub")
-        if username is None:
-            raise credentials_exception
-        token_data = TokenData(username=username)
-    except JWTError:
-        raise credentials_exception
-        
-    user = db.query(models.User).filter(models.User.username == token_data.username).first()
-    if user is None:
-        raise credentials_exception
-    return user
+# Function to get the current user from the JWT token (served from the
+# verified-token cache on repeat requests)
+async def get_current_user(credentials: HTTPAuthorizationCredentials = Security(security), db: AsyncSession = Depends(get_async_db)):
+    return await authenticate_token(credentials.credentials, db)
 
 # New authenticated endpoints
 @app.get("/users/me/account", response_model=schemas.Account)
-def get_current_user_account(current_user: models.User = Depends(get_current_user), db: Session = Depends(get_db)):
-    account = db.query(models.Account).filter(models.Account.user_id == current_user.id).first()
+async def get_current_user_account(current_user: Principal = Depends(get_current_user), db: AsyncSession = Depends(get_async_db)):
+    account = await db.scalar(select(models.Account).where(models.Account.user_id == current_user.id))
     if not account:
         raise HTTPException(status_code=404, detail="Account not found")
     return account
 
 @app.post("/accounts/{account_id}/deposit", response_model=schemas.Account)
-def authenticated_deposit(
+async def authenticated_deposit(
     account_id: int, 
     deposit_req: schemas.DepositRequest,
-    current_user: models.User = Depends(get_current_user), 
-    db: Session = Depends(get_db)
+    current_user: Principal = Depends(get_current_user), 
+    idempotency_key: str | None = Header(None, alias=IDEMPOTENCY_HEADER),
+    db: AsyncSession = Depends(get_async_db)
 ):
-    # Verify account belongs to the authenticated user
-    account = db.query(models.Account).filter(
-        models.Account.id == account_id,
-        models.Account.user_id == current_user.id
-    ).first()
+    if idempotency_key is not None:
+        # Keys are scoped to the authenticated user
+        async def operation():
+            account = await deposit_to_account_async(
+                db, account_id, deposit_req.amount, commit=False, user_id=current_user.id
+            )
+            if not account:
+                raise HTTPException(status_code=404, detail="Account not found or unauthorized")
+            return schemas.Account.model_validate(account).model_dump(mode="json")
+
+        return await idempotency_store.run(
+            db, f"user:{current_user.id} POST /accounts/{account_id}/deposit", idempotency_key,
+            deposit_req.model_dump(mode="json"), operation
+        )
+
+    # Process deposit; the update only matches if the account belongs to
+    # the authenticated user
+    account = await deposit_to_account_async(
+        db,
+        account_id,
+        deposit_req.amount,
+        user_id=current_user.id
+    )
     
     if not account:
         raise HTTPException(status_code=404, detail="Account not found or unauthorized")
     
-    # Process deposit
-    account.balance += deposit_req.amount
-    
-    # Create transaction record
-    transaction = models.Transaction(
-        account_id=account.id,
-        amount=deposit_req.amount
-    )
-    
-    db.add(transaction)
-    db.commit()
-    db.refresh(account)
-    
     return account
 
 app.include_router(router)
 app.include_router(auth_router)
+
+# Mount the React-based html/ folder as static, for anything the in-memory
+# cache does not hold. This must come after every route above: a mount at
+# "/" matches all paths and would shadow the API.
+app.mount("/", StaticFiles(directory=HTML_DIR, html=True), name="frontend")
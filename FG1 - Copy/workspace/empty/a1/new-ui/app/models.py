@@ -1,7 +1,7 @@
-from sqlalchemy import Column, Integer, String, ForeignKey, Numeric, DateTime
+from sqlalchemy import Column, Integer, String, ForeignKey, Numeric, DateTime, Index, Float, Text
 from sqlalchemy.sql import func
 from .database import Base
-import random
+from .utils import generate_routing_number, generate_account_number
 
 class User(Base):
     __tablename__ = "users"
@@ -12,6 +12,7 @@ class User(Base):
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     twofa_secret = Column(String, nullable=True)  # Added for 2FA
     twofa_enabled = Column(Integer, default=0, nullable=False)  # Added for 2FA (0=False, 1=True)
+    last_totp_step = Column(Integer, nullable=True)  # Last accepted TOTP time step (replay guard, app.totp)
 
 class Account(Base):
     __tablename__ = "accounts"
@@ -20,23 +21,10 @@ class Account(Base):
     balance = Column(Numeric(12, 2), nullable=False, default=0)
     is_bank_linked = Column(Integer, nullable=False, default=0)  # 0 = False, 1 = True
     is_bank_verified = Column(Integer, nullable=False, default=0)  # 0 = False, 1 = True
-    # These columns are not in the actual database, so we'll make them virtual
-    # For compatibility with existing code
-    @property
-    def routing_number(self):
-        # Generate a deterministic routing number based on the user_id
-        import hashlib
-        hash_obj = hashlib.md5(f"routing_{self.user_id}".encode())
-        # Take first 9 digits
-        return hash_obj.hexdigest()[:9]
-    
-    @property
-    def account_number(self):
-        # Generate a deterministic account number based on the account_id
-        import hashlib
-        hash_obj = hashlib.md5(f"account_{self.id}".encode())
-        # Take first 12 digits
-        return hash_obj.hexdigest()[:12]
+    # Generated once at insert time (see utils) and indexed so incoming
+    # ACH entries can be matched with a single lookup
+    routing_number = Column(String(9), nullable=False, index=True, default=generate_routing_number)
+    account_number = Column(String(12), nullable=False, unique=True, index=True, default=generate_account_number)
 
 class Transaction(Base):
     __tablename__ = "transactions"
@@ -46,3 +34,27 @@ class Transaction(Base):
     timestamp = Column(DateTime(timezone=True), server_default=func.now())
     transfer_type = Column(String, nullable=True)  # 'ACH' or 'Instant'
     status = Column(String, nullable=False, default='pending')  # 'pending', 'completed', 'failed'
+
+    __table_args__ = (
+        # Account timelines: WHERE account_id = ? ORDER BY timestamp DESC, id DESC
+        # (id is the rowid, so it is implicitly the last index column)
+        Index("ix_transactions_account_timestamp", "account_id", "timestamp"),
+        # Velocity checks: SUM(amount) WHERE account_id = ? AND transfer_type = ?
+        # AND timestamp >= ?, answered from the index alone
+        Index("ix_transactions_account_type_timestamp", "account_id", "transfer_type", "timestamp", "amount"),
+    )
+
+class IdempotencyKey(Base):
+    """A client's Idempotency-Key and the response it produced; see app.idempotency."""
+    __tablename__ = "idempotency_keys"
+    # Keys are namespaced by caller and endpoint, so two clients (or two
+    # endpoints) can use the same key without colliding
+    scope = Column(String, primary_key=True)
+    key = Column(String(255), primary_key=True)
+    request_hash = Column(String(64), nullable=False)
+    owner = Column(String(32), nullable=True)  # claim token while the request runs
+    status_code = Column(Integer, nullable=True)  # NULL while in progress
+    response_body = Column(Text, nullable=True)
+    # Epoch seconds
+    locked_until = Column(Float, nullable=False)
+    expires_at = Column(Float, nullable=False, index=True)  # purge: DELETE WHERE expires_at < ?
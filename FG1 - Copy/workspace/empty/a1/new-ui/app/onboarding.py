@@ -0,0 +1,140 @@
+from decimal import Decimal
+from typing import Sequence
+from sqlalchemy import insert, select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+from . import models
+from .utils import generate_account_number
+
+SEED_BALANCE = Decimal("40.00")  # Initial $40 balance for new accounts
+MAX_NAME_LENGTH = 100
+LOOKUP_CHUNK = 500
+
+def validate_user_name(name: str | None) -> str | None:
+    """
+    Return an error message if `name` is not a valid user name, else None.
+    """
+    if not name or not name.strip():
+        return "User name must not be empty"
+    if len(name) > MAX_NAME_LENGTH:
+        return f"User name is too long (max {MAX_NAME_LENGTH} characters)"
+    return None
+
+def find_username_conflict(db: Session, usernames: Sequence[str | None]) -> tuple[int, str] | None:
+    """
+    Return (index, error) for the first username that repeats an earlier
+    one in `usernames` or is already registered, else None. Missing
+    usernames never conflict.
+    """
+    first_seen: dict[str, int] = {}
+    for index, username in enumerate(usernames):
+        if username is None:
+            continue
+        if username in first_seen:
+            return index, f"Username {username!r} repeats users[{first_seen[username]}]"
+        first_seen[username] = index
+
+    taken: set[str] = set()
+    names = list(first_seen)
+    # Chunked to stay well under SQLite's bound-parameter limit
+    for start in range(0, len(names), LOOKUP_CHUNK):
+        taken.update(db.execute(
+            select(models.User.username).where(models.User.username.in_(names[start:start + LOOKUP_CHUNK]))
+        ).scalars())
+    for username, index in first_seen.items():
+        if username in taken:
+            return index, "Username already registered"
+    return None
+
+def is_username_conflict(exc: IntegrityError) -> bool:
+    """
+    True if `exc` is a violation of the unique username index (SQLite
+    names the column, PostgreSQL the index), as opposed to any other
+    constraint.
+    """
+    message = str(exc.orig)
+    return "users.username" in message or "ix_users_username" in message
+
+def allocate_account_numbers(db: Session, count: int) -> list[str]:
+    """
+    Return `count` distinct account numbers that no account uses yet.
+
+    generate_account_number draws at random; candidates already taken, or
+    drawn twice, are redrawn rather than left for the unique index to
+    reject at insert time.
+    """
+    numbers: set[str] = set()
+    while len(numbers) < count:
+        candidates = list({generate_account_number() for _ in range(count - len(numbers))} - numbers)
+        taken: set[str] = set()
+        # Chunked to stay well under SQLite's bound-parameter limit
+        for start in range(0, len(candidates), LOOKUP_CHUNK):
+            taken.update(db.execute(
+                select(models.Account.account_number)
+                .where(models.Account.account_number.in_(candidates[start:start + LOOKUP_CHUNK]))
+            ).scalars())
+        numbers.update(number for number in candidates if number not in taken)
+    return list(numbers)
+
+def onboard_user(
+    db: Session,
+    name: str,
+    username: str | None = None,
+    hashed_password: str | None = None,
+) -> tuple[models.User, models.Account]:
+    """
+    Create a user, their account and the seed deposit as one unit of work.
+
+    The rows are flushed together so the generated ids are available, but
+    nothing is committed; the caller commits once.
+    """
+    db_user = models.User(name=name, username=username, hashed_password=hashed_password)
+    db.add(db_user)
+    db.flush()
+
+    account = models.Account(
+        user_id=db_user.id, balance=SEED_BALANCE, account_number=allocate_account_numbers(db, 1)[0]
+    )
+    db.add(account)
+    db.flush()
+
+    db.add(models.Transaction(account_id=account.id, amount=SEED_BALANCE))
+    db.flush()
+    return db_user, account
+
+def bulk_onboard_users(db: Session, users: Sequence[dict]) -> list[int]:
+    """
+    Create many users, accounts and seed deposits with executemany inserts.
+
+    `users` holds one dict of User column values per customer (at least
+    "name"; "username" is optional).
+
+    Issues three INSERT statements in total (users, accounts, transactions),
+    each batched by the driver, rather than three round trips per customer.
+    Nothing is committed; the caller commits once. Usernames are not
+    checked here; callers run find_username_conflict first.
+
+    Returns:
+        list[int]: New user ids, in the same order as `users`
+    """
+    if not users:
+        return []
+
+    user_ids = db.execute(
+        insert(models.User).returning(models.User.id, sort_by_parameter_order=True),
+        [{"name": user["name"], "username": user.get("username")} for user in users],
+    ).scalars().all()
+
+    account_ids = db.execute(
+        insert(models.Account).returning(models.Account.id, sort_by_parameter_order=True),
+        [
+            {"user_id": user_id, "balance": SEED_BALANCE, "account_number": number}
+            for user_id, number in zip(user_ids, allocate_account_numbers(db, len(user_ids)))
+        ],
+    ).scalars().all()
+
+    db.execute(
+        insert(models.Transaction),
+        [{"account_id": account_id, "amount": SEED_BALANCE} for account_id in account_ids],
+    )
+    return list(user_ids)
@@ -0,0 +1,93 @@
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, TypeVar
+from .config import settings
+
+T = TypeVar("T")
+
+class PasswordQueueFull(Exception):
+    """Raised when too many password operations are already waiting."""
+
+class PasswordHasher:
+    """
+    Runs bcrypt hashing/verification on a bounded thread pool so the event
+    loop keeps serving other requests while a login is being checked.
+
+    bcrypt releases the GIL, so `workers` threads give up to `workers`
+    hashes in parallel. Work beyond that waits in the executor queue; once
+    `max_queue` operations are waiting, new ones are rejected with
+    PasswordQueueFull instead of piling up latency. `workers=0` runs the work
+    inline on the calling thread (the old behaviour).
+    """
+
+    def __init__(self, workers: int, max_queue: int = 0):
+        self.workers = workers
+        self.max_queue = max_queue
+        self._executor = None
+        self._lock = threading.Lock()
+        self._queued = 0
+        self._running = 0
+        self._completed = 0
+        self._rejected = 0
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="bcrypt")
+        return self._executor
+
+    def _dequeue(self, job: dict):
+        # Exactly once per job: when a worker starts it, or when the waiting
+        # request gives up (cancelled) before any worker did
+        with self._lock:
+            if not job["dequeued"]:
+                job["dequeued"] = True
+                self._queued -= 1
+
+    def _call(self, job: dict, fn: Callable[..., T], *args) -> T:
+        self._dequeue(job)
+        with self._lock:
+            self._running += 1
+        try:
+            return fn(*args)
+        finally:
+            with self._lock:
+                self._running -= 1
+                self._completed += 1
+
+    async def run(self, fn: Callable[..., T], *args) -> T:
+        job = {"dequeued": False}
+        if self.workers <= 0:
+            with self._lock:
+                self._queued += 1
+            return self._call(job, fn, *args)
+        with self._lock:
+            if self.max_queue and self._queued >= self.max_queue:
+                self._rejected += 1
+                raise PasswordQueueFull("Too many password operations in progress")
+            self._queued += 1
+        loop = asyncio.get_running_loop()
+        try:
+            return await loop.run_in_executor(self._get_executor(), self._call, job, fn, *args)
+        finally:
+            # A cancelled request (client disconnect) drops its job from the
+            # executor before _call runs; release its queue slot here
+            self._dequeue(job)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "workers": self.workers,
+                "max_queue": self.max_queue,
+                "queue_depth": self._queued,
+                "running": self._running,
+                "completed": self._completed,
+                "rejected": self._rejected,
+            }
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+            self._executor = None
+
+hasher = PasswordHasher(settings.password_hash_workers, settings.password_hash_max_queue)
@@ -25,6 +25,24 @@ class User(UserBase):
         from_attributes = True
         orm_mode = True  # For backward compatibility
 
+class TwoFactorSetup(BaseModel):
+    secret: str
+    otpauth_uri: str
+
+class TwoFactorCode(BaseModel):
+    code: str
+
+class BulkUser(BaseModel):
+    name: str
+    username: str | None = None
+
+class BulkUserCreate(BaseModel):
+    users: list[BulkUser]
+
+class BulkUserResult(BaseModel):
+    created: int
+    user_ids: list[int]
+
 class Deposit(BaseModel):
     amount: condecimal(max_digits=12, decimal_places=2)
 
@@ -0,0 +1,175 @@
+import gzip
+import hashlib
+import mimetypes
+import os
+import re
+from dataclasses import dataclass
+from email.utils import formatdate, parsedate_to_datetime
+from typing import Mapping, Optional
+
+try:
+    import brotli
+except ImportError:  # Optional: gzip only without it
+    brotli = None
+
+# Vite output: assets/index-DPBNiJfi.js, assets/react-CHdo91hT.svg, ...
+FINGERPRINTED = re.compile(r"^/assets/.+-[A-Za-z0-9_-]{8,}\.[A-Za-z0-9]+$")
+COMPRESSIBLE = ("text/", "application/javascript", "application/json", "application/manifest+json", "image/svg+xml")
+IMMUTABLE = "public, max-age=31536000, immutable"
+SHORT_LIVED = "public, max-age=3600"
+# Entry points that must be revalidated so new deployments are picked up
+ENTRY_POINTS = {"/index.html", "/sw.js", "/service-worker.js", "/manifest.json"}
+
+@dataclass
+class Asset:
+    path: str
+    content_type: str
+    body: bytes
+    gzip: Optional[bytes]
+    br: Optional[bytes]
+    etag: str
+    last_modified: str
+    mtime: int
+    cache_control: str
+
+def _accepts(accept_encoding: str, coding: str) -> bool:
+    for part in accept_encoding.split(","):
+        name, _, params = part.strip().partition(";")
+        if name.strip().lower() == coding:
+            q = params.strip()
+            if not q.startswith("q="):
+                return True
+            try:
+                return float(q[2:] or 0) > 0
+            except ValueError:
+                # Malformed q-value: do not risk sending a coding the client refused
+                return False
+    return False
+
+def _etag_matches(if_none_match: str, etag: str) -> bool:
+    if if_none_match.strip() == "*":
+        return True
+    opaque = etag.strip('"')
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        if candidate.startswith("W/"):
+            candidate = candidate[2:]
+        # Variants carry a -gz/-br suffix; any of them revalidates the file
+        if candidate.strip('"').split("-")[0] == opaque:
+            return True
+    return False
+
+class StaticAssetCache:
+    """
+    Holds a built frontend (html/) in memory with precomputed gzip/brotli
+    variants, ETags and cache headers, so serving it never touches disk.
+
+    Fingerprinted Vite bundles are sent as immutable; the entry points in
+    ENTRY_POINTS use `entry_cache_control` ("no-cache" = always revalidate,
+    answered with 304 when unchanged). Files larger than `max_file_bytes`
+    are not cached and lookup() returns None for them.
+    """
+
+    def __init__(self, root: str, entry_cache_control: str = "no-cache", max_file_bytes: int = 10 * 1024 * 1024):
+        self.root = os.path.abspath(root)
+        self.entry_cache_control = entry_cache_control
+        self.max_file_bytes = max_file_bytes
+        self.assets: dict[str, Asset] = {}
+
+    def cache_control(self, path: str) -> str:
+        if path in ENTRY_POINTS:
+            return self.entry_cache_control
+        if FINGERPRINTED.match(path):
+            return IMMUTABLE
+        return SHORT_LIVED
+
+    def load(self) -> "StaticAssetCache":
+        assets = {}
+        for dirpath, _, filenames in os.walk(self.root):
+            for filename in filenames:
+                full_path = os.path.join(dirpath, filename)
+                path = "/" + os.path.relpath(full_path, self.root).replace(os.sep, "/")
+                asset = self._load_file(path, full_path)
+                if asset is not None:
+                    assets[path] = asset
+        self.assets = assets
+        return self
+
+    def _load_file(self, path: str, full_path: str) -> Optional[Asset]:
+        stat = os.stat(full_path)
+        if stat.st_size > self.max_file_bytes:
+            return None
+        with open(full_path, "rb") as f:
+            body = f.read()
+        content_type = mimetypes.guess_type(full_path)[0] or "application/octet-stream"
+        if content_type.startswith("text/") or content_type in ("application/javascript", "application/json"):
+            content_type += "; charset=utf-8"
+
+        gzipped = brotlied = None
+        if content_type.startswith(COMPRESSIBLE) and len(body) > 256:
+            candidate = gzip.compress(body, compresslevel=9, mtime=0)
+            if len(candidate) < len(body) * 0.9:
+                gzipped = candidate
+            if brotli is not None:
+                candidate = brotli.compress(body, quality=11)
+                if len(candidate) < len(body) * 0.9:
+                    brotlied = candidate
+
+        return Asset(
+            path=path,
+            content_type=content_type,
+            body=body,
+            gzip=gzipped,
+            br=brotlied,
+            etag='"%s"' % hashlib.sha256(body).hexdigest()[:32],
+            last_modified=formatdate(stat.st_mtime, usegmt=True),
+            mtime=int(stat.st_mtime),
+            cache_control=self.cache_control(path),
+        )
+
+    def lookup(self, path: str) -> Optional[Asset]:
+        if path == "/":
+            path = "/index.html"
+        return self.assets.get(path)
+
+    def respond(self, asset: Asset, headers: Mapping[str, str], head: bool = False) -> tuple[int, dict, bytes]:
+        """
+        Build the (status, headers, body) reply for `asset`, honouring
+        If-None-Match / If-Modified-Since and Accept-Encoding from the
+        request `headers` (lower-case keys).
+        """
+        body, encoding, etag = asset.body, None, asset.etag
+        accept_encoding = headers.get("accept-encoding", "")
+        if asset.br is not None and _accepts(accept_encoding, "br"):
+            body, encoding, etag = asset.br, "br", asset.etag[:-1] + '-br"'
+        elif asset.gzip is not None and _accepts(accept_encoding, "gzip"):
+            body, encoding, etag = asset.gzip, "gzip", asset.etag[:-1] + '-gz"'
+
+        reply_headers = {
+            "Content-Type": asset.content_type,
+            "ETag": etag,
+            "Last-Modified": asset.last_modified,
+            "Cache-Control": asset.cache_control,
+        }
+        if asset.gzip is not None or asset.br is not None:
+            reply_headers["Vary"] = "Accept-Encoding"
+
+        if self._not_modified(asset, headers):
+            return 304, reply_headers, b""
+
+        if encoding:
+            reply_headers["Content-Encoding"] = encoding
+        reply_headers["Content-Length"] = str(len(body))
+        return 200, reply_headers, b"" if head else body
+
+    def _not_modified(self, asset: Asset, headers: Mapping[str, str]) -> bool:
+        if_none_match = headers.get("if-none-match")
+        if if_none_match is not None:
+            return _etag_matches(if_none_match, asset.etag)
+        if_modified_since = headers.get("if-modified-since")
+        if if_modified_since:
+            try:
+                return asset.mtime <= int(parsedate_to_datetime(if_modified_since).timestamp())
+            except (TypeError, ValueError):
+                return False
+        return False
@@ -1,3 +1,11 @@
+import os
+import tempfile
+
+# Keep the test run away from the checked-in bank.db
+os.environ.setdefault(
+    "DATABASE_URL", "sqlite:///" + os.path.join(tempfile.mkdtemp(), "test_bank.db")
+)
+
 import pytest
 from fastapi.testclient import TestClient
 from app.main import app
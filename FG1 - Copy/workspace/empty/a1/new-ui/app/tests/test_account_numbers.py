@@ -0,0 +1,39 @@
+import sqlite3
+
+from app import models
+from app.database import SessionLocal
+from app.utils import find_account_by_numbers
+import manual_migrate_account_numbers as migration
+
+def test_new_accounts_get_persisted_numbers(client):
+    user_id = client.post("/users/", json={"username": "numbers", "name": "N", "password": "pw"}).json()["id"]
+    db = SessionLocal()
+    account = db.query(models.Account).filter_by(user_id=user_id).one()
+    assert len(account.routing_number) == 9 and account.routing_number.isdigit()
+    assert 10 <= len(account.account_number) <= 12
+
+    found = find_account_by_numbers(db, account.routing_number, account.account_number)
+    assert found.id == account.id
+    assert find_account_by_numbers(db, "000000000", account.account_number) is None
+    db.close()
+
+def test_backfill_keeps_legacy_numbers(tmp_path):
+    path = str(tmp_path / "legacy.db")
+    conn = sqlite3.connect(path)
+    conn.execute("CREATE TABLE accounts (id INTEGER PRIMARY KEY, user_id INTEGER NOT NULL)")
+    conn.executemany("INSERT INTO accounts (id, user_id) VALUES (?, ?)", [(i, i + 100) for i in range(1, 26)])
+    conn.commit()
+    conn.close()
+
+    assert migration.migrate(path, batch_size=10) == 25
+
+    conn = sqlite3.connect(path)
+    rows = conn.execute("SELECT id, user_id, routing_number, account_number FROM accounts").fetchall()
+    plan = conn.execute(
+        "EXPLAIN QUERY PLAN SELECT id FROM accounts WHERE account_number = ? AND routing_number = ?", ("x", "y")
+    ).fetchall()
+    conn.close()
+    for account_id, user_id, routing_number, account_number in rows:
+        assert routing_number == migration.legacy_routing_number(user_id)
+        assert account_number == migration.legacy_account_number(account_id)
+    assert "USING INDEX" in plan[0][3]
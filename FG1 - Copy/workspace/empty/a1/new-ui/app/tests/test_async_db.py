@@ -0,0 +1,47 @@
+import asyncio
+from decimal import Decimal
+
+import httpx
+import pytest
+
+from app import models
+from app.database import SessionLocal
+from app.main import app
+
+@pytest.fixture
+def anyio_backend():
+    return "asyncio"
+
+def _signup(client, username):
+    response = client.post("/users/", json={"username": username, "name": username, "password": "s3cret"})
+    assert response.status_code == 200
+    db = SessionLocal()
+    account_id = db.query(models.Account.id).filter_by(user_id=response.json()["id"]).scalar()
+    db.close()
+    token = client.post("/token", data={"username": username, "password": "s3cret"}).json()["access_token"]
+    return account_id, {"Authorization": f"Bearer {token}"}
+
+def test_authenticated_deposit(client):
+    account_id, headers = _signup(client, "async-auth")
+    response = client.post(f"/accounts/{account_id}/deposit", json={"amount": "10.00"}, headers=headers)
+    assert response.status_code == 200
+    assert Decimal(response.json()["balance"]) == Decimal("50.00")
+
+    response = client.post(f"/accounts/{account_id + 1000}/deposit", json={"amount": "10.00"}, headers=headers)
+    assert response.status_code == 404
+
+@pytest.mark.anyio
+async def test_concurrent_async_deposits(client):
+    account_id, headers = _signup(client, "async-many")
+
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://test") as ac:
+        responses = await asyncio.gather(*[
+            ac.post(f"/accounts/{account_id}/deposit", json={"amount": "1.00"}, headers=headers)
+            for _ in range(50)
+        ])
+    assert all(r.status_code == 200 for r in responses)
+
+    db = SessionLocal()
+    assert db.get(models.Account, account_id).balance == Decimal("90.00")
+    db.close()
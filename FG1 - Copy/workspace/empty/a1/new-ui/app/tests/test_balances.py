@@ -0,0 +1,63 @@
+from concurrent.futures import ThreadPoolExecutor
+from decimal import Decimal
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from app import models
+from app.balances import apply_balance_change, deposit_to_account
+
+@pytest.fixture
+def Session(tmp_path):
+    engine = create_engine(
+        f"sqlite:///{tmp_path / 'balances.db'}",
+        connect_args={"check_same_thread": False, "timeout": 30},
+    )
+    models.Base.metadata.create_all(bind=engine)
+    yield sessionmaker(autocommit=False, autoflush=False, bind=engine)
+    engine.dispose()
+
+def _make_account(db, balance="40.00"):
+    user = models.User(name="test")
+    db.add(user)
+    db.flush()
+    account = models.Account(user_id=user.id, balance=Decimal(balance))
+    db.add(account)
+    db.commit()
+    return account.id, user.id
+
+def test_apply_balance_change_reports_rows(Session):
+    db = Session()
+    account_id, user_id = _make_account(db)
+
+    assert apply_balance_change(db, account_id, Decimal("10.00")) == 1
+    assert apply_balance_change(db, account_id + 1, Decimal("10.00")) == 0
+    assert apply_balance_change(db, account_id, Decimal("5.00"), user_id=user_id + 1) == 0
+    assert apply_balance_change(db, account_id, Decimal("-100.00")) == 0
+    db.commit()
+
+    assert db.get(models.Account, account_id).balance == Decimal("50.00")
+    assert db.query(models.Transaction).count() == 1
+    db.close()
+
+def test_concurrent_deposits_do_not_lose_updates(Session):
+    db = Session()
+    account_id, _ = _make_account(db, "0.00")
+    db.close()
+
+    def worker(_):
+        session = Session()
+        try:
+            for _ in range(20):
+                deposit_to_account(session, account_id, Decimal("1.00"))
+        finally:
+            session.close()
+
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        list(pool.map(worker, range(8)))
+
+    db = Session()
+    assert db.get(models.Account, account_id).balance == Decimal("160.00")
+    assert db.query(models.Transaction).filter_by(account_id=account_id).count() == 160
+    db.close()
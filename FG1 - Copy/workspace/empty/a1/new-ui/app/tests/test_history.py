@@ -0,0 +1,66 @@
+import json
+from datetime import datetime, timedelta
+from decimal import Decimal
+
+from app import models
+from app.database import SessionLocal
+
+def _account_with_history(count):
+    db = SessionLocal()
+    user = models.User(name="history")
+    db.add(user)
+    db.flush()
+    account = models.Account(user_id=user.id, balance=0)
+    db.add(account)
+    db.flush()
+    # Half the rows share one server-generated timestamp, so ties on
+    # timestamp have to be broken by id
+    base = datetime(2025, 1, 1)
+    for i in range(count):
+        row = models.Transaction(account_id=account.id, amount=Decimal(i + 1))
+        if i % 2:
+            row.timestamp = base + timedelta(minutes=i)
+        db.add(row)
+    db.commit()
+    account_id = account.id
+    db.close()
+    return account_id
+
+def test_keyset_pagination_walks_full_history(client):
+    account_id = _account_with_history(23)
+    seen = []
+    cursor = None
+    while True:
+        params = {"limit": 7}
+        if cursor:
+            params["cursor"] = cursor
+        response = client.get(f"/accounts/{account_id}/transactions", params=params)
+        assert response.status_code == 200
+        page = response.json()
+        assert len(page) <= 7
+        seen.extend(page)
+        cursor = response.headers.get("x-next-cursor")
+        if not cursor:
+            break
+
+    assert len(seen) == 23
+    assert len({t["id"] for t in seen}) == 23
+    keys = [(t["timestamp"], t["id"]) for t in seen]
+    assert keys == sorted(keys, reverse=True)
+
+def test_bad_cursor_is_rejected(client):
+    response = client.get("/accounts/1/transactions", params={"cursor": "nope"})
+    assert response.status_code == 400
+
+def test_streaming_export(client):
+    account_id = _account_with_history(12)
+
+    response = client.get(f"/accounts/{account_id}/transactions/export")
+    assert response.headers["content-type"].startswith("application/x-ndjson")
+    rows = [json.loads(line) for line in response.text.splitlines()]
+    assert len(rows) == 12
+
+    response = client.get(f"/accounts/{account_id}/transactions/export", params={"format": "csv"})
+    lines = response.text.splitlines()
+    assert lines[0] == "id,account_id,amount,timestamp,transfer_type,status"
+    assert len(lines) == 13
@@ -0,0 +1,104 @@
+import asyncio
+import time
+from decimal import Decimal
+
+import httpx
+import pytest
+
+from app import models
+from app.database import SessionLocal
+from app.idempotency import REPLAY_HEADER
+from app.main import app
+
+@pytest.fixture
+def anyio_backend():
+    return "asyncio"
+
+def _signup(client, username):
+    response = client.post("/users/", json={"username": username, "name": username, "password": "s3cret"})
+    assert response.status_code == 200
+    user_id = response.json()["id"]
+    db = SessionLocal()
+    account_id = db.query(models.Account.id).filter_by(user_id=user_id).scalar()
+    db.close()
+    token = client.post("/token", data={"username": username, "password": "s3cret"}).json()["access_token"]
+    return user_id, account_id, {"Authorization": f"Bearer {token}"}
+
+def _balance(account_id):
+    db = SessionLocal()
+    try:
+        return db.get(models.Account, account_id).balance
+    finally:
+        db.close()
+
+def test_replay_returns_stored_response(client):
+    user_id, account_id, _ = _signup(client, "idem-replay")
+    headers = {"Idempotency-Key": "deposit-1"}
+    first = client.post(f"/users/{user_id}/deposit", json={"amount": "10.00"}, headers=headers)
+    second = client.post(f"/users/{user_id}/deposit", json={"amount": "10.00"}, headers=headers)
+    assert first.status_code == second.status_code == 200
+    assert first.json() == second.json()
+    assert REPLAY_HEADER not in first.headers
+    assert second.headers[REPLAY_HEADER] == "true"
+    assert _balance(account_id) == Decimal("50.00")
+
+    # A new key is a new deposit; no key keeps the old behaviour
+    assert client.post(f"/users/{user_id}/deposit", json={"amount": "10.00"},
+                       headers={"Idempotency-Key": "deposit-2"}).status_code == 200
+    assert client.post(f"/users/{user_id}/deposit", json={"amount": "10.00"}).status_code == 200
+    assert _balance(account_id) == Decimal("70.00")
+
+def test_key_reused_for_different_request(client):
+    user_id, _, _ = _signup(client, "idem-mismatch")
+    headers = {"Idempotency-Key": "same-key"}
+    assert client.post(f"/users/{user_id}/deposit", json={"amount": "10.00"}, headers=headers).status_code == 200
+    response = client.post(f"/users/{user_id}/deposit", json={"amount": "99.00"}, headers=headers)
+    assert response.status_code == 422
+
+def test_keys_are_scoped_per_user(client):
+    _, account_a, headers_a = _signup(client, "idem-scope-a")
+    _, account_b, headers_b = _signup(client, "idem-scope-b")
+    for account_id, headers in ((account_a, headers_a), (account_b, headers_b)):
+        response = client.post(f"/accounts/{account_id}/deposit", json={"amount": "5.00"},
+                               headers={**headers, "Idempotency-Key": "shared"})
+        assert response.status_code == 200
+        assert REPLAY_HEADER not in response.headers
+    assert _balance(account_a) == _balance(account_b) == Decimal("45.00")
+
+def test_client_errors_are_replayed(client):
+    _, account_id, headers = _signup(client, "idem-404")
+    headers = {**headers, "Idempotency-Key": "missing-account"}
+    first = client.post(f"/accounts/{account_id + 1000}/deposit", json={"amount": "5.00"}, headers=headers)
+    second = client.post(f"/accounts/{account_id + 1000}/deposit", json={"amount": "5.00"}, headers=headers)
+    assert first.status_code == second.status_code == 404
+    assert second.headers[REPLAY_HEADER] == "true"
+
+def test_abandoned_claim_is_taken_over(client):
+    user_id, account_id, _ = _signup(client, "idem-stale")
+    db = SessionLocal()
+    db.add(models.IdempotencyKey(
+        scope=f"POST /users/{user_id}/deposit", key="crashed", request_hash="x", owner="dead",
+        locked_until=time.time() - 1, expires_at=time.time() + 60,
+    ))
+    db.commit()
+    db.close()
+    response = client.post(f"/users/{user_id}/deposit", json={"amount": "10.00"},
+                           headers={"Idempotency-Key": "crashed"})
+    assert response.status_code == 200
+    assert _balance(account_id) == Decimal("50.00")
+
+@pytest.mark.anyio
+async def test_concurrent_duplicates_deposit_once(client):
+    _, account_id, headers = _signup(client, "idem-concurrent")
+    headers = {**headers, "Idempotency-Key": "burst"}
+
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://test") as ac:
+        responses = await asyncio.gather(*[
+            ac.post(f"/accounts/{account_id}/deposit", json={"amount": "1.00"}, headers=headers)
+            for _ in range(20)
+        ])
+    assert all(r.status_code == 200 for r in responses)
+    assert len({r.text for r in responses}) == 1
+    assert sum(REPLAY_HEADER not in r.headers for r in responses) == 1
+    assert _balance(account_id) == Decimal("41.00")
@@ -0,0 +1,95 @@
+from decimal import Decimal
+from sqlalchemy.exc import IntegrityError
+
+from app import models
+from app.database import SessionLocal
+
+def test_create_user_seeds_account(client):
+    response = client.post("/users/", json={"username": "onboard", "name": "Onboard", "password": "x"})
+    assert response.status_code == 200
+    user_id = response.json()["id"]
+
+    db = SessionLocal()
+    account = db.query(models.Account).filter_by(user_id=user_id).one()
+    assert account.balance == Decimal("40.00")
+    assert db.query(models.Transaction).filter_by(account_id=account.id).count() == 1
+    db.close()
+
+def test_bulk_onboarding(client):
+    names = [f"Customer {i}" for i in range(250)]
+    response = client.post("/users/bulk", json={"users": [{"name": n} for n in names]})
+    assert response.status_code == 200
+    body = response.json()
+    assert body["created"] == 250
+
+    db = SessionLocal()
+    users = db.query(models.User).filter(models.User.id.in_(body["user_ids"])).all()
+    assert sorted(u.name for u in users) == sorted(names)
+    accounts = db.query(models.Account).filter(models.Account.user_id.in_(body["user_ids"])).all()
+    assert len(accounts) == 250
+    assert all(a.balance == Decimal("40.00") for a in accounts)
+    seeded = db.query(models.Transaction).filter(
+        models.Transaction.account_id.in_([a.id for a in accounts])
+    ).count()
+    assert seeded == 250
+    db.close()
+
+def test_bulk_onboarding_rejects_bad_rows(client):
+    response = client.post("/users/bulk", json={"users": [{"name": "ok"}, {"name": " "}]})
+    assert response.status_code == 400
+    assert "users[1]" in response.json()["detail"]
+
+def test_bulk_onboarding_rejects_duplicate_usernames(client):
+    response = client.post("/users/bulk", json={"users": [
+        {"name": "a", "username": "bulk-dup-a"}, {"name": "b"}, {"name": "c", "username": "bulk-dup-a"},
+    ]})
+    assert response.status_code == 400
+    assert response.json()["detail"].startswith("users[2]:")
+
+    assert client.post("/users/bulk", json={"users": [{"name": "a", "username": "bulk-dup-a"}]}).status_code == 200
+    response = client.post("/users/bulk", json={"users": [
+        {"name": "x", "username": "bulk-dup-x"}, {"name": "a", "username": "bulk-dup-a"},
+    ]})
+    assert response.status_code == 400
+    assert response.json()["detail"] == "users[1]: Username already registered"
+
+    db = SessionLocal()
+    assert db.query(models.User).filter(models.User.username == "bulk-dup-x").count() == 0
+    db.close()
+
+def test_account_number_collisions_are_redrawn(client, monkeypatch):
+    taken = client.post("/users/", json={"username": "collide", "name": "C", "password": "x"}).json()["id"]
+    db = SessionLocal()
+    taken_number = db.query(models.Account).filter_by(user_id=taken).one().account_number
+    db.close()
+
+    # Every draw starts with the number already in use (and repeats it)
+    draws = iter([taken_number, taken_number, "5550000001", taken_number, "5550000002", "5550000003"])
+    monkeypatch.setattr("app.onboarding.generate_account_number", lambda: next(draws))
+    response = client.post("/users/", json={"username": "collide-2", "name": "C", "password": "x"})
+    assert response.status_code == 200
+    response = client.post("/users/bulk", json={"users": [{"name": "d"}, {"name": "e"}]})
+    assert response.status_code == 200
+
+    db = SessionLocal()
+    numbers = [
+        db.query(models.Account).filter_by(user_id=user_id).one().account_number
+        for user_id in [response.json()["user_ids"][0], response.json()["user_ids"][1]]
+    ]
+    assert db.query(models.Account).filter_by(account_number="5550000001").count() == 1
+    db.close()
+    assert sorted(numbers) == ["5550000002", "5550000003"]
+
+def test_only_username_violations_are_reported_as_taken(client, monkeypatch):
+    def violate(*args, **kwargs):
+        raise IntegrityError("INSERT INTO accounts", {}, Exception("UNIQUE constraint failed: accounts.account_number"))
+    monkeypatch.setattr("app.main.bulk_onboard_users", violate)
+    response = client.post("/users/bulk", json={"users": [{"name": "f"}]})
+    assert response.status_code == 500
+
+    def username_taken(*args, **kwargs):
+        raise IntegrityError("INSERT INTO users", {}, Exception("UNIQUE constraint failed: users.username"))
+    monkeypatch.setattr("app.main.bulk_onboard_users", username_taken)
+    response = client.post("/users/bulk", json={"users": [{"name": "g"}]})
+    assert response.status_code == 400
+    assert response.json()["detail"] == "Username already registered"
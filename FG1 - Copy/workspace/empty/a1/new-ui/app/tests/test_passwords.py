@@ -0,0 +1,62 @@
+import asyncio
+import threading
+
+import pytest
+
+from app.passwords import PasswordHasher, PasswordQueueFull
+
+def test_hasher_runs_off_the_event_loop():
+    hasher = PasswordHasher(workers=2)
+
+    async def main():
+        return await hasher.run(threading.get_ident)
+
+    assert asyncio.run(main()) != threading.get_ident()
+    assert hasher.stats()["completed"] == 1
+    hasher.shutdown()
+
+def test_hasher_rejects_when_queue_is_full():
+    hasher = PasswordHasher(workers=1, max_queue=2)
+    release = threading.Event()
+
+    async def main():
+        # One running, two waiting
+        pending = [asyncio.ensure_future(hasher.run(release.wait, 5)) for _ in range(3)]
+        await asyncio.sleep(0.05)
+        try:
+            assert hasher.stats()["queue_depth"] == 2
+            with pytest.raises(PasswordQueueFull):
+                await hasher.run(release.wait, 5)
+        finally:
+            release.set()
+        await asyncio.gather(*pending)
+        assert hasher.stats()["rejected"] == 1
+
+    asyncio.run(main())
+    hasher.shutdown()
+
+def test_cancelled_waiters_release_their_queue_slot():
+    hasher = PasswordHasher(workers=1, max_queue=2)
+    release = threading.Event()
+    ran = []
+
+    async def main():
+        running = asyncio.ensure_future(hasher.run(release.wait, 5))
+        await asyncio.sleep(0.05)
+        # Queued behind the busy worker, then the client disconnects
+        waiters = [asyncio.ensure_future(hasher.run(ran.append, i)) for i in range(2)]
+        await asyncio.sleep(0.05)
+        assert hasher.stats()["queue_depth"] == 2
+        for waiter in waiters:
+            waiter.cancel()
+        await asyncio.gather(*waiters, return_exceptions=True)
+        assert hasher.stats()["queue_depth"] == 0
+
+        # The slots are free again: new work is admitted, not rejected
+        release.set()
+        await running
+        assert await hasher.run(lambda: "ok") == "ok"
+        assert hasher.stats()["rejected"] == 0 and ran == []
+
+    asyncio.run(main())
+    hasher.shutdown()
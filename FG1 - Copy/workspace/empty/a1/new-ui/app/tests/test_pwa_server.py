@@ -0,0 +1,26 @@
+import http.client
+import os
+import threading
+
+import pytest
+
+from pwa_http_server import DIRECTORY, make_server
+
+@pytest.mark.parametrize("production", [False, True])
+def test_root_serves_index_html(production):
+    with open(os.path.join(DIRECTORY, "index.html"), "rb") as f:
+        index = f.read()
+    httpd = make_server(port=0, production=production)
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    try:
+        conn = http.client.HTTPConnection("127.0.0.1", httpd.server_address[1], timeout=5)
+        conn.request("GET", "/")
+        response = conn.getresponse()
+        assert response.status == 200
+        assert response.getheader("Content-Type").startswith("text/html")
+        assert response.read() == index
+        conn.close()
+    finally:
+        httpd.shutdown()
+        httpd.server_close()
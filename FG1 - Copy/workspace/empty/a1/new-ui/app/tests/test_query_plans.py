@@ -0,0 +1,42 @@
+from datetime import datetime
+
+import pytest
+from sqlalchemy import create_engine, func, select
+
+from app import models
+from app.history import _timeline, encode_cursor
+
+T = models.Transaction
+
+QUERIES = {
+    "history first page": _timeline(1).limit(51),
+    "history next page": _timeline(1, encode_cursor("2025-01-01 00:00:00", 5)).limit(51),
+    "cash deposit velocity": select(func.sum(T.amount)).where(
+        T.account_id == 1,
+        T.transfer_type == "CASH_DEPOSIT",
+        T.timestamp >= datetime(2025, 1, 1),
+    ),
+}
+
+@pytest.fixture(scope="module")
+def engine():
+    engine = create_engine("sqlite://")
+    models.Base.metadata.create_all(bind=engine)
+    yield engine
+    engine.dispose()
+
+def _plan(engine, stmt):
+    sql = str(stmt.compile(engine, compile_kwargs={"literal_binds": True}))
+    with engine.connect() as conn:
+        return [row[3] for row in conn.exec_driver_sql("EXPLAIN QUERY PLAN " + sql)]
+
+@pytest.mark.parametrize("name", QUERIES)
+def test_transaction_queries_use_index(engine, name):
+    plan = _plan(engine, QUERIES[name])
+    assert any(step.startswith("SEARCH transactions USING") for step in plan), plan
+    assert not any(step.startswith("SCAN transactions") for step in plan), plan
+    assert not any("TEMP B-TREE" in step for step in plan), plan
+
+def test_velocity_query_is_covered(engine):
+    plan = _plan(engine, QUERIES["cash deposit velocity"])
+    assert any("COVERING INDEX ix_transactions_account_type_timestamp" in step for step in plan), plan
@@ -0,0 +1,35 @@
+from app.static_cache import _accepts
+
+def test_spa_fallback_serves_index_from_memory(client):
+    response = client.get("/some/client/route")
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/html")
+    assert response.headers["cache-control"] == "no-cache"
+    etag = response.headers["etag"]
+
+    response = client.get("/some/client/route", headers={"If-None-Match": etag})
+    assert response.status_code == 304
+    assert response.content == b""
+
+def test_fingerprinted_assets_are_immutable_and_compressed(client):
+    response = client.get("/assets/index-DPBNiJfi.js", headers={"Accept-Encoding": "gzip"})
+    assert response.status_code == 200
+    assert "javascript" in response.headers["content-type"]
+    assert response.headers["cache-control"] == "public, max-age=31536000, immutable"
+    assert response.headers["content-encoding"] == "gzip"
+    assert response.headers["vary"] == "Accept-Encoding"
+
+    last_modified = response.headers["last-modified"]
+    response = client.get("/assets/index-DPBNiJfi.js", headers={"If-Modified-Since": last_modified})
+    assert response.status_code == 304
+
+def test_missing_asset_is_not_answered_with_index(client):
+    assert client.get("/assets/missing-00000000.js").status_code == 404
+
+def test_malformed_q_value_is_not_accepted(client):
+    response = client.get("/assets/index-DPBNiJfi.js", headers={"Accept-Encoding": "gzip;q=high, br;q="})
+    assert response.status_code == 200
+    assert "content-encoding" not in response.headers
+
+    assert _accepts("gzip;q=0.5", "gzip") and _accepts("gzip", "gzip")
+    assert not _accepts("gzip;q=0", "gzip") and not _accepts("gzip;q=x", "gzip")
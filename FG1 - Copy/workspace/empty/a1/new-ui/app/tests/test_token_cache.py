@@ -0,0 +1,41 @@
+import time
+
+from app import auth, models
+from app.database import SessionLocal
+from app.token_cache import Principal, TokenCache, token_cache
+
+def test_lru_eviction_and_expiry():
+    cache = TokenCache(max_size=2)
+    now = time.time()
+    cache.put("a", Principal(id=1, username="a"), now + 60)
+    cache.put("b", Principal(id=2, username="b"), now + 60)
+    cache.get("a")
+    cache.put("c", Principal(id=3, username="c"), now + 60)
+    assert cache.get("b") is None
+    assert cache.get("a").id == 1
+
+    cache.put("old", Principal(id=4, username="old"), now - 1)
+    assert cache.get("old") is None
+
+def test_authenticated_requests_skip_decode_until_password_change(client, monkeypatch):
+    client.post("/users/", json={"username": "cached", "name": "Cached", "password": "pw"})
+    token = client.post("/token", data={"username": "cached", "password": "pw"}).json()["access_token"]
+    headers = {"Authorization": f"Bearer {token}"}
+
+    decodes = []
+    real_decode = auth.jwt.decode
+    monkeypatch.setattr(auth.jwt, "decode", lambda *a, **kw: decodes.append(1) or real_decode(*a, **kw))
+
+    token_cache.clear()
+    for _ in range(3):
+        assert client.get("/users/me/account", headers=headers).status_code == 200
+    assert len(decodes) == 1
+
+    db = SessionLocal()
+    user = db.query(models.User).filter_by(username="cached").one()
+    user.hashed_password = auth.get_password_hash("new-pw")
+    db.commit()
+    db.close()
+
+    assert client.get("/users/me/account", headers=headers).status_code == 200
+    assert len(decodes) == 2
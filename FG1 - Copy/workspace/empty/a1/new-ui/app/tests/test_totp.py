@@ -0,0 +1,93 @@
+import asyncio
+import time
+
+from app import models
+from app.database import AsyncSessionLocal, SessionLocal
+from app.totp import TotpState, TotpVerifier, totp_verifier
+
+# RFC 6238 appendix B, SHA-1 ("12345678901234567890" in base32)
+RFC_SECRET = "GEZDGNBVGY3TQOJQGEZDGNBVGY3TQOJQ"
+
+def test_rfc6238_vectors():
+    state = TotpState(RFC_SECRET, digits=8)
+    for t, expected in [(59, "94287082"), (1111111109, "07081804"), (1234567890, "89005924")]:
+        assert state.code(t // 30) == expected
+
+def _users_with_secret(*usernames):
+    db = SessionLocal()
+    users = [models.User(username=name, name=name, twofa_secret=RFC_SECRET, twofa_enabled=1) for name in usernames]
+    db.add_all(users)
+    db.commit()
+    ids = [user.id for user in users]
+    db.close()
+    return ids
+
+async def _verify(verifier, user_id, code, now):
+    # A fresh session per check, as each request gets
+    async with AsyncSessionLocal() as db:
+        return await verifier.verify(db, await db.get(models.User, user_id), code, now=now)
+
+def test_drift_window_and_replay():
+    first, second = _users_with_secret("totp-drift-1", "totp-drift-2")
+    verifier = TotpVerifier(window=1)
+    now = 1_700_000_000
+    state = TotpState(RFC_SECRET)
+    step = now // 30
+
+    async def main():
+        assert await _verify(verifier, first, state.code(step - 1), now)
+        assert not await _verify(verifier, first, state.code(step - 1), now)  # same code again
+        assert await _verify(verifier, first, state.code(step + 1), now)
+        assert not await _verify(verifier, first, state.code(step), now)  # older than the last one used
+        assert not await _verify(verifier, second, state.code(step + 2), now)  # outside the window
+        assert await _verify(verifier, second, state.code(step), now)  # replays are per user
+        assert not await _verify(verifier, second, "12345", now)
+        assert verifier.stats()["replays_rejected"] == 2
+
+    asyncio.run(main())
+
+def test_replay_guard_is_shared_and_persistent():
+    (user_id,) = _users_with_secret("totp-shared")
+    now = 1_700_000_000
+    code = TotpState(RFC_SECRET).code(now // 30)
+
+    async def main():
+        # Two workers (separate verifiers and caches) racing with one code
+        results = await asyncio.gather(*(_verify(TotpVerifier(), user_id, code, now) for _ in range(4)))
+        assert sorted(results) == [False, False, False, True]
+        # ...and a restarted one still refuses it
+        assert not await _verify(TotpVerifier(), user_id, code, now)
+
+    asyncio.run(main())
+    db = SessionLocal()
+    assert db.get(models.User, user_id).last_totp_step == now // 30
+    db.close()
+
+def test_state_cached_until_secret_changes():
+    verifier = TotpVerifier(cache_size=2)
+    first = verifier.state(1, RFC_SECRET)
+    assert verifier.state(1, RFC_SECRET) is first
+    assert verifier.state(1, "JBSWY3DPEHPK3PXP") is not first
+    verifier.state(2, RFC_SECRET)
+    verifier.state(3, RFC_SECRET)
+    assert verifier.stats()["size"] == 2
+
+def test_login_with_2fa(client):
+    client.post("/users/", json={"username": "totp-user", "name": "Totp", "password": "pw"})
+    token = client.post("/token", data={"username": "totp-user", "password": "pw"}).json()["access_token"]
+    headers = {"Authorization": f"Bearer {token}"}
+
+    setup = client.post("/2fa/setup", headers=headers).json()
+    assert setup["otpauth_uri"].startswith("otpauth://totp/")
+    state = TotpState(setup["secret"])
+    step = int(time.time() // 30)
+    assert client.post("/2fa/enable", json={"code": "000000" if state.code(step) != "000000" else "111111"},
+                       headers=headers).status_code == 400
+    assert client.post("/2fa/enable", json={"code": state.code(step)}, headers=headers).status_code == 200
+
+    response = client.post("/token", data={"username": "totp-user", "password": "pw"})
+    assert response.status_code == 401 and response.headers["X-2FA-Required"] == "true"
+    code = state.code(step + 1)
+    assert client.post("/token", data={"username": "totp-user", "password": "pw", "otp": code}).status_code == 200
+    assert client.post("/token", data={"username": "totp-user", "password": "pw", "otp": code}).status_code == 401
+    assert totp_verifier.stats()["replays_rejected"] >= 1
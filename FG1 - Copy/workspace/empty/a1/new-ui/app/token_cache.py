@@ -0,0 +1,122 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Optional
+from sqlalchemy import event, inspect
+from . import models
+from .config import settings
+
+# User columns that make previously issued tokens stale when they change
+SECURITY_COLUMNS = ("username", "hashed_password", "twofa_secret", "twofa_enabled")
+
+@dataclass(frozen=True)
+class Principal:
+    """The authenticated user, as resolved from a verified JWT."""
+    id: int
+    username: str
+    name: Optional[str] = None
+    twofa_enabled: bool = False
+
+    @classmethod
+    def from_user(cls, user: models.User) -> "Principal":
+        return cls(
+            id=user.id,
+            username=user.username,
+            name=user.name,
+            twofa_enabled=bool(user.twofa_enabled),
+        )
+
+def token_digest(token: str) -> bytes:
+    return hashlib.sha256(token.encode()).digest()
+
+class TokenCache:
+    """
+    Bounded LRU of verified tokens, keyed by SHA-256 of the token.
+
+    An entry lives until the token's `exp` claim (or `max_ttl` seconds, if
+    set, whichever is sooner), so a hit skips both the HMAC check and the
+    user lookup. Entries for a user are dropped by invalidate_user(), which
+    runs automatically when a User row's credentials or 2FA settings change
+    through the ORM. The cache is per process; max_ttl bounds how long other
+    workers can keep serving a stale entry.
+    """
+
+    def __init__(self, max_size: int, max_ttl: int = 0):
+        self.max_size = max_size
+        self.max_ttl = max_ttl
+        self._entries: OrderedDict[bytes, tuple[Principal, float]] = OrderedDict()
+        self._by_user: dict[int, set[bytes]] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, token: str) -> Optional[Principal]:
+        if self.max_size <= 0:
+            return None
+        key = token_digest(token)
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            principal, expires_at = entry
+            if expires_at <= now:
+                self._discard(key)
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return principal
+
+    def put(self, token: str, principal: Principal, exp: float):
+        if self.max_size <= 0:
+            return
+        expires_at = exp
+        if self.max_ttl:
+            expires_at = min(expires_at, time.time() + self.max_ttl)
+        key = token_digest(token)
+        with self._lock:
+            self._discard(key)
+            self._entries[key] = (principal, expires_at)
+            self._by_user.setdefault(principal.id, set()).add(key)
+            while len(self._entries) > self.max_size:
+                oldest = next(iter(self._entries))
+                self._discard(oldest)
+
+    def invalidate_user(self, user_id: int):
+        with self._lock:
+            for key in self._by_user.pop(user_id, ()):
+                self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._by_user.clear()
+
+    def _discard(self, key: bytes):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            user_keys = self._by_user.get(entry[0].id)
+            if user_keys is not None:
+                user_keys.discard(key)
+                if not user_keys:
+                    del self._by_user[entry[0].id]
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"size": len(self._entries), "hits": self.hits, "misses": self.misses}
+
+token_cache = TokenCache(settings.token_cache_size, settings.token_cache_max_ttl)
+
+@event.listens_for(models.User, "after_update")
+def _invalidate_on_credential_change(mapper, connection, target):
+    state = inspect(target)
+    if any(state.attrs[column].history.has_changes() for column in SECURITY_COLUMNS):
+        token_cache.invalidate_user(target.id)
+
+@event.listens_for(models.User, "after_delete")
+def _invalidate_on_delete(mapper, connection, target):
+    token_cache.invalidate_user(target.id)
@@ -0,0 +1,168 @@
+import base64
+import hashlib
+import hmac
+import secrets
+import struct
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional
+from urllib.parse import quote
+from sqlalchemy import event, inspect, or_, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm.attributes import set_committed_value
+from . import models
+from .config import settings
+
+def generate_secret() -> str:
+    """A random 160-bit base32 secret, the size RFC 4226 recommends for SHA-1."""
+    return base64.b32encode(secrets.token_bytes(20)).decode()
+
+def provisioning_uri(secret: str, username: str, issuer: str = None, digits: int = 6, step: int = 30) -> str:
+    """otpauth:// URI for authenticator apps (usually shown as a QR code)."""
+    issuer = issuer or settings.totp_issuer
+    label = quote(f"{issuer}:{username}")
+    return (f"otpauth://totp/{label}?secret={secret}&issuer={quote(issuer)}"
+            f"&digits={digits}&period={step}")
+
+class TotpState:
+    """
+    One secret, decoded once. Holds an HMAC already keyed with the secret,
+    so each code costs a copy() and one update instead of a base32 decode
+    and a fresh HMAC key schedule, and remembers the codes of the last few
+    time steps, so checks within the same 30 seconds reuse them.
+    """
+
+    __slots__ = ("secret", "digits", "_mac", "_codes")
+
+    def __init__(self, secret: str, digits: int = 6, digest=hashlib.sha1):
+        self.secret = secret
+        self.digits = digits
+        key = base64.b32decode(secret.upper() + "=" * (-len(secret) % 8))
+        self._mac = hmac.new(key, digestmod=digest)
+        self._codes: dict[int, str] = {}
+
+    def code(self, counter: int) -> str:
+        code = self._codes.get(counter)
+        if code is None:
+            mac = self._mac.copy()
+            mac.update(struct.pack(">Q", counter))
+            digest = mac.digest()
+            offset = digest[-1] & 0x0F
+            value = struct.unpack(">I", digest[offset:offset + 4])[0] & 0x7FFFFFFF
+            code = str(value % 10 ** self.digits).zfill(self.digits)
+            if len(self._codes) >= 8:
+                self._codes.clear()
+            self._codes[counter] = code
+        return code
+
+    def match(self, code: str, counter: int, deltas) -> Optional[int]:
+        """The step counter + delta, trying `deltas` in order, whose code is `code`; None if none match."""
+        for delta in deltas:
+            if hmac.compare_digest(self.code(counter + delta), code):
+                return counter + delta
+        return None
+
+async def claim_step(db: AsyncSession, user: models.User, step: int) -> bool:
+    """
+    Record `step` as the user's last accepted TOTP step, if it is later
+    than the one stored, and commit. A code is accepted at most once and
+    never after a later one (RFC 6238 section 5.2). The check and the write
+    are one guarded UPDATE on users.last_totp_step, so it holds across
+    workers and restarts: of two logins racing with the same code, only
+    one matches the row.
+    """
+    result = await db.execute(
+        update(models.User)
+        .where(
+            models.User.id == user.id,
+            or_(models.User.last_totp_step.is_(None), models.User.last_totp_step < step),
+        )
+        .values(last_totp_step=step)
+        .execution_options(synchronize_session=False)
+    )
+    await db.commit()
+    if result.rowcount != 1:
+        return False
+    # Keep the loaded row current without marking it dirty
+    set_committed_value(user, "last_totp_step", step)
+    return True
+
+class TotpVerifier:
+    """
+    TOTP checks for users with 2FA on. Decoded per-user state is kept in an
+    LRU of `cache_size` users, keyed by user id and checked against the
+    secret passed in, so a changed secret is picked up without a separate
+    invalidation. Codes up to `window` steps either side of now are
+    accepted, to allow for clock drift; an accepted step is stored on the
+    user (claim_step) and the same code is refused if presented again.
+    """
+
+    def __init__(self, cache_size: int = 10000, window: int = 1, step: int = 30, digits: int = 6):
+        self.cache_size = cache_size
+        self.window = window
+        self.step = step
+        self.digits = digits
+        # Current step first, then outward: almost every code is for now
+        self._deltas = sorted(range(-window, window + 1), key=abs)
+        self._states: OrderedDict[int, TotpState] = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.replays_rejected = 0
+
+    def state(self, user_id: int, secret: str) -> TotpState:
+        with self._lock:
+            state = self._states.get(user_id)
+            if state is not None and state.secret == secret:
+                self._states.move_to_end(user_id)
+                self.hits += 1
+                return state
+            self.misses += 1
+        state = TotpState(secret, self.digits)
+        if self.cache_size > 0:
+            with self._lock:
+                self._states[user_id] = state
+                self._states.move_to_end(user_id)
+                while len(self._states) > self.cache_size:
+                    self._states.popitem(last=False)
+        return state
+
+    def match(self, user_id: int, secret: str, code: str, now: float = None) -> Optional[int]:
+        """The time step `code` is valid for under `secret`, within the drift window; None if invalid."""
+        code = (code or "").strip().replace(" ", "")
+        if len(code) != self.digits or not code.isdigit() or not secret:
+            return None
+        now = time.time() if now is None else now
+        return self.state(user_id, secret).match(code, int(now // self.step), self._deltas)
+
+    async def verify(self, db: AsyncSession, user: models.User, code: str, now: float = None) -> bool:
+        """True if `code` is valid for the user's secret now and its step was not used before; commits."""
+        matched = self.match(user.id, user.twofa_secret, code, now)
+        if matched is None:
+            return False
+        if not await claim_step(db, user, matched):
+            with self._lock:
+                self.replays_rejected += 1
+            return False
+        return True
+
+    def invalidate_user(self, user_id: int):
+        with self._lock:
+            self._states.pop(user_id, None)
+
+    def clear(self):
+        with self._lock:
+            self._states.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"size": len(self._states), "hits": self.hits, "misses": self.misses,
+                    "replays_rejected": self.replays_rejected}
+
+totp_verifier = TotpVerifier(settings.totp_cache_size, settings.totp_window)
+
+@event.listens_for(models.User, "after_update")
+def _invalidate_on_secret_change(mapper, connection, target):
+    if inspect(target).attrs.twofa_secret.history.has_changes():
+        totp_verifier.invalidate_user(target.id)
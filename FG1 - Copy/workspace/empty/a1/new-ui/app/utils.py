@@ -26,4 +26,15 @@ def generate_account_number():
     Generate a random 10-12 digit account number
     """
     length = random.randint(10, 12)
-    return ''.join(str(random.randint(0, 9)) for _ in range(length))
\ No newline at end of file
+    return ''.join(str(random.randint(0, 9)) for _ in range(length))
+
+def find_account_by_numbers(db, routing_number: str, account_number: str):
+    """
+    Find the account an incoming ACH entry is addressed to.
+    Uses the unique index on account_number; returns None if there is no match.
+    """
+    from .models import Account
+    return db.query(Account).filter(
+        Account.account_number == account_number,
+        Account.routing_number == routing_number
+    ).first()
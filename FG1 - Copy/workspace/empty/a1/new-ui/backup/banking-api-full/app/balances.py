@@ -0,0 +1,158 @@
+from decimal import Decimal
+from typing import Optional
+from sqlalchemy import and_, func, insert, select, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session, aliased
+from app.models import AccountBalance, BalanceSnapshot, Transaction
+
+CENT = Decimal("0.01")
+
+def _money(value) -> Decimal:
+    """Ledger amounts are floats; balances are compared and stored in whole cents."""
+    return Decimal(str(value or 0)).quantize(CENT)
+
+def _ledger_total(db: Session, user_id: int) -> Decimal:
+    return _money(db.execute(
+        select(func.coalesce(func.sum(Transaction.amount), 0.0)).where(Transaction.user_id == user_id)
+    ).scalar_one())
+
+def ensure_balance(db: Session, user_id: int) -> Decimal:
+    """
+    Return the materialized balance for `user_id`, creating the row from the
+    ledger the first time (users that predate account_balances).
+    """
+    balance = db.execute(select(AccountBalance.balance).where(AccountBalance.user_id == user_id)).scalar_one_or_none()
+    if balance is not None:
+        return balance
+
+    total = _ledger_total(db, user_id)
+    try:
+        with db.begin_nested():
+            db.execute(insert(AccountBalance).values(user_id=user_id, balance=total))
+    except IntegrityError:
+        # A concurrent request created it first
+        pass
+    return db.execute(select(AccountBalance.balance).where(AccountBalance.user_id == user_id)).scalar_one()
+
+def get_balance(db: Session, user_id: int) -> Decimal:
+    """O(1) balance read: one primary-key lookup, regardless of history size."""
+    return ensure_balance(db, user_id)
+
+def post_transaction(db: Session, user_id: int, amount: float) -> Optional[Transaction]:
+    """
+    Record a transaction and move the materialized balance with it.
+
+    The balance changes through a conditional
+    UPDATE account_balances SET balance = balance + :amount WHERE ...
+    which also rejects debits that would go below zero, so the check and
+    the write cannot race. The Transaction row is only inserted if the
+    UPDATE matched. The caller owns the transaction and must commit.
+
+    Returns:
+        Transaction | None: the new row, or None for insufficient funds
+    """
+    ensure_balance(db, user_id)
+    delta = Decimal(str(amount))
+    stmt = (
+        update(AccountBalance)
+        .where(AccountBalance.user_id == user_id)
+        .values(balance=AccountBalance.balance + delta)
+        .execution_options(synchronize_session=False)
+    )
+    if delta < 0:
+        stmt = stmt.where(AccountBalance.balance + delta >= 0)
+    if not db.execute(stmt).rowcount:
+        return None
+
+    tx = Transaction(user_id=user_id, amount=amount)
+    db.add(tx)
+    db.flush()
+    return tx
+
+def _reconcile_batch(db: Session, after_user_id: int, batch_size: int):
+    snapshot = aliased(BalanceSnapshot)
+    latest_snapshot_id = (
+        select(func.max(BalanceSnapshot.id))
+        .where(BalanceSnapshot.user_id == AccountBalance.user_id)
+        .correlate(AccountBalance)
+        .scalar_subquery()
+    )
+    # One statement, so the stored balance and the ledger are read consistently
+    return db.execute(
+        select(
+            AccountBalance.user_id,
+            AccountBalance.balance,
+            snapshot.balance,
+            snapshot.transaction_id,
+            func.sum(Transaction.amount),
+            func.max(Transaction.id),
+        )
+        .select_from(AccountBalance)
+        .outerjoin(snapshot, snapshot.id == latest_snapshot_id)
+        .outerjoin(Transaction, and_(
+            Transaction.user_id == AccountBalance.user_id,
+            Transaction.id > func.coalesce(snapshot.transaction_id, 0),
+        ))
+        .where(AccountBalance.user_id > after_user_id)
+        .group_by(AccountBalance.user_id, AccountBalance.balance, snapshot.balance, snapshot.transaction_id)
+        .order_by(AccountBalance.user_id)
+        .limit(batch_size)
+    ).all()
+
+def _rederive(db: Session, user_id: int):
+    # Stored balance and the whole ledger in one statement, so they agree
+    return db.execute(
+        select(AccountBalance.balance, func.sum(Transaction.amount), func.max(Transaction.id))
+        .select_from(AccountBalance)
+        .outerjoin(Transaction, Transaction.user_id == AccountBalance.user_id)
+        .where(AccountBalance.user_id == user_id)
+        .group_by(AccountBalance.balance)
+    ).one()
+
+def reconcile(db: Session, batch_size: int = 500, fix: bool = False) -> dict:
+    """
+    Re-derive every materialized balance from the ledger and report drift.
+
+    Works through account_balances in user_id order, `batch_size` users per
+    query and commit. Each balance is first derived as the user's latest
+    snapshot plus the transactions after it, so a run only reads new
+    history. That shortcut can be wrong: transaction ids are handed out at
+    insert, not commit, so on Postgres a posting with a lower id than the
+    snapshot's can commit after the snapshot was taken and is then never
+    counted. So any mismatch is re-derived from the user's whole ledger
+    before it is reported, and the fresh snapshot is taken from that.
+    Users with new transactions get a fresh snapshot at the derived value.
+    With `fix`, drifted balances are overwritten with the derived value.
+
+    Returns:
+        dict: {"checked": n, "snapshots": n, "rederived": n,
+               "drift": [{"user_id", "stored", "derived"}, ...]}
+    """
+    report = {"checked": 0, "snapshots": 0, "rederived": 0, "drift": []}
+    after = 0
+    while True:
+        rows = _reconcile_batch(db, after, batch_size)
+        if not rows:
+            break
+        for user_id, stored, snap_balance, snap_tx_id, delta, last_tx_id in rows:
+            derived = _money(snap_balance) + _money(delta)
+            if stored != derived:
+                stored, total, last_tx_id = _rederive(db, user_id)
+                derived = _money(total)
+                report["rederived"] += 1
+            if stored != derived:
+                report["drift"].append({"user_id": user_id, "stored": stored, "derived": derived})
+                if fix:
+                    db.execute(
+                        update(AccountBalance)
+                        .where(AccountBalance.user_id == user_id)
+                        .values(balance=AccountBalance.balance + (derived - stored))
+                        .execution_options(synchronize_session=False)
+                    )
+            if last_tx_id is not None:
+                db.add(BalanceSnapshot(user_id=user_id, balance=derived, transaction_id=last_tx_id))
+                report["snapshots"] += 1
+        report["checked"] += len(rows)
+        db.commit()
+        after = rows[-1][0]
+    return report
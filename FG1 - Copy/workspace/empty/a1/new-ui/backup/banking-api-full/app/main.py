@@ -2,6 +2,7 @@ from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from app.routes import auth, accounts
 from app.webhooks import router as webhook_router
+from app.rate_limit import RateLimitMiddleware
 from fastapi.responses import JSONResponse
 from fastapi.requests import Request
 import logging
@@ -24,6 +25,8 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+# Per-user token bucket on /accounts (RATE_LIMIT requests per RATE_PERIOD seconds)
+app.add_middleware(RateLimitMiddleware)
 
 app.include_router(auth.router)
 app.include_router(accounts.router)
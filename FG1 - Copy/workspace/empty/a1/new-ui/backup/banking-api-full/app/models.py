@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, DateTime, Float, ForeignKey
+from sqlalchemy import Column, Integer, String, DateTime, Float, ForeignKey, Index, Numeric
 from sqlalchemy.ext.declarative import declarative_base
 import datetime
 
@@ -20,5 +20,22 @@ class License(Base):
 class Transaction(Base):
     __tablename__ = "transactions"
     id = Column(Integer, primary_key=True, index=True)
-    user_id = Column(Integer, ForeignKey('users.id'))
+    user_id = Column(Integer, ForeignKey('users.id'), index=True)
     amount = Column(Float)
+
+class AccountBalance(Base):
+    """Materialized running balance, updated in the same transaction as each posting."""
+    __tablename__ = "account_balances"
+    user_id = Column(Integer, ForeignKey('users.id'), primary_key=True)
+    balance = Column(Numeric(14, 2), nullable=False, default=0)
+    updated_at = Column(DateTime, default=datetime.datetime.utcnow, onupdate=datetime.datetime.utcnow)
+
+class BalanceSnapshot(Base):
+    """Checkpoint written by reconciliation: the ledger sum up to transaction_id."""
+    __tablename__ = "balance_snapshots"
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, ForeignKey('users.id'), nullable=False)
+    balance = Column(Numeric(14, 2), nullable=False)
+    transaction_id = Column(Integer, nullable=False)
+    created_at = Column(DateTime, default=datetime.datetime.utcnow)
+    __table_args__ = (Index("ix_balance_snapshots_user_id_id", "user_id", "id"),)
@@ -0,0 +1,219 @@
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from jose import jwt, JWTError
+from starlette.concurrency import run_in_threadpool
+
+RATE_LIMIT = int(os.getenv("RATE_LIMIT", "5"))  # burst size
+RATE_PERIOD = float(os.getenv("RATE_PERIOD", "60"))  # seconds to refill a full burst
+RATE_LIMIT_BACKEND = os.getenv("RATE_LIMIT_BACKEND", "memory")  # memory | sqlite
+RATE_LIMIT_DB = os.getenv("RATE_LIMIT_DB", "rate_limits.db")
+RATE_LIMIT_MAX_KEYS = int(os.getenv("RATE_LIMIT_MAX_KEYS", "100000"))
+# How long a SQLite hit may wait on another worker's write lock before failing open
+RATE_LIMIT_BUSY_TIMEOUT = float(os.getenv("RATE_LIMIT_BUSY_TIMEOUT", "0.05"))
+
+logger = logging.getLogger(__name__)
+
+class TokenBucket:
+    """
+    Token bucket parameters: `capacity` requests may be made back to back,
+    then one more every `period / capacity` seconds. A key whose bucket has
+    refilled completely carries no information, so backends may forget it
+    after `ttl` seconds of inactivity.
+    """
+
+    def __init__(self, capacity: int, period: float):
+        self.capacity = float(capacity)
+        self.rate = capacity / period
+        self.ttl = period
+
+    def take(self, tokens: float, updated_at: float, now: float):
+        """Return (allowed, tokens_left) after refilling to `now` and spending one token."""
+        tokens = min(self.capacity, tokens + (now - updated_at) * self.rate)
+        if tokens >= 1:
+            return True, tokens - 1
+        return False, tokens
+
+    def retry_after(self, tokens_left: float) -> float:
+        return max(0.0, (1 - tokens_left) / self.rate)
+
+class MemoryBackend:
+    """
+    Per-process bucket store: one (tokens, updated_at) pair per active key,
+    held in LRU order so idle keys expire from the front and the store
+    never grows past `max_keys`.
+    """
+
+    blocking = False  # a dict lookup under a lock: fine on the event loop
+
+    def __init__(self, bucket: TokenBucket, max_keys: int = RATE_LIMIT_MAX_KEYS):
+        self.bucket = bucket
+        self.max_keys = max_keys
+        self._state: OrderedDict[str, tuple[float, float]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def hit(self, key: str, now: float = None):
+        now = time.time() if now is None else now
+        with self._lock:
+            tokens, updated_at = self._state.pop(key, (self.bucket.capacity, now))
+            allowed, tokens = self.bucket.take(tokens, updated_at, now)
+            self._state[key] = (tokens, now)
+            self._expire(now)
+        return allowed, tokens
+
+    def _expire(self, now: float):
+        cutoff = now - self.bucket.ttl
+        while self._state:
+            key, (_, updated_at) = next(iter(self._state.items()))
+            if updated_at > cutoff and len(self._state) <= self.max_keys:
+                break
+            del self._state[key]
+
+    def __len__(self):
+        return len(self._state)
+
+class SQLiteBackend:
+    """
+    Bucket store shared by every worker process on the host through one
+    SQLite file. Each hit is a single atomic UPSERT ... RETURNING, so
+    concurrent workers cannot double-spend a token. Rows idle for longer
+    than the bucket TTL are purged every `purge_every` hits.
+
+    A hit waits at most `busy_timeout` seconds for another worker's write
+    lock; past that, or on any other SQLite error, the request is allowed
+    (fail open) and counted in `errors`, so a stuck rate limit file slows
+    nothing down and never takes the API with it.
+    """
+
+    blocking = True  # file I/O and lock waits: run off the event loop
+
+    def __init__(self, bucket: TokenBucket, path: str = RATE_LIMIT_DB, purge_every: int = 1000,
+                 busy_timeout: float = RATE_LIMIT_BUSY_TIMEOUT):
+        self.bucket = bucket
+        self.path = path
+        self.purge_every = purge_every
+        self.busy_timeout = busy_timeout
+        self._local = threading.local()
+        self._hits = 0
+        self.errors = 0
+        conn = self._conn()
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS rate_limits ("
+            " key TEXT PRIMARY KEY, tokens REAL NOT NULL, updated_at REAL NOT NULL, allowed INTEGER NOT NULL"
+            ") WITHOUT ROWID"
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS ix_rate_limits_updated_at ON rate_limits (updated_at)")
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=self.busy_timeout, isolation_level=None,
+                                   check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=OFF")  # losing a few counters on power loss is fine
+            self._local.conn = conn
+        return conn
+
+    def hit(self, key: str, now: float = None):
+        now = time.time() if now is None else now
+        cap, rate = self.bucket.capacity, self.bucket.rate
+        # refilled = min(capacity, tokens + elapsed * rate); spend one if refilled >= 1
+        refilled = "min(:cap, rate_limits.tokens + (:now - rate_limits.updated_at) * :rate)"
+        try:
+            row = self._conn().execute(
+                "INSERT INTO rate_limits (key, tokens, updated_at, allowed) VALUES (:key, :cap - 1, :now, 1) "
+                "ON CONFLICT (key) DO UPDATE SET "
+                f" allowed = {refilled} >= 1,"
+                f" tokens = CASE WHEN {refilled} >= 1 THEN {refilled} - 1 ELSE {refilled} END,"
+                " updated_at = :now "
+                "RETURNING allowed, tokens",
+                {"key": key, "cap": cap, "rate": rate, "now": now},
+            ).fetchone()
+        except sqlite3.Error as e:
+            self.errors += 1
+            logger.warning("Rate limit store unavailable, allowing request: %s", e)
+            return True, cap - 1
+
+        self._hits += 1
+        if self._hits % self.purge_every == 0:
+            try:
+                self.purge(now)
+            except sqlite3.Error as e:
+                logger.warning("Rate limit purge failed: %s", e)
+        return bool(row[0]), row[1]
+
+    def purge(self, now: float = None):
+        now = time.time() if now is None else now
+        self._conn().execute("DELETE FROM rate_limits WHERE updated_at < ?", (now - self.bucket.ttl,))
+
+    def __len__(self):
+        return self._conn().execute("SELECT count(*) FROM rate_limits").fetchone()[0]
+
+def make_backend(name: str = RATE_LIMIT_BACKEND, limit: int = RATE_LIMIT, period: float = RATE_PERIOD):
+    bucket = TokenBucket(limit, period)
+    if name == "sqlite":
+        return SQLiteBackend(bucket)
+    if name == "memory":
+        return MemoryBackend(bucket)
+    raise ValueError(f"Unknown rate limit backend: {name}")
+
+def username_from_token(scope) -> str | None:
+    """Rate limit key: the `sub` of a valid bearer token, None for anonymous requests."""
+    for name, value in scope["headers"]:
+        if name == b"authorization":
+            token = value.decode("latin-1")
+            if not token.startswith("Bearer "):
+                return None
+            try:
+                payload = jwt.decode(token[7:], os.getenv("SECRET_KEY"), algorithms=[os.getenv("ALGORITHM")])
+            except JWTError:
+                return None
+            return payload.get("sub")
+    return None
+
+class RateLimitMiddleware:
+    """
+    ASGI middleware enforcing a token bucket per authenticated user on the
+    paths under `prefixes`. Requests without a valid token pass through and
+    are rejected by the route's own auth dependency. Backends marked
+    `blocking` are called from the thread pool, so waiting on a shared
+    store never stalls the event loop.
+    """
+
+    def __init__(self, app, backend=None, prefixes=("/accounts",), key_func=username_from_token):
+        self.app = app
+        self.backend = backend if backend is not None else make_backend()
+        self.prefixes = tuple(prefixes)
+        self.key_func = key_func
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not scope["path"].startswith(self.prefixes):
+            return await self.app(scope, receive, send)
+
+        key = self.key_func(scope)
+        if key is None:
+            return await self.app(scope, receive, send)
+
+        if getattr(self.backend, "blocking", True):
+            allowed, tokens = await run_in_threadpool(self.backend.hit, key)
+        else:
+            allowed, tokens = self.backend.hit(key)
+        if allowed:
+            return await self.app(scope, receive, send)
+
+        retry_after = self.backend.bucket.retry_after(tokens)
+        body = json.dumps({"detail": "Rate limit exceeded. Try again later."}).encode()
+        await send({
+            "type": "http.response.start",
+            "status": 429,
+            "headers": [
+                (b"content-type", b"application/json"),
+                (b"content-length", str(len(body)).encode()),
+                (b"retry-after", str(max(1, round(retry_after))).encode()),
+            ],
+        })
+        await send({"type": "http.response.body", "body": body})
@@ -1,11 +1,11 @@
-from fastapi import APIRouter, Depends, HTTPException, status, Request, Body
+from fastapi import APIRouter, Depends, HTTPException, status, Body
 from app.routes.auth import oauth2_scheme
 from jose import jwt, JWTError
 from sqlalchemy.orm import Session
 import os
 import logging
-import time
 
+from app import balances
 from app.database import SessionLocal
 from app.models import User, Transaction
 from fastapi.responses import JSONResponse
@@ -17,10 +17,6 @@ router = APIRouter(prefix="/accounts")
 SECRET_KEY = os.getenv("SECRET_KEY")
 ALGORITHM = os.getenv("ALGORITHM")
 
-rate_limit_store = {}
-RATE_LIMIT = 5  # max 5 requests
-RATE_PERIOD = 60  # per 60 seconds
-
 # --- Logging setup ---
 logger = logging.getLogger("banking_api")
 logger.setLevel(logging.INFO)
@@ -50,29 +46,6 @@ def get_db():
     finally:
         db.close()
 
-def check_rate_limit(username: str):
-    now = int(time.time())
-    window = now // RATE_PERIOD
-    key = f"{username}:{window}"
-    count = rate_limit_store.get(key, 0)
-    if count >= RATE_LIMIT:
-        raise HTTPException(status_code=429, detail="Rate limit exceeded. Try again later.")
-    rate_limit_store[key] = count + 1
-
-@router.middleware("http")
-async def rate_limit_middleware(request: Request, call_next):
-    token = request.headers.get("authorization", "").replace("Bearer ", "")
-    if token:
-        try:
-            payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-            username = payload.get("sub")
-            if username:
-                check_rate_limit(username)
-        except Exception:
-            pass
-    response = await call_next(request)
-    return response
-
 @router.get("/", dependencies=[Depends(get_current_user)])
 def get_accounts(db: Session = Depends(get_db), username: str = Depends(get_current_user)):
     user = db.query(User).filter(User.username == username).first()
@@ -86,10 +59,7 @@ def get_balance(db: Session = Depends(get_db), username: str = Depends(get_curre
     user = db.query(User).filter(User.username == username).first()
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
-    # Sum all transactions for this user
-    balance = db.query(Transaction).filter(Transaction.user_id == user.id).with_entities(Transaction.amount).all()
-    total = sum([t[0] for t in balance]) if balance else 0.0
-    return {"user_id": user.id, "balance": total}
+    return {"user_id": user.id, "balance": balances.get_balance(db, user.id)}
 
 @router.post("/transaction", dependencies=[Depends(get_current_user)])
 def create_transaction(
@@ -100,16 +70,12 @@ def create_transaction(
     user = db.query(User).filter(User.username == username).first()
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
-    # Check for sufficient balance if withdrawal
-    if tx_req.amount < 0:
-        balance = db.query(Transaction).filter(Transaction.user_id == user.id).with_entities(Transaction.amount).all()
-        total = sum([t[0] for t in balance]) if balance else 0.0
-        if total + tx_req.amount < 0:
-            raise HTTPException(status_code=400, detail="Insufficient funds")
-    tx = Transaction(user_id=user.id, amount=tx_req.amount)
-    db.add(tx)
+    # Balance check and update happen in one conditional UPDATE
+    tx = balances.post_transaction(db, user.id, tx_req.amount)
+    if tx is None:
+        db.rollback()
+        raise HTTPException(status_code=400, detail="Insufficient funds")
     db.commit()
-    db.refresh(tx)
     logger.info(f"User {username} initiated transaction: {tx_req.amount}")
     logger.info(f"Transaction {tx.id} completed for user {username}: {tx.amount}")
     return {"transaction_id": tx.id, "amount": tx.amount}
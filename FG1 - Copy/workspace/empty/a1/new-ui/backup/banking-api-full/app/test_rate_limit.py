@@ -0,0 +1,104 @@
+import asyncio
+import os
+import sqlite3
+import tempfile
+import threading
+
+from app.rate_limit import MemoryBackend, RateLimitMiddleware, SQLiteBackend, TokenBucket
+
+def run_bucket_tests():
+    bucket = TokenBucket(capacity=5, period=60)  # one token every 12s
+    for backend in (MemoryBackend(bucket), SQLiteBackend(bucket, os.path.join(tempfile.mkdtemp(), "rl.db"))):
+        results = [backend.hit("alice", now=1000)[0] for _ in range(6)]
+        assert results == [True] * 5 + [False]
+        assert backend.hit("bob", now=1000)[0]  # buckets are per key
+        assert not backend.hit("alice", now=1011)[0]
+        allowed, tokens = backend.hit("alice", now=1012.5)
+        assert allowed and tokens < 1
+        # Never refills past capacity, however long the key was idle
+        assert [backend.hit("alice", now=5000)[0] for _ in range(6)] == [True] * 5 + [False]
+    print("Token bucket: burst, refill and per-key state agree across backends")
+
+def run_expiry_tests():
+    bucket = TokenBucket(capacity=5, period=60)
+    memory = MemoryBackend(bucket, max_keys=3)
+    for i in range(10):
+        memory.hit(f"user{i}", now=1000 + i)
+    assert len(memory) == 3  # LRU bound
+    memory.hit("late", now=1100)
+    assert len(memory) == 1  # everything else idle for a full period
+
+    sqlite = SQLiteBackend(bucket, os.path.join(tempfile.mkdtemp(), "rl.db"), purge_every=5)
+    for i in range(4):
+        sqlite.hit(f"user{i}", now=1000)
+    assert len(sqlite) == 4
+    sqlite.hit("late", now=1100)  # fifth hit purges idle rows
+    assert len(sqlite) == 1
+    print("Expiry: idle keys dropped, memory store bounded by max_keys")
+
+def run_fail_open_tests():
+    path = os.path.join(tempfile.mkdtemp(), "rl.db")
+    backend = SQLiteBackend(TokenBucket(capacity=1, period=60), path, busy_timeout=0.01)
+    # Another worker holds the write lock
+    blocker = sqlite3.connect(path, isolation_level=None)
+    blocker.execute("BEGIN IMMEDIATE")
+    try:
+        assert backend.hit("alice") == (True, 0.0)
+        assert backend.hit("alice")[0] and backend.errors == 2
+    finally:
+        blocker.execute("ROLLBACK")
+        blocker.close()
+    assert backend.hit("alice")[0] and not backend.hit("alice")[0]
+    print("SQLite backend: fails open after busy_timeout")
+
+async def _request(app, path):
+    sent = []
+
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        sent.append(message)
+
+    await app({"type": "http", "path": path, "headers": []}, receive, send)
+    return sent[0]["status"], dict(sent[0].get("headers", []))
+
+def run_middleware_tests():
+    threads = []
+
+    async def inner(scope, receive, send):
+        await send({"type": "http.response.start", "status": 200, "headers": []})
+        await send({"type": "http.response.body", "body": b"ok"})
+
+    class RecordingBackend(SQLiteBackend):
+        def hit(self, key, now=None):
+            threads.append(threading.current_thread())
+            return super().hit(key, now)
+
+    async def main():
+        bucket = TokenBucket(capacity=2, period=60)
+        for backend in (MemoryBackend(bucket), RecordingBackend(bucket, os.path.join(tempfile.mkdtemp(), "rl.db"))):
+            app = RateLimitMiddleware(inner, backend=backend, key_func=lambda scope: "alice")
+            assert [(await _request(app, "/accounts/"))[0] for _ in range(2)] == [200, 200]
+            status, headers = await _request(app, "/accounts/balance")
+            assert status == 429
+            assert headers[b"content-type"] == b"application/json"
+            assert 1 <= int(headers[b"retry-after"]) <= 30
+            assert (await _request(app, "/"))[0] == 200  # outside the prefixes
+
+        anonymous = RateLimitMiddleware(inner, backend=MemoryBackend(TokenBucket(1, 60)), key_func=lambda scope: None)
+        assert [(await _request(anonymous, "/accounts/"))[0] for _ in range(3)] == [200] * 3
+
+    asyncio.run(main())
+    # The SQLite backend never ran on the event loop's thread
+    assert threads and threading.main_thread() not in threads
+    print("Middleware: 429 with Retry-After once the bucket is empty, SQLite hits off the event loop")
+
+def run_tests():
+    run_bucket_tests()
+    run_expiry_tests()
+    run_fail_open_tests()
+    run_middleware_tests()
+
+if __name__ == "__main__":
+    run_tests()
@@ -1,12 +1,19 @@
 import logging
-from fastapi import APIRouter, Request
+from fastapi import APIRouter, HTTPException, Request
 
 logger = logging.getLogger("banking_api")
 router = APIRouter(prefix="/webhooks")
 
+# Acknowledge-only: the signed, durable ingestion pipeline lives in
+# banking-api-phase3 (app/webhook_queue.py). This snapshot does not fork it.
 @router.post("/event")
 async def receive_webhook(request: Request):
-    data = await request.json()
-    logger.info(f"Received webhook: {data}")
-    print("Received webhook:", data)
+    try:
+        data = await request.json()
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Webhook body must be JSON")
+    if not isinstance(data, dict):
+        raise HTTPException(status_code=400, detail="Webhook body must be a JSON object")
+    # Ids only: payloads can carry account data
+    logger.info("Received webhook %s (%s)", data.get("id"), data.get("type"))
     return {"status": "received"}
@@ -0,0 +1,76 @@
+# Rate limiter overhead per request
+#
+# Times backend.hit() for the memory and SQLite backends over --keys
+# distinct users, then the full RateLimitMiddleware path (JWT decode +
+# hit) against a no-op ASGI app, compared with the bare app.
+#
+#   python bench_rate_limit.py --requests 50000 --keys 1000
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+
+os.environ.setdefault("SECRET_KEY", "bench-secret")
+os.environ.setdefault("ALGORITHM", "HS256")
+sys.path.append('.')
+
+from jose import jwt
+
+from app.rate_limit import MemoryBackend, SQLiteBackend, TokenBucket, RateLimitMiddleware
+
+def per_request_us(elapsed, requests):
+    return elapsed / requests * 1e6
+
+def bench_backend(label, backend, requests, keys):
+    start = time.perf_counter()
+    for i in range(requests):
+        backend.hit(f"user{i % keys}")
+    elapsed = time.perf_counter() - start
+    print(f"{label:<22} {per_request_us(elapsed, requests):>8.2f} us/hit   keys held={len(backend)}")
+
+async def noop_app(scope, receive, send):
+    await send({"type": "http.response.start", "status": 200, "headers": []})
+    await send({"type": "http.response.body", "body": b""})
+
+async def drive(app, requests, tokens):
+    async def receive():
+        return {"type": "http.request", "body": b""}
+
+    async def send(message):
+        pass
+
+    start = time.perf_counter()
+    for i in range(requests):
+        scope = {
+            "type": "http",
+            "path": "/accounts/balance",
+            "headers": [(b"authorization", tokens[i % len(tokens)])],
+        }
+        await app(scope, receive, send)
+    return time.perf_counter() - start
+
+def main():
+    parser = argparse.ArgumentParser(description="Rate limiter overhead")
+    parser.add_argument("--requests", type=int, default=50000)
+    parser.add_argument("--keys", type=int, default=1000)
+    args = parser.parse_args()
+
+    # Generous limit so every hit takes the allow path
+    bucket = TokenBucket(capacity=10 ** 9, period=60)
+    bench_backend("memory backend", MemoryBackend(bucket), args.requests, args.keys)
+    path = os.path.join(tempfile.mkdtemp(), "rate_limits.db")
+    bench_backend("sqlite backend", SQLiteBackend(bucket, path), args.requests, args.keys)
+
+    tokens = [
+        b"Bearer " + jwt.encode({"sub": f"user{i}"}, os.environ["SECRET_KEY"], algorithm=os.environ["ALGORITHM"]).encode()
+        for i in range(args.keys)
+    ]
+    bare = asyncio.run(drive(noop_app, args.requests, tokens))
+    for label, backend in (("memory", MemoryBackend(bucket)), ("sqlite", SQLiteBackend(bucket, path))):
+        wrapped = asyncio.run(drive(RateLimitMiddleware(noop_app, backend), args.requests, tokens))
+        print(f"middleware ({label:<6})    {per_request_us(wrapped - bare, args.requests):>8.2f} us/request over the bare app")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,52 @@
+# Reconcile materialized balances (account_balances) against the ledger
+#
+# Re-derives each user's balance from their latest snapshot plus newer
+# transactions (falling back to the full ledger on any mismatch), writes
+# fresh snapshots, and prints any drift. Creates the
+# balance tables if they do not exist yet; balance rows for existing users
+# are filled in lazily on first use.
+#
+#   python reconcile_balances.py                 # report only
+#   python reconcile_balances.py --fix           # also correct drifted balances
+#   python reconcile_balances.py --interval 3600 # run hourly
+import argparse
+import sys
+import time
+
+sys.path.append('.')
+
+from app.balances import reconcile
+from app.database import SessionLocal, engine
+from app.models import Base
+
+def run_once(batch_size, fix):
+    db = SessionLocal()
+    try:
+        started = time.perf_counter()
+        report = reconcile(db, batch_size=batch_size, fix=fix)
+    finally:
+        db.close()
+    print(f"Checked {report['checked']} balances, wrote {report['snapshots']} snapshots, "
+          f"re-derived {report['rederived']} from the full ledger, "
+          f"{len(report['drift'])} drifted ({time.perf_counter() - started:.2f}s)")
+    for item in report["drift"]:
+        note = " (fixed)" if fix else ""
+        print(f"  user {item['user_id']}: stored {item['stored']} vs ledger {item['derived']}{note}")
+    return report
+
+def main():
+    parser = argparse.ArgumentParser(description="Reconcile materialized balances with the ledger")
+    parser.add_argument("--batch-size", type=int, default=500)
+    parser.add_argument("--fix", action="store_true", help="overwrite drifted balances with the ledger value")
+    parser.add_argument("--interval", type=float, default=0, help="repeat every N seconds")
+    args = parser.parse_args()
+
+    Base.metadata.create_all(engine)
+    while True:
+        report = run_once(args.batch_size, args.fix)
+        if not args.interval:
+            sys.exit(1 if report["drift"] and not args.fix else 0)
+        time.sleep(args.interval)
+
+if __name__ == "__main__":
+    main()
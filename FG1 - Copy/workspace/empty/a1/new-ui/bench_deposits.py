@@ -0,0 +1,107 @@
+# Concurrency benchmark for deposit balance updates
+#
+# Compares the old ORM read-modify-write deposit with the atomic
+# UPDATE ... SET balance = balance + :amt path in app/balances.py, with N
+# workers hitting one hot account and with N workers spread across many
+# accounts.
+#
+#   python bench_deposits.py --workers 8 --deposits 200 --accounts 64
+import argparse
+import os
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from decimal import Decimal
+
+sys.path.append('.')
+
+from sqlalchemy import create_engine, func
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import sessionmaker
+
+from app import models
+from app.balances import deposit_to_account
+
+AMOUNT = Decimal("1.00")
+
+def legacy_deposit(db, account_id, amount):
+    # The old main.py deposit: load, add in Python, commit
+    account = db.query(models.Account).filter(models.Account.id == account_id).first()
+    account.balance += amount
+    db.add(models.Transaction(account_id=account.id, amount=amount, status="pending"))
+    db.commit()
+
+def atomic_deposit(db, account_id, amount):
+    deposit_to_account(db, account_id, amount)
+
+def setup(path, accounts):
+    engine = create_engine(
+        f"sqlite:///{path}",
+        connect_args={"check_same_thread": False, "timeout": 30},
+    )
+    models.Base.metadata.create_all(bind=engine)
+    Session = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+    db = Session()
+    ids = []
+    for _ in range(accounts):
+        user = models.User(name="bench")
+        db.add(user)
+        db.flush()
+        account = models.Account(user_id=user.id, balance=0)
+        db.add(account)
+        db.flush()
+        ids.append(account.id)
+    db.commit()
+    db.close()
+    return engine, Session, ids
+
+def run(label, fn, workers, deposits, accounts):
+    with tempfile.TemporaryDirectory() as tmp:
+        engine, Session, ids = setup(os.path.join(tmp, "bench.db"), accounts)
+        errors = []
+        lock = threading.Lock()
+
+        def worker(n):
+            db = Session()
+            try:
+                for i in range(deposits):
+                    account_id = ids[(n * deposits + i) % len(ids)]
+                    try:
+                        fn(db, account_id, AMOUNT)
+                    except OperationalError as e:
+                        db.rollback()
+                        with lock:
+                            errors.append(e)
+            finally:
+                db.close()
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            list(pool.map(worker, range(workers)))
+        elapsed = time.perf_counter() - start
+
+        db = Session()
+        total = db.query(func.sum(models.Account.balance)).scalar() or 0
+        db.close()
+        engine.dispose()
+
+    attempted = workers * deposits
+    print(f"{label:<32} {attempted / elapsed:>10.0f} deposits/s  "
+          f"balance={Decimal(total):>8} expected={attempted * AMOUNT:>8}  errors={len(errors)}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Deposit concurrency benchmark")
+    parser.add_argument("--workers", type=int, default=8)
+    parser.add_argument("--deposits", type=int, default=200, help="deposits per worker")
+    parser.add_argument("--accounts", type=int, default=64, help="accounts for the spread run")
+    args = parser.parse_args()
+
+    print(f"{args.workers} workers x {args.deposits} deposits")
+    for mode, accounts in (("hot", 1), ("spread", args.accounts)):
+        run(f"legacy read-modify-write/{mode}", legacy_deposit, args.workers, args.deposits, accounts)
+        run(f"atomic update/{mode}", atomic_deposit, args.workers, args.deposits, accounts)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+# Load test: /users/me/account latency while logins hammer the same worker
+#
+# Runs the app in-process on one event loop (like a single uvicorn worker),
+# starts --logins concurrent login loops against /token and probes
+# /users/me/account at a fixed rate, then reports p50/p99 probe latency.
+# Runs once with bcrypt inline on the event loop (the old behaviour) and
+# once with the bounded password-hashing pool.
+#
+#   python bench_login_latency.py --logins 16 --seconds 5
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.append('.')
+os.environ.setdefault("DATABASE_URL", "sqlite:///" + os.path.join(tempfile.mkdtemp(), "bench.db"))
+
+import httpx
+
+from app.auth import get_password_hash
+from app.database import SessionLocal
+from app.main import app
+from app.onboarding import onboard_user
+from app.passwords import hasher
+
+USERNAME = "bench-login"
+PASSWORD = "bench-password"
+
+def create_user():
+    db = SessionLocal()
+    onboard_user(db, USERNAME, username=USERNAME, hashed_password=get_password_hash(PASSWORD))
+    db.commit()
+    db.close()
+
+async def run(label, workers, logins, seconds, probe_interval):
+    hasher.shutdown()
+    hasher.workers = workers
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        response = await client.post("/token", data={"username": USERNAME, "password": PASSWORD})
+        headers = {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+        deadline = time.perf_counter() + seconds
+        login_count = 0
+        latencies = []
+
+        async def login_loop():
+            nonlocal login_count
+            while time.perf_counter() < deadline:
+                await client.post("/token", data={"username": USERNAME, "password": PASSWORD})
+                login_count += 1
+
+        async def probe_loop():
+            while time.perf_counter() < deadline:
+                start = time.perf_counter()
+                response = await client.get("/users/me/account", headers=headers)
+                latencies.append((time.perf_counter() - start) * 1000)
+                assert response.status_code == 200, response.text
+                await asyncio.sleep(probe_interval)
+
+        await asyncio.gather(probe_loop(), *[login_loop() for _ in range(logins)])
+
+    latencies.sort()
+    p99 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))]
+    print(f"{label:<18} logins/s={login_count / seconds:>6.1f}  probes={len(latencies):>5}  "
+          f"p50={statistics.median(latencies):>7.1f} ms  p99={p99:>7.1f} ms")
+
+def main():
+    parser = argparse.ArgumentParser(description="Login load vs. authenticated read latency")
+    parser.add_argument("--logins", type=int, default=16, help="concurrent login loops")
+    parser.add_argument("--seconds", type=float, default=5)
+    parser.add_argument("--probe-interval", type=float, default=0.01)
+    parser.add_argument("--workers", type=int, default=hasher.workers or 4)
+    args = parser.parse_args()
+
+    create_user()
+    asyncio.run(run("inline bcrypt", 0, args.logins, args.seconds, args.probe_interval))
+    asyncio.run(run(f"pool ({args.workers} thr)", args.workers, args.logins, args.seconds, args.probe_interval))
+    print("password pool:", hasher.stats())
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+# Throughput benchmark: dev vs production mode of pwa_http_server.py
+#
+# Starts each server on a free port against the same directory, then has
+# --clients threads fetch a mix of index.html and the hashed bundles. The
+# production run reuses one keep-alive connection per client and sends
+# Accept-Encoding: gzip, like a browser.
+#
+#   python bench_pwa_server.py --clients 16 --requests 200
+import argparse
+import http.client
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from pwa_http_server import make_server
+
+HTML = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'html')
+
+def bench(label, production, clients, requests, directory):
+    server = make_server(0, directory, production=production)
+    port = server.server_address[1]
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+
+    paths = ['/'] + ['/' + os.path.relpath(os.path.join(d, f), directory).replace(os.sep, '/')
+                     for d, _, files in os.walk(os.path.join(directory, 'assets')) for f in files]
+    headers = {'Accept-Encoding': 'gzip'}
+    sent = [0]
+    lock = threading.Lock()
+
+    def client(n):
+        conn = http.client.HTTPConnection('127.0.0.1', port, timeout=30)
+        received = 0
+        for i in range(requests):
+            conn.request('GET', paths[(n + i) % len(paths)], headers=headers)
+            response = conn.getresponse()
+            received += len(response.read())
+            if response.getheader('Connection', '').lower() == 'close' or response.version == 10:
+                conn.close()
+                conn = http.client.HTTPConnection('127.0.0.1', port, timeout=30)
+        conn.close()
+        with lock:
+            sent[0] += received
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=clients) as pool:
+        list(pool.map(client, range(clients)))
+    elapsed = time.perf_counter() - start
+    server.shutdown()
+    server.server_close()
+
+    total = clients * requests
+    return f"{label:<11} {total / elapsed:>8.0f} req/s  {sent[0] / elapsed / 1e6:>7.1f} MB/s on the wire"
+
+def main():
+    parser = argparse.ArgumentParser(description="PWA static server throughput")
+    parser.add_argument("--clients", type=int, default=16)
+    parser.add_argument("--requests", type=int, default=200, help="requests per client")
+    parser.add_argument("--directory", default=HTML)
+    args = parser.parse_args()
+
+    print(f"{args.clients} clients x {args.requests} requests")
+    # The dev server prints and logs every request; keep that off the console
+    stdout, stderr = sys.stdout, sys.stderr
+    with open(os.devnull, 'w') as devnull:
+        sys.stdout = sys.stderr = devnull
+        try:
+            dev = bench("dev", False, args.clients, args.requests, args.directory)
+        finally:
+            sys.stdout, sys.stderr = stdout, stderr
+    print(dev)
+    print(bench("production", True, args.clients, args.requests, args.directory))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+# Load benchmark for the SQLite connection profile
+#
+# Runs the same mixed read/write workload (account reads, transaction page
+# reads and atomic deposits) against a fresh file database with the
+# "default" and "production" profiles from config.Settings, and reports
+# throughput and "database is locked" errors for each.
+#
+#   python bench_sqlite_profile.py --workers 16 --ops 300 --write-ratio 0.2
+import argparse
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from decimal import Decimal
+
+sys.path.append('.')
+
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import sessionmaker
+
+from app import models
+from app.balances import deposit_to_account
+from app.config import Settings
+from app.database import build_engine
+from app.history import transaction_page
+from app.onboarding import bulk_onboard_users
+
+def run(profile, workers, ops, write_ratio, accounts):
+    with tempfile.TemporaryDirectory() as tmp:
+        config = Settings(
+            database_url=f"sqlite:///{os.path.join(tmp, 'bench.db')}",
+            sqlite_profile=profile,
+            db_pool_size=workers,
+        )
+        engine = build_engine(config)
+        models.Base.metadata.create_all(bind=engine)
+        Session = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+        db = Session()
+        bulk_onboard_users(db, [{"name": f"bench {i}"} for i in range(accounts)])
+        db.commit()
+        account_ids = [a for (a,) in db.query(models.Account.id)]
+        db.close()
+
+        counts = {"reads": 0, "writes": 0, "locked": 0}
+        lock = threading.Lock()
+
+        def worker(seed):
+            rng = random.Random(seed)
+            db = Session()
+            local = {"reads": 0, "writes": 0, "locked": 0}
+            try:
+                for _ in range(ops):
+                    account_id = rng.choice(account_ids)
+                    try:
+                        if rng.random() < write_ratio:
+                            deposit_to_account(db, account_id, Decimal("1.00"))
+                            local["writes"] += 1
+                        else:
+                            db.get(models.Account, account_id)
+                            transaction_page(db, account_id, limit=20)
+                            db.rollback()  # end the read transaction
+                            local["reads"] += 1
+                    except OperationalError:
+                        db.rollback()
+                        local["locked"] += 1
+            finally:
+                db.close()
+            with lock:
+                for key, value in local.items():
+                    counts[key] += value
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            list(pool.map(worker, range(workers)))
+        elapsed = time.perf_counter() - start
+        engine.dispose()
+
+    print(f"{profile:<11} {counts['reads'] / elapsed:>9.0f} reads/s {counts['writes'] / elapsed:>8.0f} writes/s"
+          f"  locked errors={counts['locked']}")
+
+def main():
+    parser = argparse.ArgumentParser(description="SQLite profile load benchmark")
+    parser.add_argument("--workers", type=int, default=16)
+    parser.add_argument("--ops", type=int, default=300, help="operations per worker")
+    parser.add_argument("--write-ratio", type=float, default=0.2)
+    parser.add_argument("--accounts", type=int, default=100)
+    args = parser.parse_args()
+
+    print(f"{args.workers} workers x {args.ops} ops, {args.write_ratio:.0%} writes")
+    for profile in ("default", "production"):
+        run(profile, args.workers, args.ops, args.write_ratio, args.accounts)
+
+if __name__ == "__main__":
+    main()
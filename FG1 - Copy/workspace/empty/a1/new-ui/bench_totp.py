@@ -0,0 +1,113 @@
+# TOTP verification throughput: cached per-user state vs building it per check
+#
+# Matches one code for each of --users users through app.totp.TotpVerifier
+# (drift window --window): first with an empty cache, then a step later
+# with every user's decoded secret cached, then wrong codes (every step in
+# the window tried). Then the replay guard: --claims guarded UPDATEs of
+# users.last_totp_step on a scratch SQLite database, and the same steps
+# again (all rejected).
+# For comparison, the same checks with a new pyotp.TOTP per call (as in
+# banking-api-eft's old verify_otp), if pyotp is installed, and with the
+# standard library decoding the secret and keying HMAC on every check.
+#
+#   python bench_totp.py --users 100000 --window 1
+import argparse
+import asyncio
+import base64
+import hashlib
+import hmac
+import os
+import struct
+import sys
+import tempfile
+import time
+
+sys.path.append('.')
+os.environ.setdefault("DATABASE_URL", "sqlite:///" + os.path.join(tempfile.mkdtemp(), "bench.db"))
+
+from app import models
+from app.database import AsyncSessionLocal, Base, engine
+from app.totp import TotpState, TotpVerifier, claim_step, generate_secret
+
+try:
+    import pyotp
+except ImportError:
+    pyotp = None
+
+def uncached_verify(secret, code, now, window):
+    key = base64.b32decode(secret)
+    step = int(now // 30)
+    for delta in range(-window, window + 1):
+        digest = hmac.new(key, struct.pack(">Q", step + delta), hashlib.sha1).digest()
+        offset = digest[-1] & 0x0F
+        value = struct.unpack(">I", digest[offset:offset + 4])[0] & 0x7FFFFFFF
+        if hmac.compare_digest(str(value % 10 ** 6).zfill(6), code):
+            return True
+    return False
+
+def timed(label, checks, fn):
+    start = time.perf_counter()
+    accepted = sum(1 for args in checks if fn(*args))
+    elapsed = time.perf_counter() - start
+    print(f"{label:<44} {len(checks) / elapsed:>12,.0f} checks/s  {elapsed / len(checks) * 1e6:6.1f} us/check"
+          f"  accepted {accepted:,}")
+    return accepted
+
+async def timed_claims(label, users, step):
+    start = time.perf_counter()
+    accepted = 0
+    async with AsyncSessionLocal() as db:
+        for user in users:
+            accepted += await claim_step(db, user, step)
+    elapsed = time.perf_counter() - start
+    print(f"{label:<44} {len(users) / elapsed:>12,.0f} checks/s  {elapsed / len(users) * 1e6:6.1f} us/check"
+          f"  accepted {accepted:,}")
+    return accepted
+
+async def bench_claims(count, step):
+    Base.metadata.create_all(bind=engine)
+    async with AsyncSessionLocal() as db:
+        users = [models.User(username=f"totp{i}", twofa_secret=generate_secret(), twofa_enabled=1)
+                 for i in range(count)]
+        db.add_all(users)
+        await db.commit()
+    assert await timed_claims("replay guard, new step (UPDATE + commit)", users, step) == count
+    assert await timed_claims("replay guard, replayed step", users, step) == 0
+
+def main():
+    parser = argparse.ArgumentParser(description="TOTP verification benchmark")
+    parser.add_argument("--users", type=int, default=100000)
+    parser.add_argument("--window", type=int, default=1)
+    parser.add_argument("--claims", type=int, default=2000)
+    args = parser.parse_args()
+
+    now = time.time()
+    step = int(now // 30)
+    secrets_ = [generate_secret() for _ in range(args.users)]
+    first = [TotpState(s).code(step) for s in secrets_]
+    second = [TotpState(s).code(step + 1) for s in secrets_]
+    wrong = [str((int(code) + 1) % 10 ** 6).zfill(6) for code in second]
+
+    verifier = TotpVerifier(cache_size=args.users, window=args.window)
+    print(f"{args.users:,} users, drift window ±{args.window} step(s)")
+    def matches(*check):
+        return verifier.match(*check) is not None
+
+    assert timed("TotpVerifier, cold cache", [(i, s, c, now) for i, (s, c) in enumerate(zip(secrets_, first))],
+                 matches) == args.users
+    later = now + 30
+    warm = [(i, s, c, later) for i, (s, c) in enumerate(zip(secrets_, second))]
+    assert timed("TotpVerifier, cached state", warm, matches) == args.users
+    timed("TotpVerifier, wrong codes", [(i, s, c, later) for i, (s, c) in enumerate(zip(secrets_, wrong))],
+          matches)
+
+    if pyotp is not None:
+        timed("pyotp.TOTP per check (no replay check)", [(s, c, later) for s, c in zip(secrets_, second)],
+              lambda s, c, t: pyotp.TOTP(s).verify(c, for_time=t, valid_window=args.window))
+    timed("stdlib, key per check (no replay check)", [(s, c, later) for s, c in zip(secrets_, second)],
+          lambda s, c, t: uncached_verify(s, c, t, args.window))
+    print("stats:", verifier.stats())
+    asyncio.run(bench_claims(args.claims, step))
+
+if __name__ == "__main__":
+    main()
@@ -15,6 +15,12 @@ try:
 except Exception as e:
     print('twofa_enabled:', e)
 
+try:
+    c.execute('ALTER TABLE users ADD COLUMN last_totp_step INTEGER;')
+    print('Added last_totp_step to users')
+except Exception as e:
+    print('last_totp_step:', e)
+
 conn.commit()
 conn.close()
 print('2FA migration complete.')
@@ -0,0 +1,55 @@
+import hashlib
+import sqlite3
+import sys
+
+# Persists accounts.routing_number / accounts.account_number, which used to be
+# computed from an MD5 on every access. Existing accounts are backfilled with
+# the same values the old properties returned, so numbers already shown to
+# customers do not change. Rows are updated in batches, one commit each, so
+# the writer lock is never held for long.
+
+def legacy_routing_number(user_id):
+    return hashlib.md5(f"routing_{user_id}".encode()).hexdigest()[:9]
+
+def legacy_account_number(account_id):
+    return hashlib.md5(f"account_{account_id}".encode()).hexdigest()[:12]
+
+def migrate(path='bank.db', batch_size=1000):
+    conn = sqlite3.connect(path)
+    c = conn.cursor()
+
+    for column in ('routing_number', 'account_number'):
+        try:
+            c.execute(f'ALTER TABLE accounts ADD COLUMN {column} TEXT;')
+            print(f'Added {column} to accounts')
+        except sqlite3.OperationalError as e:
+            print(f'{column}:', e)
+
+    backfilled = 0
+    while True:
+        rows = c.execute(
+            'SELECT id, user_id FROM accounts '
+            'WHERE routing_number IS NULL OR account_number IS NULL '
+            'ORDER BY id LIMIT ?',
+            (batch_size,),
+        ).fetchall()
+        if not rows:
+            break
+        c.executemany(
+            'UPDATE accounts SET routing_number = ?, account_number = ? WHERE id = ?',
+            [(legacy_routing_number(user_id), legacy_account_number(account_id), account_id)
+             for account_id, user_id in rows],
+        )
+        conn.commit()
+        backfilled += len(rows)
+        print(f'Backfilled {backfilled} accounts')
+
+    c.execute('CREATE INDEX IF NOT EXISTS ix_accounts_routing_number ON accounts (routing_number);')
+    c.execute('CREATE UNIQUE INDEX IF NOT EXISTS ix_accounts_account_number ON accounts (account_number);')
+    conn.commit()
+    conn.close()
+    print('Account number migration complete.')
+    return backfilled
+
+if __name__ == '__main__':
+    migrate(*sys.argv[1:2])
@@ -0,0 +1,29 @@
+import sqlite3
+
+# Adds the composite transaction indexes from models.Transaction to an
+# existing bank.db (new databases get them from create_all)
+conn = sqlite3.connect('bank.db')
+c = conn.cursor()
+
+indexes = {
+    'ix_transactions_account_timestamp':
+        'CREATE INDEX IF NOT EXISTS ix_transactions_account_timestamp '
+        'ON transactions (account_id, timestamp)',
+    'ix_transactions_account_type_timestamp':
+        'CREATE INDEX IF NOT EXISTS ix_transactions_account_type_timestamp '
+        'ON transactions (account_id, transfer_type, timestamp, amount)',
+}
+
+for name, sql in indexes.items():
+    try:
+        c.execute(sql)
+        print(f'Created {name}')
+    except Exception as e:
+        print(f'{name}:', e)
+
+# Refresh planner statistics so the new indexes are picked up
+c.execute('ANALYZE transactions;')
+
+conn.commit()
+conn.close()
+print('Index migration complete.')
@@ -1,38 +1,130 @@
 # Improved HTTP Server for PWA
+#
+#   python pwa_http_server.py                 # dev: one connection at a time, no-store everywhere
+#   python pwa_http_server.py --production    # threaded, cached, precompressed
+#   python pwa_http_server.py --production --access-log --port 8080
+import argparse
 import http.server
 import socketserver
 import os
 import sys
 
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from app.static_cache import StaticAssetCache
+
 PORT = 8080
-# Serve from the new React-based html/ folder at the project root
-DIRECTORY = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'html')
+# Serve the React build in html/ next to this file (main.py's HTML_DIR)
+DIRECTORY = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'html')
 
 class PWAHTTPRequestHandler(http.server.SimpleHTTPRequestHandler):
+    directory = DIRECTORY
+
     def __init__(self, *args, **kwargs):
-        super().__init__(*args, directory=DIRECTORY, **kwargs)
+        super().__init__(*args, directory=self.directory, **kwargs)
 
     def end_headers(self):
         self.send_header('Access-Control-Allow-Origin', '*')
         self.send_header('Access-Control-Allow-Methods', 'GET')
         self.send_header('Cache-Control', 'no-store, no-cache, must-revalidate')
-        super().end_headers()    
+        super().end_headers()
     def do_GET(self):
         # Print for debugging
         print(f"Request path: {self.path}")
         # Always serve service worker and manifest from root
         if self.path == '/sw.js':
             self.path = '/sw.js'
-            print(f"Serving service worker from: {os.path.join(DIRECTORY, 'sw.js')}")
+            print(f"Serving service worker from: {os.path.join(self.directory, 'sw.js')}")
         elif self.path == '/manifest.json':
             self.path = '/manifest.json'
-            print(f"Serving manifest from: {os.path.join(DIRECTORY, 'manifest.json')}")
+            print(f"Serving manifest from: {os.path.join(self.directory, 'manifest.json')}")
         elif self.path == '/offline.html':
             self.path = '/offline.html'
         elif self.path == '/':
             self.path = '/index.html'
         return super().do_GET()
 
-with socketserver.TCPServer(("", PORT), PWAHTTPRequestHandler) as httpd:
-    print(f"Serving PWA at port {PORT} from directory: {DIRECTORY}")
-    httpd.serve_forever()
+class ProductionPWAHandler(http.server.SimpleHTTPRequestHandler):
+    """
+    Serves the PWA from an in-memory StaticAssetCache: per-path cache policy
+    (no-store only for index.html, sw.js and manifest.json, immutable for
+    fingerprinted bundles), gzip/brotli negotiation, ETag/Last-Modified
+    revalidation and HTTP/1.1 keep-alive. Files the cache does not hold
+    are served from disk.
+    """
+    protocol_version = "HTTP/1.1"
+    # Headers and body go out in separate writes; without this keep-alive
+    # connections stall on delayed ACKs
+    disable_nagle_algorithm = True
+    directory = DIRECTORY
+    assets = None
+    access_log = False
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, directory=self.directory, **kwargs)
+
+    def _serve(self, head):
+        path = self.path.split('?', 1)[0]
+        asset = self.assets.lookup(path)
+        if asset is None:
+            self._cache_control = self.assets.cache_control(path)
+            return super().do_HEAD() if head else super().do_GET()
+
+        status, headers, body = self.assets.respond(asset, {k.lower(): v for k, v in self.headers.items()}, head=head)
+        self.send_response(status)
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self._cache_control = None
+        self.end_headers()
+        if body:
+            self.wfile.write(body)
+
+    def do_GET(self):
+        self._serve(head=False)
+
+    def do_HEAD(self):
+        self._serve(head=True)
+
+    def end_headers(self):
+        self.send_header('Access-Control-Allow-Origin', '*')
+        self.send_header('Access-Control-Allow-Methods', 'GET')
+        if getattr(self, '_cache_control', None):
+            self.send_header('Cache-Control', self._cache_control)
+        super().end_headers()
+
+    def log_message(self, format, *args):
+        if self.access_log:
+            super().log_message(format, *args)
+
+class ThreadingPWAServer(http.server.ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 128
+
+def make_server(port=PORT, directory=DIRECTORY, production=False, access_log=False):
+    if not production:
+        handler = type('Handler', (PWAHTTPRequestHandler,), {'directory': directory})
+        return socketserver.TCPServer(("", port), handler)
+
+    assets = StaticAssetCache(directory, entry_cache_control="no-store").load()
+    handler = type('Handler', (ProductionPWAHandler,), {
+        'directory': directory,
+        'assets': assets,
+        'access_log': access_log,
+    })
+    return ThreadingPWAServer(("", port), handler)
+
+def main():
+    parser = argparse.ArgumentParser(description="Static server for the PWA build")
+    parser.add_argument("--port", type=int, default=PORT)
+    parser.add_argument("--directory", default=DIRECTORY)
+    parser.add_argument("--production", action="store_true", help="threaded server with caching and compression")
+    parser.add_argument("--access-log", action="store_true", help="log every request (production mode)")
+    args = parser.parse_args()
+
+    with make_server(args.port, args.directory, args.production, args.access_log) as httpd:
+        mode = "production" if args.production else "dev"
+        print(f"Serving PWA ({mode}) at port {args.port} from directory: {args.directory}")
+        httpd.serve_forever()
+
+if __name__ == "__main__":
+    main()